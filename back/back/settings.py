@@ -146,6 +146,38 @@ DATABASES = {
 }
 
 
+# Cache
+# LocMemCache par défaut (un cache par processus). En production avec plusieurs
+# workers gunicorn, pointer CACHE_BACKEND/CACHE_LOCATION vers un cache partagé
+# (Redis, Memcached) pour que les versions du catalogue soient communes.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'flashxship'),
+    }
+}
+
+# Durée de vie des réponses du catalogue en cache (invalidées par version à chaque modification)
+CATALOG_CACHE_TIMEOUT = 60 * 60
+
+# Stockage des paniers : dans le cache s'il est partagé entre les workers, sinon en base
+CART_STORE = os.environ.get(
+    'CART_STORE',
+    'vente.cart.CacheCartStore' if os.environ.get('CACHE_BACKEND') else 'vente.cart.DatabaseCartStore',
+)
+# Un panier non modifié pendant 14 jours expire
+CART_TIMEOUT = 60 * 60 * 24 * 14
+
+# Fenêtre pendant laquelle un nouvel essai avec le même Idempotency-Key reçoit la réponse enregistrée
+IDEMPOTENCY_KEY_TTL = 60 * 60 * 24
+
+# Le stock d'une commande non payée reste réservé 30 minutes (prolongé pendant la session Stripe),
+# puis la commande release_expired_holds l'annule et rend le stock
+STOCK_HOLD_TIMEOUT = 60 * 30
+# Au plus 2 heures de réservation par commande, même si le client relance le paiement
+STOCK_HOLD_MAX_DURATION = 60 * 60 * 2
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -199,6 +231,12 @@ CLOUDINARY_STORAGE = {
     'API_SECRET': 'Av5GWQiHKB7vvNzAu-Gc946c1ko',
 }
 
+# Déclinaisons d'images (miniatures WebP/JPEG) générées en arrière-plan après l'upload
+IMAGE_DERIVATIVES_ASYNC = True
+IMAGE_DERIVATIVE_WORKERS = 2
+# Envois simultanés vers le stockage lors de l'ajout d'images à un article
+IMAGE_UPLOAD_WORKERS = 4
+
 # Stripe Configuration
 STRIPE_SECRET_KEY = "sk_test_51QyFvJITZNLvxKirz8scuDKdsB7r4Jk0QKDZHLvSVuMLHA9eLvBDmUR5xaLHtdShWnONBgF7fNhghoBLQo3V4GsR00hCyt3iEw"
 STRIPE_PUBLIC_KEY = "pk_test_51QyFvJITZNLvxKira0vz3UuTdu4fYW6qci1k9I1pnfOWOXwAkKWNZGGHPz8LuNkJmtLEzK811tBgbwZBCq3v1UIG0001WUesWt"
@@ -260,6 +298,7 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'idempotency-key',
 ]
 
 CSRF_TRUSTED_ORIGINS = [
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class VenteConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'vente'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,111 @@
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+
+from .conditional import conditional_response
+
+
+# Dépendances de chaque point d'accès du catalogue
+PRODUCT_DEPENDENCIES = ('product', 'product_category', 'image')
+EQUIPMENT_DEPENDENCIES = ('equipment', 'equipment_category', 'image')
+PRODUCT_CATEGORY_DEPENDENCIES = ('product_category',)
+EQUIPMENT_CATEGORY_DEPENDENCIES = ('equipment_category',)
+REVIEW_DEPENDENCIES = ('review',)
+PRODUCT_FACET_DEPENDENCIES = ('product', 'product_category')
+EQUIPMENT_FACET_DEPENDENCIES = ('equipment', 'equipment_category')
+
+
+def version_key(name):
+    return f'catalog_version:{name}'
+
+
+def modified_key(name):
+    return f'catalog_modified:{name}'
+
+
+def get_catalog_state(names):
+    """
+    Lire les versions et la date de dernière modification du catalogue
+    en un seul aller-retour vers le cache.
+    """
+    keys = [version_key(name) for name in names] + [modified_key(name) for name in names]
+    values = cache.get_many(keys)
+    now = time.time()
+    for name in names:
+        if version_key(name) not in values:
+            # Valeur initiale horodatée : une clé évincée ne réutilise jamais une ancienne version
+            cache.add(version_key(name), int(now * 1000), timeout=None)
+            values[version_key(name)] = cache.get(version_key(name))
+        if modified_key(name) not in values:
+            cache.add(modified_key(name), int(now), timeout=None)
+            values[modified_key(name)] = cache.get(modified_key(name))
+    versions = [values[version_key(name)] for name in names]
+    last_modified = max(values[modified_key(name)] for name in names)
+    return versions, last_modified
+
+
+def bump_catalog_version(*names):
+    """Invalider toutes les réponses qui dépendent des modèles donnés"""
+    now = time.time()
+    for name in names:
+        key = version_key(name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, int(now * 1000), timeout=None)
+        cache.set(modified_key(name), int(now), timeout=None)
+
+
+def get_cache_key(request, namespace, versions):
+    query = urlencode(sorted(request.query_params.lists()), doseq=True)
+    # L'hôte fait partie de la clé car les URLs d'images sont absolues
+    raw = f'{request.scheme}://{request.get_host()}{request.path}?{query}'
+    digest = hashlib.sha1(raw.encode()).hexdigest()
+    return f"catalog:{namespace}:{'.'.join(str(v) for v in versions)}:{digest}"
+
+
+def cached_response(request, namespace, dependencies, build_response):
+    """
+    Servir une réponse GET depuis le cache, ou la construire et la mettre en cache.
+
+    Le JSON rendu est stocké tel quel : un succès de cache ne fait ni requête SQL
+    ni sérialisation DRF. La clé de cache sert aussi d'ETag, ce qui permet de
+    répondre 304 sans même lire la réponse en cache.
+    """
+    if request.method != 'GET':
+        return build_response()
+
+    versions, last_modified = get_catalog_state(dependencies)
+    key = get_cache_key(request, namespace, versions)
+
+    def build_cached_response():
+        content = cache.get(key)
+        if content is not None:
+            return HttpResponse(content, content_type='application/json')
+
+        response = build_response()
+        if response.status_code == 200:
+            content = JSONRenderer().render(response.data)
+            cache.set(key, content, getattr(settings, 'CATALOG_CACHE_TIMEOUT', 60 * 60))
+        return response
+
+    return conditional_response(request, key, last_modified, build_cached_response)
+
+
+class CatalogCacheMixin:
+    """Mettre en cache les actions list/retrieve d'un ViewSet du catalogue"""
+    cache_namespace = None
+    cache_dependencies = ()
+
+    def list(self, request, *args, **kwargs):
+        return cached_response(request, self.cache_namespace, self.cache_dependencies,
+                               lambda: super(CatalogCacheMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return cached_response(request, self.cache_namespace, self.cache_dependencies,
+                               lambda: super(CatalogCacheMixin, self).retrieve(request, *args, **kwargs))
@@ -0,0 +1,354 @@
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .models import Product, Equipment, CartItem
+from .serializers import ProductSerializer, EquipmentSerializer
+
+
+# Durée de vie d'un panier sans modification
+DEFAULT_CART_TIMEOUT = 60 * 60 * 24 * 14
+
+
+class CartBusy(APIException):
+    """Le verrou du panier n'a pas pu être obtenu : le client doit réessayer"""
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'Panier en cours de modification, réessayez'
+    default_code = 'cart_busy'
+
+
+class CartStore:
+    """
+    Stockage des paniers, indépendant de la session Django.
+
+    Un panier est un dict {identifiant: {'type', 'quantity', 'days'}} rattaché à
+    un propriétaire (« user:<id> » ou « session:<clé> ») et expire après
+    CART_TIMEOUT secondes sans modification.
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout or getattr(settings, 'CART_TIMEOUT', DEFAULT_CART_TIMEOUT)
+
+    def get(self, owner):
+        raise NotImplementedError
+
+    def set_items(self, owner, items):
+        """Ajouter ou remplacer des lignes {identifiant: données} sans toucher aux autres"""
+        raise NotImplementedError
+
+    def remove_items(self, owner, item_ids):
+        raise NotImplementedError
+
+    def clear(self, owner):
+        raise NotImplementedError
+
+    def set_item(self, owner, item_id, item_data):
+        self.set_items(owner, {str(item_id): item_data})
+
+    def merge(self, source, target):
+        """Fusionner le panier `source` dans `target` puis vider `source`"""
+        incoming = self.get(source)
+        if not incoming:
+            return self.get(target)
+        merged = self.get(target)
+        changed = {}
+        for item_id, item_data in incoming.items():
+            if item_id in merged:
+                # Si l'item existe déjà, additionner les quantités
+                current = dict(merged[item_id])
+                current['quantity'] += item_data['quantity']
+                if 'days' in item_data:
+                    current['days'] = max(current.get('days', 1), item_data['days'])
+                changed[item_id] = current
+            else:
+                changed[item_id] = item_data
+        self.set_items(target, changed)
+        self.clear(source)
+        merged.update(changed)
+        return merged
+
+
+class CacheCartStore(CartStore):
+    """
+    Paniers dans le cache Django, une clé par panier, TTL renouvelé à chaque écriture.
+
+    Les modifications passent par un verrou court posé avec cache.add (atomique
+    sur Redis / Memcached) : deux ajouts simultanés ne s'écrasent pas.
+    """
+    lock_timeout = 5
+    lock_attempts = 50
+
+    def key(self, owner):
+        return f'cart:{owner}'
+
+    def get(self, owner):
+        return cache.get(self.key(owner)) or {}
+
+    def update(self, owner, change):
+        key = self.key(owner)
+        lock = f'{key}:lock'
+        # Jeton propre à cet appel : on ne libère jamais le verrou d'un autre écrivain
+        token = uuid.uuid4().hex
+        for attempt in range(self.lock_attempts):
+            if cache.add(lock, token, self.lock_timeout):
+                break
+            time.sleep(0.01)
+        else:
+            # Verrou introuvable au bout de ~0,5 s : écrire sans lui écraserait l'autre modification
+            raise CartBusy()
+        try:
+            cart = cache.get(key) or {}
+            change(cart)
+            if cart:
+                cache.set(key, cart, self.timeout)
+            else:
+                cache.delete(key)
+        finally:
+            # Si le verrou a expiré pendant l'écriture, il appartient peut-être déjà à un autre appel
+            if cache.get(lock) == token:
+                cache.delete(lock)
+
+    def set_items(self, owner, items):
+        self.update(owner, lambda cart: cart.update(items))
+
+    def remove_items(self, owner, item_ids):
+        def remove(cart):
+            for item_id in item_ids:
+                cart.pop(str(item_id), None)
+        self.update(owner, remove)
+
+    def clear(self, owner):
+        cache.delete(self.key(owner))
+
+
+class DatabaseCartStore(CartStore):
+    """
+    Paniers dans la table CartItem : une ligne par article, écrite par un upsert.
+
+    Utilisé quand aucun cache partagé n'est configuré. Les lignes expirées sont
+    ignorées à la lecture et supprimées par la commande clear_expired_carts.
+    """
+
+    def expires_at(self):
+        return timezone.now() + timedelta(seconds=self.timeout)
+
+    def get(self, owner):
+        rows = CartItem.objects.filter(owner=owner, expires_at__gt=timezone.now()).order_by('id')
+        return {
+            row.item_id: {'type': row.item_type, 'quantity': row.quantity, 'days': row.days}
+            for row in rows
+        }
+
+    def set_items(self, owner, items):
+        if not items:
+            return
+        expires_at = self.expires_at()
+        with transaction.atomic():
+            self.upsert(owner, items, expires_at)
+            # Le panier entier reste valable tant qu'une ligne est modifiée
+            CartItem.objects.filter(owner=owner).update(expires_at=expires_at)
+
+    def upsert(self, owner, items, expires_at):
+        CartItem.objects.bulk_create(
+            [
+                CartItem(owner=owner, item_id=str(item_id), item_type=data['type'],
+                         quantity=data['quantity'], days=data.get('days', 0), expires_at=expires_at)
+                for item_id, data in items.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['owner', 'item_id'],
+            update_fields=['item_type', 'quantity', 'days', 'expires_at'],
+        )
+
+    def remove_items(self, owner, item_ids):
+        CartItem.objects.filter(owner=owner, item_id__in=[str(item_id) for item_id in item_ids]).delete()
+
+    def clear(self, owner):
+        CartItem.objects.filter(owner=owner).delete()
+
+
+def get_cart_store():
+    return import_string(getattr(settings, 'CART_STORE', 'vente.cart.DatabaseCartStore'))()
+
+
+def get_cart_owner(request, create=False):
+    """Propriétaire du panier : l'utilisateur connecté, sinon la session (créée si besoin)"""
+    if request.user.is_authenticated:
+        return f'user:{request.user.id}'
+    return get_session_owner(request, create)
+
+
+def get_session_owner(request, create=False):
+    if not request.session.session_key:
+        if not create:
+            return None
+        request.session.create()
+        # Pour que le middleware envoie le cookie de session
+        request.session.modified = True
+    return f'session:{request.session.session_key}'
+
+
+def to_id(item_id):
+    try:
+        return int(item_id)
+    except (TypeError, ValueError):
+        return None
+
+
+def load_cart_items(cart):
+    """
+    Charger tous les articles du panier en deux in_bulk (images et catégories préchargées).
+
+    Retourne {'product': {id: Product}, 'equipment': {id: Equipment}}.
+    """
+    ids = {'product': [], 'equipment': []}
+    for item_id, item_data in cart.items():
+        pk = to_id(item_id)
+        if pk is not None:
+            ids[get_kind(item_data)].append(pk)
+
+    loaded = {}
+    for kind, model in (('product', Product), ('equipment', Equipment)):
+        loaded[kind] = (
+            model.objects.select_related('category').prefetch_related('images').in_bulk(ids[kind])
+            if ids[kind] else {}
+        )
+    return loaded
+
+
+# type -> (modèle, champ du prix unitaire)
+PRICE_FIELDS = {
+    'product': (Product, 'price'),
+    'equipment': (Equipment, 'rental_price_per_day'),
+}
+
+
+def get_kind(item_data):
+    return 'product' if item_data.get('type') == 'product' else 'equipment'
+
+
+def line_total(unit_price, item_data):
+    if get_kind(item_data) == 'product':
+        return unit_price * item_data['quantity']
+    return unit_price * item_data['quantity'] * item_data.get('days', 1)
+
+
+def load_prices(cart):
+    """Prix unitaires des articles du panier, sans sérialisation : une requête par type présent"""
+    ids = {kind: [] for kind in PRICE_FIELDS}
+    for item_id, item_data in cart.items():
+        pk = to_id(item_id)
+        if pk is not None:
+            ids[get_kind(item_data)].append(pk)
+    return {
+        kind: dict(model.objects.filter(id__in=ids[kind]).values_list('id', field)) if ids[kind] else {}
+        for kind, (model, field) in PRICE_FIELDS.items()
+    }
+
+
+def cart_line(item_id, item_data, prices):
+    """Ligne de panier compacte (sans l'article sérialisé), None si l'article n'existe plus"""
+    unit_price = prices[get_kind(item_data)].get(to_id(item_id))
+    if unit_price is None:
+        return None
+    line = {
+        'item_id': str(item_id),
+        'type': get_kind(item_data),
+        'quantity': item_data['quantity'],
+        'unit_price': unit_price,
+        'total': line_total(unit_price, item_data),
+    }
+    if line['type'] == 'equipment':
+        line['days'] = item_data.get('days', 1)
+    return line
+
+
+def cart_total(cart, prices):
+    total = 0
+    for item_id, item_data in cart.items():
+        unit_price = prices[get_kind(item_data)].get(to_id(item_id))
+        if unit_price is not None:
+            total += line_total(unit_price, item_data)
+    return total
+
+
+def apply_cart_operations(cart, operations):
+    """
+    Appliquer des opérations validées (CartOperationSerializer) à une copie du panier.
+
+    Retourne (panier modifié, lignes modifiées {identifiant: données},
+    identifiants retirés, erreurs {index: message}).
+    """
+    cart = dict(cart)
+    changed, removed, errors = {}, [], {}
+    for index, operation in enumerate(operations):
+        item_id = str(operation['item_id'])
+        if operation['op'] == 'remove':
+            if cart.pop(item_id, None) is not None:
+                removed.append(item_id)
+                changed.pop(item_id, None)
+            continue
+
+        if operation['op'] == 'set':
+            is_product = operation['item_type'] == 'product'
+            item_data = {
+                'type': operation['item_type'],
+                'quantity': operation.get('quantity', 1),
+                'days': 0 if is_product else operation.get('days', 1),
+            }
+        elif item_id not in cart:
+            errors[index] = "Article absent du panier"
+            continue
+        else:
+            item_data = dict(cart[item_id])
+            if 'quantity' in operation:
+                item_data['quantity'] = operation['quantity']
+            if 'days' in operation and get_kind(item_data) == 'equipment':
+                item_data['days'] = operation['days']
+
+        cart[item_id] = changed[item_id] = item_data
+        if item_id in removed:
+            removed.remove(item_id)
+    return cart, changed, removed, errors
+
+
+def price_cart(cart, context=None):
+    """
+    Calculer les lignes et le total du panier en un seul passage.
+
+    Retourne (lignes, total, identifiants des articles qui n'existent plus).
+    """
+    context = context or {}
+    loaded = load_cart_items(cart)
+    items, total, missing = [], 0, []
+    for item_id, item_data in cart.items():
+        is_product = get_kind(item_data) == 'product'
+        item = loaded['product' if is_product else 'equipment'].get(to_id(item_id))
+        if item is None:
+            missing.append(item_id)
+            continue
+
+        item_total = line_total(item.price if is_product else item.rental_price_per_day, item_data)
+        total += item_total
+        if is_product:
+            items.append({
+                'item': ProductSerializer(item, context=context).data,
+                'quantity': item_data['quantity'],
+                'total': item_total,
+            })
+        else:
+            items.append({
+                'item': EquipmentSerializer(item, context=context).data,
+                'quantity': item_data['quantity'],
+                'days': item_data.get('days', 1),
+                'total': item_total,
+            })
+    return items, total, missing
@@ -0,0 +1,136 @@
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+
+from .models import Product, Equipment, ProductCategory, EquipmentCategory
+
+
+# Précision des prix importés : DecimalField(max_digits=10, decimal_places=2)
+PRICE_MAX_DIGITS = 10
+PRICE_DECIMAL_PLACES = 2
+
+
+def parse_decimal(value):
+    try:
+        result = Decimal(str(value).strip())
+    except (InvalidOperation, TypeError):
+        raise ValueError(f'nombre invalide : {value!r}')
+    # NaN et Infinity ne sont pas comparables : on les refuse avant tout test
+    if not result.is_finite():
+        raise ValueError(f'nombre invalide : {value!r}')
+    if result < 0:
+        raise ValueError(f'valeur négative : {value!r}')
+    if result and result.adjusted() >= PRICE_MAX_DIGITS - PRICE_DECIMAL_PLACES:
+        raise ValueError(f'valeur trop grande : {value!r}')
+    quantized = result.quantize(Decimal(1).scaleb(-PRICE_DECIMAL_PLACES))
+    if quantized != result:
+        raise ValueError(f'plus de {PRICE_DECIMAL_PLACES} décimales : {value!r}')
+    return quantized
+
+
+def parse_positive_int(value):
+    try:
+        result = int(str(value).strip() or 0)
+    except (TypeError, ValueError):
+        raise ValueError(f'entier invalide : {value!r}')
+    if result < 0:
+        raise ValueError(f'valeur négative : {value!r}')
+    return result
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    value = str(value).strip().lower()
+    if value in ('1', 'true', 'yes', 'oui', 'on'):
+        return True
+    if value in ('', '0', 'false', 'no', 'non', 'off'):
+        return False
+    raise ValueError(f'booléen invalide : {value!r}')
+
+
+# Description des colonnes importées / exportées pour chaque modèle
+CATALOG_SPECS = {
+    'product': {
+        'model': Product,
+        'category_model': ProductCategory,
+        'cache_names': ('product', 'product_category'),
+        'fields': {
+            'name': str,
+            'description': str,
+            'price': parse_decimal,
+            'stock': parse_positive_int,
+        },
+    },
+    'equipment': {
+        'model': Equipment,
+        'category_model': EquipmentCategory,
+        'cache_names': ('equipment', 'equipment_category'),
+        'fields': {
+            'name': str,
+            'description': str,
+            'rental_price_per_day': parse_decimal,
+            'available': parse_bool,
+        },
+    },
+}
+
+
+def get_columns(spec):
+    return ['id', *spec['fields'], 'category']
+
+
+def detect_format(path, requested=None):
+    if requested:
+        return requested
+    if path.endswith('.ndjson') or path.endswith('.jsonl'):
+        return 'ndjson'
+    return 'csv'
+
+
+def read_rows(stream, fmt, on_error=None):
+    """
+    Lire un fichier ligne à ligne : (numéro de ligne, dict) sans tout charger en mémoire.
+
+    Une ligne NDJSON qui n'est pas un objet JSON est passée à
+    on_error(numéro de ligne, message) puis ignorée ; sans on_error, ValueError est levée.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                message = f'JSON invalide : {e}'
+            else:
+                if isinstance(row, dict):
+                    yield line_number, row
+                    continue
+                message = f'objet JSON attendu, reçu {type(row).__name__}'
+            if on_error is None:
+                raise ValueError(f'ligne {line_number} : {message}')
+            on_error(line_number, message)
+
+
+class RowWriter:
+    """Écrire des lignes en CSV ou NDJSON au fil de l'eau"""
+
+    def __init__(self, stream, fmt, columns):
+        self.stream = stream
+        self.fmt = fmt
+        self.columns = columns
+        if fmt == 'csv':
+            self.writer = csv.writer(stream)
+            self.writer.writerow(columns)
+
+    def write(self, values):
+        if self.fmt == 'csv':
+            self.writer.writerow(['' if value is None else value for value in values])
+        else:
+            row = dict(zip(self.columns, values))
+            self.stream.write(json.dumps(row, ensure_ascii=False, default=str) + '\n')
@@ -0,0 +1,34 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(state):
+    """ETag fort calculé à partir d'un état (versions, horodatages), pas du contenu rendu"""
+    return quote_etag(hashlib.sha1(state.encode()).hexdigest())
+
+
+def conditional_response(request, state, last_modified, build_response, private=False):
+    """
+    Répondre 304 Not Modified sans sérialiser quand le client a déjà la version courante.
+
+    `state` décrit la version des données servies et `last_modified` est un
+    timestamp en secondes (ou None). Les en-têtes ETag / Last-Modified sont
+    ajoutés aux réponses 200.
+    """
+    etag = make_etag(state)
+    if request.method in ('GET', 'HEAD'):
+        not_modified = get_conditional_response(request._request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            not_modified['ETag'] = etag
+            return not_modified
+
+    response = build_response()
+    if response.status_code == 200:
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        # Le navigateur revalide à chaque navigation au lieu de servir une copie périmée
+        patch_cache_control(response, no_cache=True, private=private, public=not private)
+    return response
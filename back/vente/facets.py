@@ -0,0 +1,120 @@
+from decimal import Decimal
+
+from django.db.models import Count, Max, Min, Q
+from rest_framework.exceptions import ValidationError
+
+from .filters import parse_bool, parse_decimal, parse_int
+
+
+DEFAULT_BUCKETS = 5
+MAX_BUCKETS = 20
+CENTS = Decimal('0.01')
+
+
+def nice_step(span, buckets):
+    """Largeur de tranche arrondie à 1, 2 ou 5 × 10^n, au moins span / buckets"""
+    raw = span / buckets
+    magnitude = Decimal(1).scaleb(raw.adjusted())
+    for factor in (1, 2, 5, 10):
+        step = magnitude * factor
+        if step >= raw:
+            return step
+    return magnitude * 10
+
+
+def get_price_edges(low, high, buckets):
+    """Bornes des tranches de prix couvrant [low, high]"""
+    if low is None:
+        return []
+    if low == high:
+        return [(low.quantize(CENTS), high.quantize(CENTS))]
+    step = nice_step(high - low, buckets)
+    start = (low / step).to_integral_value(rounding='ROUND_FLOOR') * step
+    edges = []
+    while start < high:
+        edges.append((start.quantize(CENTS), (start + step).quantize(CENTS)))
+        start += step
+    return edges
+
+
+def count_where(condition):
+    # Q() vide : simple COUNT sans clause FILTER
+    return Count('id', filter=condition or None)
+
+
+def compute_facets(queryset, params, price_field, available_filter):
+    """
+    Calculer les facettes du catalogue pour les filtres courants en deux requêtes :
+    les bornes de prix (MIN/MAX), puis un seul GROUP BY catégorie avec des
+    comptages conditionnels.
+
+    Chaque facette ignore son propre filtre (les comptes par catégorie
+    n'appliquent pas `category`, l'histogramme n'applique pas les bornes de
+    prix) pour que la barre latérale montre les autres choix possibles.
+    """
+    category = parse_int(params, 'category')
+    min_price = parse_decimal(params, 'min_price')
+    max_price = parse_decimal(params, 'max_price')
+    available = parse_bool(params, 'available')
+    buckets = parse_int(params, 'buckets')
+    if buckets is None:
+        buckets = DEFAULT_BUCKETS
+    if not 1 <= buckets <= MAX_BUCKETS:
+        raise ValidationError({'buckets': f'Doit être compris entre 1 et {MAX_BUCKETS}'})
+
+    in_stock = Q(**available_filter)
+    availability = Q()
+    if available is True:
+        availability = in_stock
+    elif available is False:
+        availability = ~in_stock
+    price_range = Q()
+    if min_price is not None:
+        price_range &= Q(**{f'{price_field}__gte': min_price})
+    if max_price is not None:
+        price_range &= Q(**{f'{price_field}__lte': max_price})
+
+    # Requête 1 : bornes de l'histogramme (catégorie et disponibilité appliquées)
+    bounds_queryset = queryset.filter(availability)
+    if category is not None:
+        bounds_queryset = bounds_queryset.filter(category_id=category)
+    bounds = bounds_queryset.aggregate(low=Min(price_field), high=Max(price_field))
+    edges = get_price_edges(bounds['low'], bounds['high'], buckets)
+
+    # Requête 2 : un seul GROUP BY catégorie, chaque facette en comptage conditionnel
+    aggregates = {
+        'matching': count_where(price_range & availability),
+        'priced': count_where(price_range),
+        'in_stock': count_where(price_range & in_stock),
+    }
+    for index, (low, high) in enumerate(edges):
+        upper = f'{price_field}__lte' if index == len(edges) - 1 else f'{price_field}__lt'
+        aggregates[f'bucket_{index}'] = count_where(availability & Q(**{f'{price_field}__gte': low, upper: high}))
+    rows = list(
+        queryset.order_by()
+        .values('category_id', 'category__name')
+        .annotate(**aggregates)
+        .order_by('category__name', 'category_id')
+    )
+
+    selected = [row for row in rows if category is None or row['category_id'] == category]
+    total = sum(row['matching'] for row in selected)
+    priced = sum(row['priced'] for row in selected)
+    in_stock_count = sum(row['in_stock'] for row in selected)
+
+    return {
+        'total': total,
+        'categories': [
+            {'id': row['category_id'], 'name': row['category__name'], 'count': row['matching']}
+            for row in rows if row['matching']
+        ],
+        'availability': {'in_stock': in_stock_count, 'out_of_stock': priced - in_stock_count},
+        'price': {
+            'min': bounds['low'],
+            'max': bounds['high'],
+            'buckets': [
+                {'min': low, 'max': high, 'count': sum(row[f'bucket_{index}'] for row in selected)}
+                for index, (low, high) in enumerate(edges)
+            ],
+        },
+    }
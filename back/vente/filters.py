@@ -0,0 +1,205 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from .models import Order
+
+
+TRUE_VALUES = ('1', 'true', 'yes', 'on')
+FALSE_VALUES = ('0', 'false', 'no', 'off')
+
+
+def parse_int(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValidationError({name: 'Doit être un entier'})
+
+
+def parse_decimal(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        result = Decimal(value)
+    except (InvalidOperation, TypeError):
+        raise ValidationError({name: 'Doit être un nombre'})
+    # NaN et Infinity sont acceptés par Decimal mais pas comparables aux prix
+    if not result.is_finite():
+        raise ValidationError({name: 'Doit être un nombre'})
+    return result
+
+
+def parse_bool(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    value = value.lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise ValidationError({name: 'Doit être true ou false'})
+
+
+def parse_day(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if day is None:
+        raise ValidationError({name: 'Doit être une date (AAAA-MM-JJ)'})
+    return day
+
+
+def parse_id_list(params, name, limit):
+    """Identifiants séparés par des virgules, `limit` au plus"""
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        ids = list(dict.fromkeys(int(part) for part in value.split(',') if part.strip()))
+    except ValueError:
+        raise ValidationError({name: 'Liste d\'entiers séparés par des virgules attendue'})
+    if len(ids) > limit:
+        raise ValidationError({name: f'{limit} identifiants au maximum'})
+    return ids
+
+
+def parse_choices(params, name, choices):
+    """Liste de valeurs séparées par des virgules, chacune parmi `choices`"""
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    allowed = [choice for choice, label in choices]
+    values = [part.strip().upper() for part in value.split(',') if part.strip()]
+    invalid = [part for part in values if part not in allowed]
+    if invalid or not values:
+        raise ValidationError({name: f"Valeurs possibles : {', '.join(allowed)}"})
+    return values
+
+
+def parse_moment(params, name):
+    """
+    Date (AAAA-MM-JJ) ou date et heure ISO 8601.
+
+    Retourne (instant, date_seule) ; une date seule vaut minuit, heure locale.
+    """
+    value = params.get(name)
+    if value in (None, ''):
+        return None, False
+    try:
+        # parse_datetime accepte aussi une date seule : tester la date d'abord
+        day = parse_date(value)
+        moment = None if day else parse_datetime(value)
+    except ValueError:
+        moment = day = None
+    if day is not None:
+        moment = datetime.combine(day, time.min)
+    if moment is None:
+        raise ValidationError({name: 'Doit être une date (AAAA-MM-JJ) ou une date et heure ISO 8601'})
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment, day is not None
+
+
+class CatalogFilterBackend(BaseFilterBackend):
+    """
+    Filtres et tris côté serveur pour les produits et équipements.
+
+    Paramètres acceptés :
+    - category : identifiant de la catégorie
+    - min_price / max_price : bornes de prix (incluses)
+    - available : true/false, disponibilité (stock > 0 pour les produits)
+    - ordering : price, -price, newest, oldest
+
+    La vue définit `price_field` et `available_filter`.
+    """
+
+    def get_orderings(self, view):
+        price_field = view.price_field
+        return {
+            'price': (price_field, 'id'),
+            '-price': ('-' + price_field, '-id'),
+            'newest': ('-created_at', '-id'),
+            '-created_at': ('-created_at', '-id'),
+            'oldest': ('created_at', 'id'),
+            'created_at': ('created_at', 'id'),
+        }
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+        price_field = view.price_field
+
+        category = parse_int(params, 'category')
+        if category is not None:
+            queryset = queryset.filter(category_id=category)
+
+        min_price = parse_decimal(params, 'min_price')
+        if min_price is not None:
+            queryset = queryset.filter(**{f'{price_field}__gte': min_price})
+
+        max_price = parse_decimal(params, 'max_price')
+        if max_price is not None:
+            queryset = queryset.filter(**{f'{price_field}__lte': max_price})
+
+        available = parse_bool(params, 'available')
+        if available is True:
+            queryset = queryset.filter(**view.available_filter)
+        elif available is False:
+            queryset = queryset.exclude(**view.available_filter)
+
+        orderings = self.get_orderings(view)
+        ordering = params.get('ordering') or 'newest'
+        if ordering not in orderings:
+            raise ValidationError({'ordering': f"Valeurs possibles : {', '.join(orderings)}"})
+        return queryset.order_by(*orderings[ordering])
+
+
+def filter_orders(queryset, params, ignore=()):
+    """
+    Filtres de la file des commandes ; les paramètres listés dans `ignore` ne
+    sont pas appliqués (compteurs par statut calculés sans le filtre `status`).
+
+    - status / payment_status : une ou plusieurs valeurs séparées par des virgules
+    - created_after / created_before : bornes de date (une date seule inclut toute la journée)
+    - requires_delivery : true/false
+    """
+    for name, choices in (('status', Order.STATUS_CHOICES), ('payment_status', Order.PAYMENT_STATUS_CHOICES)):
+        values = parse_choices(params, name, choices)
+        if values is not None and name not in ignore:
+            queryset = queryset.filter(**{f'{name}__in': values})
+
+    created_after, date_only = parse_moment(params, 'created_after')
+    if created_after is not None and 'created_after' not in ignore:
+        queryset = queryset.filter(created_at__gte=created_after)
+
+    created_before, date_only = parse_moment(params, 'created_before')
+    if created_before is not None and 'created_before' not in ignore:
+        if date_only:
+            # Toute la journée est incluse : borne exclue au lendemain minuit
+            queryset = queryset.filter(created_at__lt=created_before + timedelta(days=1))
+        else:
+            queryset = queryset.filter(created_at__lte=created_before)
+
+    requires_delivery = parse_bool(params, 'requires_delivery')
+    if requires_delivery is not None and 'requires_delivery' not in ignore:
+        queryset = queryset.filter(requires_delivery=requires_delivery)
+    return queryset
+
+
+class OrderFilterBackend(BaseFilterBackend):
+    """Filtres côté serveur des commandes (voir filter_orders)"""
+
+    def filter_queryset(self, request, queryset, view):
+        return filter_orders(queryset, request.query_params)
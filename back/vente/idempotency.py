@@ -0,0 +1,105 @@
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+# Durée pendant laquelle un nouvel essai reçoit la réponse enregistrée
+DEFAULT_TTL = 60 * 60 * 24
+# Au-delà, une requête restée « en cours » est considérée comme abandonnée (worker tué)
+DEFAULT_LOCK_TIMEOUT = 60
+
+
+def fingerprint(request):
+    """Empreinte du corps de la requête : une même clé ne peut pas servir à deux requêtes différentes"""
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f'{request.method} {request.path}\n{body}'.encode()).hexdigest()
+
+
+def reserve(user, scope, key, request_hash):
+    """
+    Réserver la clé (insertion protégée par la contrainte d'unicité) ou
+    retourner l'enregistrement existant. Retourne (enregistrement, créé).
+    """
+    now = timezone.now()
+    ttl = getattr(settings, 'IDEMPOTENCY_KEY_TTL', DEFAULT_TTL)
+    lock_timeout = timedelta(seconds=getattr(settings, 'IDEMPOTENCY_LOCK_TIMEOUT', DEFAULT_LOCK_TIMEOUT))
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    user=user, scope=scope, key=key, request_hash=request_hash,
+                    expires_at=now + timedelta(seconds=ttl),
+                )
+            return record, True
+        except IntegrityError:
+            record = IdempotencyKey.objects.filter(user=user, scope=scope, key=key).first()
+            if record is None:
+                continue
+            abandoned = record.status_code is None and record.created_at < now - lock_timeout
+            if record.expires_at > now and not abandoned:
+                return record, False
+            # Clé expirée ou abandonnée : la libérer puis réessayer une fois
+            IdempotencyKey.objects.filter(pk=record.pk).delete()
+    # Clé reprise entre-temps par une requête concurrente
+    return None, False
+
+
+def idempotent(scope):
+    """
+    Rendre une vue POST rejouable avec l'en-tête Idempotency-Key.
+
+    La première requête réserve la clé et s'exécute ; si elle réussit (2xx), sa
+    réponse est enregistrée et un nouvel essai avec la même clé la reçoit sans
+    refaire les écritures ni les appels sortants (Stripe). Un échec n'a rien
+    écrit : la clé est libérée et le client peut réessayer. À placer sous @api_view.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key = request.headers.get(HEADER)
+            if not key or not request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return Response({'error': f'{HEADER} trop long ({MAX_KEY_LENGTH} caractères maximum)'},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+            request_hash = fingerprint(request)
+            record, created = reserve(request.user, scope, key, request_hash)
+            if record is None or (not created and record.status_code is None):
+                return Response({'error': 'La requête initiale est encore en cours'},
+                                status=status.HTTP_409_CONFLICT)
+            if not created:
+                if record.request_hash != request_hash:
+                    return Response({'error': f'{HEADER} déjà utilisé pour une autre requête'},
+                                    status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+                response = Response(record.response_body, status=record.status_code)
+                response['Idempotent-Replayed'] = 'true'
+                return response
+
+            try:
+                response = view(request, *args, **kwargs)
+            except Exception:
+                record.delete()
+                raise
+            if not status.is_success(response.status_code):
+                record.delete()
+                return response
+            # Enregistrer exactement le JSON envoyé au client
+            record.status_code = response.status_code
+            record.response_body = json.loads(JSONRenderer().render(response.data) or b'null')
+            record.save(update_fields=['status_code', 'response_body'])
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,199 @@
+import io
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, connection, transaction
+from PIL import Image as PILImage, ImageOps
+
+
+logger = logging.getLogger(__name__)
+
+# Largeurs générées pour chaque image (jamais au-delà de la largeur d'origine)
+DERIVATIVE_WIDTHS = (200, 400, 800)
+
+# format exposé par l'API -> (format Pillow, extension, options d'encodage)
+DERIVATIVE_FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+_lock = threading.Lock()
+_process_pool = None
+_dispatch_pool = None
+
+
+def render_derivatives(data, widths=DERIVATIVE_WIDTHS):
+    """
+    Redimensionner une image et l'encoder dans chaque format.
+
+    Fonction pure, exécutée dans un processus séparé : reçoit les octets de
+    l'original et retourne {(format, largeur): octets}.
+    """
+    with PILImage.open(io.BytesIO(data)) as original:
+        picture = ImageOps.exif_transpose(original).convert('RGB')
+
+    rendered = {}
+    for width in sorted({min(width, picture.width) for width in widths}):
+        if width == picture.width:
+            resized = picture
+        else:
+            height = max(1, round(picture.height * width / picture.width))
+            resized = picture.resize((width, height), PILImage.LANCZOS)
+        for name, (pil_format, extension, options) in DERIVATIVE_FORMATS.items():
+            buffer = io.BytesIO()
+            resized.save(buffer, pil_format, **options)
+            rendered[(name, width)] = buffer.getvalue()
+    return rendered
+
+
+def read_original(image):
+    with image.image.open('rb') as original:
+        return original.read()
+
+
+def store_derivatives(image, rendered):
+    """Enregistrer les déclinaisons dans le stockage et leurs URLs dans Image.derivatives"""
+    from .cache import bump_catalog_version
+    from .models import Image
+
+    storage = image.image.storage
+    derivatives = {}
+    for (name, width), content in rendered.items():
+        extension = DERIVATIVE_FORMATS[name][1]
+        saved_name = storage.save(f'images/derivatives/{image.id}_{width}.{extension}', ContentFile(content))
+        derivatives.setdefault(name, {})[str(width)] = storage.url(saved_name)
+
+    image.derivatives = derivatives
+    Image.objects.filter(pk=image.pk).update(derivatives=derivatives)
+    # update() ne déclenche pas les signaux
+    transaction.on_commit(lambda: bump_catalog_version('image'))
+    return derivatives
+
+
+def get_process_pool():
+    global _process_pool
+    with _lock:
+        if _process_pool is None:
+            # spawn : pas de fork d'un worker qui détient des connexions et des threads
+            _process_pool = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', 2),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _process_pool
+
+
+def get_dispatch_pool():
+    global _dispatch_pool
+    with _lock:
+        if _dispatch_pool is None:
+            _dispatch_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='image-derivatives')
+        return _dispatch_pool
+
+
+def generate_in_background(image_id):
+    from .models import Image
+
+    try:
+        image = Image.objects.get(pk=image_id)
+        # Lecture et écriture dans ce thread, calcul Pillow dans le pool de processus
+        rendered = get_process_pool().submit(render_derivatives, read_original(image)).result()
+        store_derivatives(image, rendered)
+    except Exception:
+        logger.exception('Échec de la génération des déclinaisons de l\'image %s', image_id)
+    finally:
+        connection.close()
+
+
+def attach_images(instance, image_files, current_ids=None, max_images=5):
+    """
+    Ajouter des images téléversées à un produit ou équipement.
+
+    Les images existantes sont lues une seule fois. Un fichier dont le contenu
+    (SHA-256) est déjà connu réutilise l'image enregistrée au lieu d'être
+    renvoyé au stockage. Les nouveaux envois partent en parallèle dans un pool
+    de threads borné, puis les lignes Image et les liens M2M sont créés avec
+    deux bulk_create.
+    """
+    from .cache import bump_catalog_version
+    from .models import Image
+
+    if current_ids is None:
+        current_ids = instance.images.values_list('id', flat=True)
+    current_ids = set(current_ids)
+
+    files_by_hash = {}
+    for image_file in image_files:
+        files_by_hash.setdefault(Image.hash_file(image_file), image_file)
+    known = {image.content_hash: image for image in Image.objects.filter(content_hash__in=files_by_hash)}
+
+    # Ordre d'envoi conservé, images déjà liées ignorées, limite appliquée avant tout envoi
+    hashes = [digest for digest in files_by_hash
+              if digest not in known or known[digest].id not in current_ids]
+    hashes = hashes[:max(max_images - len(current_ids), 0)]
+    if not hashes:
+        return []
+
+    new_images = [Image(image=files_by_hash[digest], content_hash=digest) for digest in hashes if digest not in known]
+    if new_images:
+        workers = min(len(new_images), getattr(settings, 'IMAGE_UPLOAD_WORKERS', 4))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-upload') as pool:
+            # list() pour propager la première erreur d'envoi
+            list(pool.map(Image.upload, new_images))
+        try:
+            with transaction.atomic():
+                Image.objects.bulk_create(new_images)
+        except IntegrityError:
+            # Le même fichier vient d'être enregistré par une requête concurrente : reprendre cette image
+            for image in new_images:
+                image.pk = None
+                existing = Image.objects.filter(content_hash=image.content_hash).first()
+                if existing is None:
+                    image.save()
+                    existing = image
+                else:
+                    # Notre copie du fichier ne sera jamais référencée
+                    image.image.delete(save=False)
+                known[image.content_hash] = existing
+        else:
+            known.update((image.content_hash, image) for image in new_images)
+
+    images = [known[digest] for digest in hashes]
+    relation = instance.images
+    through = relation.through
+    through.objects.bulk_create([
+        through(**{f'{relation.source_field_name}_id': instance.id, f'{relation.target_field_name}_id': image.id})
+        for image in images
+    ])
+
+    # bulk_create ne déclenche ni post_save ni m2m_changed
+    model_name = instance._meta.model_name
+    transaction.on_commit(lambda: bump_catalog_version('image', model_name))
+    schedule_derivatives([image.id for image in new_images if image.id and not image.derivatives])
+    return images
+
+
+def schedule_derivatives(image_ids):
+    """
+    Générer les déclinaisons des images après le commit de la requête,
+    hors du thread qui traite la requête.
+    """
+    from .models import Image
+
+    image_ids = list(image_ids)
+    if not image_ids:
+        return
+
+    def dispatch():
+        if not getattr(settings, 'IMAGE_DERIVATIVES_ASYNC', True):
+            for image in Image.objects.filter(id__in=image_ids):
+                store_derivatives(image, render_derivatives(read_original(image)))
+            return
+        pool = get_dispatch_pool()
+        for image_id in image_ids:
+            pool.submit(generate_in_background, image_id)
+
+    transaction.on_commit(dispatch)
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from vente.cache import bump_catalog_version
+from vente.models import Image
+
+
+class Command(BaseCommand):
+    help = "Enregistrer l'URL publique des images existantes (Image.public_url)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Nombre d\'images mises à jour par requête (défaut : 500)')
+        parser.add_argument('--all', action='store_true',
+                            help='Recalculer aussi les URLs déjà enregistrées (changement de stockage)')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        queryset = Image.objects.only('id', 'image', 'public_url').order_by('id')
+        if not options['all']:
+            queryset = queryset.filter(public_url='')
+
+        total = queryset.count()
+        self.stdout.write(f'{total} image(s) à traiter')
+
+        updated = 0
+        batch = []
+        for image in queryset.iterator(chunk_size=batch_size):
+            if not image.image:
+                continue
+            image.public_url = image.image.url
+            batch.append(image)
+            if len(batch) >= batch_size:
+                updated += self.flush(batch, batch_size)
+                self.stdout.write(f'  {updated}/{total}')
+                batch = []
+        if batch:
+            updated += self.flush(batch, batch_size)
+
+        # bulk_update ne déclenche pas les signaux : invalider le cache du catalogue à la main
+        bump_catalog_version('image')
+        self.stdout.write(self.style.SUCCESS(f'{updated} URL(s) enregistrée(s)'))
+
+    def flush(self, batch, batch_size):
+        Image.objects.bulk_update(batch, ['public_url'], batch_size=batch_size)
+        return len(batch)
@@ -0,0 +1,66 @@
+import time
+import uuid
+
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from vente.cart import CacheCartStore, DatabaseCartStore
+
+
+class Command(BaseCommand):
+    help = (
+        'Comparer le coût des ajouts au panier : session Django en base (ancien stockage) '
+        'contre les stockages CacheCartStore et DatabaseCartStore'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--carts', type=int, default=50, help='Nombre de paniers simulés (défaut : 50)')
+        parser.add_argument('--items', type=int, default=20, help='Articles ajoutés par panier (défaut : 20)')
+
+    def handle(self, *args, **options):
+        carts, items = options['carts'], options['items']
+        self.stdout.write(f'{carts} panier(s) x {items} ajout(s) puis une lecture par panier')
+        for label, run in (
+            ('session (base)', self.run_session),
+            ('CacheCartStore', self.run_store(CacheCartStore())),
+            ('DatabaseCartStore', self.run_store(DatabaseCartStore())),
+        ):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                run(carts, items)
+                elapsed = time.perf_counter() - started
+            operations = carts * (items + 1)
+            self.stdout.write(
+                f'  {label:<18} {elapsed * 1000:8.1f} ms  '
+                f'{elapsed * 1e6 / operations:8.1f} µs/op  {len(queries) / operations:5.2f} requête(s)/op'
+            )
+
+    def run_session(self, carts, items):
+        # Reproduit l'ancien code : chaque ajout relit et réécrit toute la session
+        keys = []
+        for cart_number in range(carts):
+            session_key = None
+            for item in range(items):
+                session = SessionStore(session_key=session_key)
+                cart = session.get('cart', {})
+                cart[str(item)] = {'type': 'product', 'quantity': 1, 'days': 0}
+                session['cart'] = cart
+                session.save()
+                session_key = session.session_key
+            SessionStore(session_key=session_key).get('cart')
+            keys.append(session_key)
+        for session_key in keys:
+            SessionStore(session_key=session_key).delete()
+
+    def run_store(self, store):
+        def run(carts, items):
+            owners = [f'benchmark:{uuid.uuid4().hex}' for cart_number in range(carts)]
+            for owner in owners:
+                for item in range(items):
+                    store.set_item(owner, item, {'type': 'product', 'quantity': 1, 'days': 0})
+                store.get(owner)
+            for owner in owners:
+                store.clear(owner)
+        return run
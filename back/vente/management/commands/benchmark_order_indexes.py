@@ -0,0 +1,156 @@
+import random
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from vente.models import Order, OrderItem, Product, ProductCategory, RefreshToken
+
+
+# Index ajoutés par la migration 0013_order_indexes
+INDEX_PACK = {
+    Order: ('order_user_created_idx', 'order_created_idx', 'order_status_created_idx',
+            'order_payment_created_idx', 'order_stripe_session_idx'),
+    OrderItem: ('orderitem_order_id_idx',),
+    RefreshToken: ('refreshtoken_user_active_idx',),
+}
+
+USER_PREFIX = 'bench-'
+
+
+class Command(BaseCommand):
+    help = (
+        'Remplir la base avec des commandes fictives puis mesurer les requêtes les plus '
+        'fréquentes sans puis avec les index de 0013_order_indexes. '
+        'À lancer sur une base de test : les index sont supprimés puis recréés.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1_000_000,
+                            help='Nombre de commandes à créer (défaut : 1 000 000)')
+        parser.add_argument('--users', type=int, default=10_000, help='Nombre de clients (défaut : 10 000)')
+        parser.add_argument('--batch-size', type=int, default=10_000, help='Taille des bulk_create (défaut : 10 000)')
+        parser.add_argument('--repeat', type=int, default=20, help='Exécutions par requête mesurée (défaut : 20)')
+        parser.add_argument('--skip-seed', action='store_true', help='Réutiliser les données d\'un lancement précédent')
+        parser.add_argument('--cleanup', action='store_true', help='Supprimer les données fictives à la fin')
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        if not options['skip_seed']:
+            self.seed(options['orders'], options['users'])
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE vente_order, vente_orderitem, vente_refreshtoken')
+
+        queries = self.get_queries()
+        self.set_indexes(False)
+        try:
+            before = {name: self.measure(run, options['repeat']) for name, run in queries}
+        finally:
+            self.set_indexes(True)
+        after = {name: self.measure(run, options['repeat']) for name, run in queries}
+
+        self.stdout.write(f'{"requête":<32} {"sans index":>12} {"avec index":>12} {"gain":>8}')
+        for name, run in queries:
+            gain = before[name] / after[name] if after[name] else float('inf')
+            self.stdout.write(f'{name:<32} {before[name]:>9.2f} ms {after[name]:>9.2f} ms {gain:>7.1f}x')
+
+        if options['cleanup']:
+            User.objects.filter(username__startswith=USER_PREFIX).delete()
+            self.stdout.write('Données fictives supprimées')
+
+    def seed(self, order_count, user_count):
+        started = time.monotonic()
+        users = User.objects.bulk_create(
+            [User(username=f'{USER_PREFIX}{uuid.uuid4().hex[:12]}') for number in range(user_count)],
+            batch_size=self.batch_size,
+        )
+        if connection.vendor != 'postgresql':
+            # SQLite ne renvoie pas toujours les identifiants d'un bulk_create
+            users = list(User.objects.filter(username__startswith=USER_PREFIX))
+        user_ids = [user.id for user in users]
+
+        category, created = ProductCategory.objects.get_or_create(name='Benchmark')
+        product = Product.objects.create(name='Benchmark', price=Decimal('10.00'), stock=0, category=category)
+
+        RefreshToken.objects.bulk_create(
+            [RefreshToken(user_id=user_id, token=uuid.uuid4().hex, is_active=random.random() < 0.1,
+                          expires_at=timezone.now() + timedelta(days=7))
+             for user_id in user_ids for number in range(5)],
+            batch_size=self.batch_size,
+        )
+
+        statuses = [choice for choice, label in Order.STATUS_CHOICES]
+        payment_statuses = [choice for choice, label in Order.PAYMENT_STATUS_CHOICES]
+        now = timezone.now()
+        created_orders = 0
+        while created_orders < order_count:
+            size = min(self.batch_size, order_count - created_orders)
+            with transaction.atomic():
+                orders = Order.objects.bulk_create([
+                    Order(
+                        user_id=random.choice(user_ids),
+                        status=random.choices(statuses, weights=(5, 30, 2, 10, 50, 3))[0],
+                        payment_status=random.choices(payment_statuses, weights=(10, 85, 5))[0],
+                        total_amount=Decimal('10.00'),
+                        stripe_session_id=f'cs_{uuid.uuid4().hex}' if random.random() < 0.3 else '',
+                    )
+                    for number in range(size)
+                ])
+                if orders[0].pk is None:
+                    orders = list(Order.objects.order_by('-id')[:size])
+                # created_at est en auto_now_add : répartir les dates sur deux ans après coup
+                for order in orders:
+                    order.created_at = now - timedelta(minutes=random.randrange(60 * 24 * 730))
+                Order.objects.bulk_update(orders, ['created_at'], batch_size=self.batch_size)
+                OrderItem.objects.bulk_create(
+                    [OrderItem(order=order, product=product, quantity=1, price=Decimal('10.00')) for order in orders]
+                )
+            created_orders += size
+            elapsed = time.monotonic() - started
+            self.stdout.write(f'  {created_orders}/{order_count} commande(s) ({created_orders / elapsed:.0f}/s)')
+
+    def get_queries(self):
+        user_id = Order.objects.filter(user__username__startswith=USER_PREFIX).values_list('user_id', flat=True).first()
+        order_id = Order.objects.order_by('-id').values_list('id', flat=True).first()
+        session_id = (Order.objects.exclude(stripe_session_id='').order_by('-id')
+                      .values_list('stripe_session_id', flat=True).first())
+        return [
+            ('commandes d\'un client', lambda: list(
+                Order.objects.filter(user_id=user_id).order_by('-created_at', '-id')[:20])),
+            ('ETag d\'un client', lambda: Order.objects.filter(user_id=user_id).aggregate(
+                last_update=Max('updated_at'), count=Count('id'))),
+            ('toutes les commandes (admin)', lambda: list(Order.objects.order_by('-created_at', '-id')[:20])),
+            ('commandes PENDING', lambda: list(
+                Order.objects.filter(status='PENDING').order_by('-created_at')[:20])),
+            ('paiements en échec', lambda: list(
+                Order.objects.filter(payment_status='FAILED').order_by('-created_at')[:20])),
+            ('webhook Stripe (session)', lambda: Order.objects.filter(stripe_session_id=session_id).first()),
+            ('première ligne d\'une commande', lambda: list(
+                OrderItem.objects.filter(order_id=order_id).order_by('id')[:1])),
+            ('jetons actifs d\'un client', lambda: RefreshToken.objects.filter(
+                user_id=user_id, is_active=True).count()),
+        ]
+
+    def measure(self, run, repeat):
+        run()  # préchauffage
+        started = time.perf_counter()
+        for attempt in range(repeat):
+            run()
+        return (time.perf_counter() - started) * 1000 / repeat
+
+    def set_indexes(self, enabled):
+        with connection.schema_editor() as editor:
+            for model, names in INDEX_PACK.items():
+                for index in model._meta.indexes:
+                    if index.name in names:
+                        if enabled:
+                            editor.add_index(model, index)
+                        else:
+                            editor.remove_index(model, index)
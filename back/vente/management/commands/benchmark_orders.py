@@ -0,0 +1,84 @@
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.db.models import Sum
+
+from vente.models import Order, OrderItem, Product, ProductCategory
+from vente.orders import OrderError, place_order
+
+
+USER_PREFIX = 'bench-order-'
+
+
+class Command(BaseCommand):
+    help = (
+        'Mesurer le débit de place_order sous concurrence : plusieurs threads achètent '
+        'le même produit jusqu\'à épuisement du stock, puis on vérifie qu\'il n\'y a pas de survente. '
+        'Les données fictives sont supprimées à la fin.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Nombre d\'acheteurs simultanés (défaut : 8)')
+        parser.add_argument('--attempts', type=int, default=50, help='Commandes tentées par acheteur (défaut : 50)')
+        parser.add_argument('--stock', type=int, default=200, help='Stock initial du produit (défaut : 200)')
+        parser.add_argument('--quantity', type=int, default=2, help='Quantité par commande (défaut : 2)')
+
+    def handle(self, *args, **options):
+        threads, attempts, quantity = options['threads'], options['attempts'], options['quantity']
+        category, created = ProductCategory.objects.get_or_create(name='Benchmark')
+        product = Product.objects.create(name='Benchmark', price=Decimal('10.00'), stock=options['stock'],
+                                         category=category)
+        users = [User.objects.create_user(username=f'{USER_PREFIX}{uuid.uuid4().hex[:12]}') for i in range(threads)]
+        results = {'sold': 0, 'refused': 0, 'retries': 0}
+        lock = threading.Lock()
+
+        def buy(user):
+            try:
+                for attempt in range(attempts):
+                    while True:
+                        try:
+                            place_order(user, [{'id': product.id, 'type': 'product', 'quantity': quantity,
+                                                'days': 1}], {})
+                            outcome = 'sold'
+                        except OrderError:
+                            outcome = 'refused'
+                        except OperationalError:
+                            # SQLite : base verrouillée par une autre écriture, on réessaie
+                            with lock:
+                                results['retries'] += 1
+                            time.sleep(0.001)
+                            continue
+                        break
+                    with lock:
+                        results[outcome] += 1
+            finally:
+                connection.close()
+
+        try:
+            started = time.perf_counter()
+            workers = [threading.Thread(target=buy, args=(user,)) for user in users]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - started
+
+            product.refresh_from_db()
+            sold_units = OrderItem.objects.filter(product=product).aggregate(total=Sum('quantity'))['total'] or 0
+            total = threads * attempts
+            self.stdout.write(
+                f'{total} commande(s) en {elapsed:.2f}s : {total / elapsed:.0f} commande(s)/s, '
+                f'{results["sold"]} vendue(s), {results["refused"]} refusée(s), {results["retries"]} nouvel(s) essai(s)'
+            )
+            if product.stock < 0 or sold_units + product.stock != options['stock']:
+                raise CommandError(f'Survente : {sold_units} unité(s) vendue(s), stock final {product.stock}')
+            self.stdout.write(self.style.SUCCESS(f'Pas de survente : stock final {product.stock}'))
+        finally:
+            Order.objects.filter(user__in=users).delete()
+            User.objects.filter(id__in=[user.id for user in users]).delete()
+            product.delete()
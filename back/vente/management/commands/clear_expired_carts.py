@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from vente.models import CartItem
+
+
+class Command(BaseCommand):
+    help = 'Supprimer les lignes de panier expirées (stockage en base, à lancer via cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Nombre de lignes supprimées par requête (défaut : 5000)')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        deleted = 0
+        while True:
+            # Suppression par lots : pas de verrou long sur une grosse table
+            ids = list(CartItem.objects.filter(expires_at__lte=now).values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            deleted += CartItem.objects.filter(id__in=ids).delete()[0]
+        self.stdout.write(self.style.SUCCESS(f'{deleted} ligne(s) de panier expirée(s) supprimée(s)'))
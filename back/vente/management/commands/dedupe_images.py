@@ -0,0 +1,124 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from vente.cache import bump_catalog_version
+from vente.models import Image, Product, Equipment
+
+
+class Command(BaseCommand):
+    help = (
+        'Calculer l\'empreinte SHA-256 des images existantes et fusionner les doublons : '
+        'les produits et équipements sont rattachés à une seule image par contenu.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Nombre d\'images lues par lot (défaut : 200)')
+        parser.add_argument('--workers', type=int, default=8,
+                            help='Nombre de lectures simultanées depuis le stockage (défaut : 8)')
+        parser.add_argument('--delete-files', action='store_true',
+                            help='Supprimer aussi du stockage les fichiers des doublons')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Afficher les doublons sans rien modifier')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.hashed = self.merged = self.failed = 0
+        queryset = Image.objects.filter(content_hash__isnull=True).only('id', 'image').order_by('id')
+
+        total = queryset.count()
+        self.stdout.write(f'{total} image(s) sans empreinte')
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            batch = []
+            for image in queryset.iterator(chunk_size=options['batch_size']):
+                batch.append(image)
+                if len(batch) >= options['batch_size']:
+                    self.process_batch(pool, batch)
+                    self.stdout.write(f'  {self.hashed + self.merged + self.failed}/{total}')
+                    batch = []
+            if batch:
+                self.process_batch(pool, batch)
+
+        if self.merged and not options['dry_run']:
+            # Les requêtes en masse ne déclenchent pas les signaux
+            bump_catalog_version('image', 'product', 'equipment')
+
+        prefix = '[dry-run] ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}{self.hashed} empreinte(s) enregistrée(s), {self.merged} doublon(s) fusionné(s), '
+            f'{self.failed} image(s) illisible(s)'
+        ))
+
+    def read_hash(self, image):
+        try:
+            with image.image.open('rb') as original:
+                return image, Image.hash_file(original)
+        except Exception as e:
+            self.stderr.write(f'Image {image.id} illisible : {e}')
+            return image, None
+
+    def process_batch(self, pool, batch):
+        groups = {}
+        for image, digest in pool.map(self.read_hash, batch):
+            if digest is None:
+                self.failed += 1
+            else:
+                groups.setdefault(digest, []).append(image)
+
+        # Image de référence : celle qui a déjà l'empreinte, sinon la plus ancienne du groupe
+        canonical, kept_names = {}, set()
+        for digest, pk, name in Image.objects.filter(content_hash__in=groups).values_list('content_hash', 'id', 'image'):
+            canonical[digest] = pk
+            kept_names.add(name)
+        to_hash, duplicates, duplicate_files = [], {}, []
+        for digest, images in groups.items():
+            if digest not in canonical:
+                keeper = images.pop(0)
+                keeper.content_hash = digest
+                to_hash.append(keeper)
+                canonical[digest] = keeper.id
+                kept_names.add(keeper.image.name)
+            for image in images:
+                duplicates[image.id] = canonical[digest]
+                duplicate_files.append(image.image)
+
+        self.hashed += len(to_hash)
+        self.merged += len(duplicates)
+        if self.options['dry_run']:
+            for duplicate_id, keeper_id in duplicates.items():
+                self.stdout.write(f'  image {duplicate_id} -> {keeper_id}')
+            return
+
+        with transaction.atomic():
+            for model in (Product, Equipment):
+                self.repoint(model.images.through, duplicates)
+            Image.objects.filter(id__in=duplicates).delete()
+            Image.objects.bulk_update(to_hash, ['content_hash'])
+
+        if self.options['delete_files']:
+            for image_file in duplicate_files:
+                # Deux lignes peuvent pointer vers le même fichier
+                if image_file.name not in kept_names:
+                    image_file.delete(save=False)
+
+    def repoint(self, through, duplicates):
+        """Rattacher les liens M2M des doublons à l'image de référence, sans créer de lien en double"""
+        if not duplicates:
+            return
+        owner = next(field.attname for field in through._meta.fields
+                     if field.is_relation and field.related_model is not Image)
+        links = through.objects.filter(image_id__in=[*duplicates, *set(duplicates.values())])
+        existing = set(links.values_list(owner, 'image_id'))
+
+        to_create = []
+        for owner_id, image_id in list(existing):
+            if image_id in duplicates:
+                pair = (owner_id, duplicates[image_id])
+                if pair not in existing:
+                    existing.add(pair)
+                    to_create.append(through(**{owner: owner_id, 'image_id': pair[1]}))
+        through.objects.filter(image_id__in=duplicates).delete()
+        through.objects.bulk_create(to_create)
@@ -0,0 +1,43 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from vente.catalog_io import CATALOG_SPECS, RowWriter, detect_format, get_columns
+
+
+class Command(BaseCommand):
+    help = 'Exporter les produits ou équipements en CSV / NDJSON, en flux (mémoire constante)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=sorted(CATALOG_SPECS))
+        parser.add_argument('--output', '-o', default='-', help='Fichier de sortie (défaut : sortie standard)')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='Déduit de l\'extension si absent')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Nombre de lignes lues par aller-retour en base (défaut : 2000)')
+
+    def handle(self, *args, **options):
+        spec = CATALOG_SPECS[options['model']]
+        path = options['output']
+        fmt = detect_format(path, options['format'])
+        columns = get_columns(spec)
+
+        # values_list : pas d'instanciation de modèles, catégorie par jointure
+        queryset = (spec['model'].objects.order_by('id')
+                    .values_list('id', *spec['fields'], 'category__name'))
+
+        stream = sys.stdout if path == '-' else open(path, 'w', newline='', encoding='utf-8')
+        # La progression va sur stderr pour ne pas polluer un export vers la sortie standard
+        progress = self.stderr if path == '-' else self.stdout
+        try:
+            writer = RowWriter(stream, fmt, columns)
+            count = 0
+            for values in queryset.iterator(chunk_size=options['chunk_size']):
+                writer.write(values)
+                count += 1
+                if count % 100000 == 0:
+                    progress.write(f'  {count} ligne(s) exportée(s)')
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+
+        progress.write(self.style.SUCCESS(f'{count} ligne(s) exportée(s)'))
@@ -0,0 +1,62 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+
+from vente.images import read_original, render_derivatives, store_derivatives
+from vente.models import Image
+
+
+class Command(BaseCommand):
+    help = 'Générer les miniatures WebP/JPEG des images existantes, en parallèle'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Nombre de processus de redimensionnement (défaut : 4)')
+        parser.add_argument('--batch-size', type=int, default=50,
+                            help='Nombre d\'images chargées en mémoire à la fois (défaut : 50)')
+        parser.add_argument('--all', action='store_true',
+                            help='Régénérer aussi les images qui ont déjà leurs déclinaisons')
+
+    def handle(self, *args, **options):
+        queryset = Image.objects.order_by('id')
+        if not options['all']:
+            queryset = queryset.filter(derivatives={})
+
+        total = queryset.count()
+        self.stdout.write(f'{total} image(s) à traiter avec {options["workers"]} processus')
+
+        done = failed = 0
+        batch = []
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            for image in queryset.iterator(chunk_size=options['batch_size']):
+                batch.append(image)
+                if len(batch) >= options['batch_size']:
+                    ok, ko = self.process_batch(pool, batch)
+                    done, failed = done + ok, failed + ko
+                    self.stdout.write(f'  {done + failed}/{total}')
+                    batch = []
+            if batch:
+                ok, ko = self.process_batch(pool, batch)
+                done, failed = done + ok, failed + ko
+
+        self.stdout.write(self.style.SUCCESS(f'{done} image(s) traitée(s), {failed} échec(s)'))
+
+    def process_batch(self, pool, batch):
+        done = failed = 0
+        futures = {}
+        for image in batch:
+            try:
+                futures[pool.submit(render_derivatives, read_original(image))] = image
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f'Image {image.id} illisible : {e}')
+
+        for future in as_completed(futures):
+            image = futures[future]
+            try:
+                store_derivatives(image, future.result())
+                done += 1
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f'Image {image.id} : {e}')
+        return done, failed
@@ -0,0 +1,158 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from vente.cache import bump_catalog_version
+from vente.catalog_io import CATALOG_SPECS, detect_format, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        'Importer des produits ou équipements depuis un CSV / NDJSON, en flux et par lots. '
+        'Une ligne avec un id existant met à jour l\'article, sinon il est créé avec un nouvel id.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=sorted(CATALOG_SPECS))
+        parser.add_argument('path', help='Fichier à importer (« - » pour l\'entrée standard)')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='Déduit de l\'extension si absent')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Nombre de lignes écrites par transaction (défaut : 1000)')
+        parser.add_argument('--create-categories', action='store_true',
+                            help='Créer les catégories inconnues au lieu de rejeter la ligne')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Valider le fichier sans rien écrire en base')
+
+    def handle(self, *args, **options):
+        self.spec = CATALOG_SPECS[options['model']]
+        self.model = self.spec['model']
+        self.dry_run = options['dry_run']
+        self.create_categories = options['create_categories']
+        self.batch_size = options['batch_size']
+        self.created = self.updated = self.errors = 0
+        # Longueur des colonnes texte : une valeur trop longue ferait échouer tout le lot (DataError)
+        self.max_lengths = {field: self.model._meta.get_field(field).max_length for field in self.spec['fields']}
+        self.category_max_length = self.spec['category_model']._meta.get_field('name').max_length
+
+        # Toutes les catégories tiennent en mémoire : une seule requête pour les résoudre
+        self.categories = {
+            name: pk for pk, name in self.spec['category_model'].objects.values_list('id', 'name')
+        }
+
+        path = options['path']
+        fmt = detect_format(path, options['format'])
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        started = time.monotonic()
+        try:
+            batch = []
+            for line_number, row in read_rows(stream, fmt, on_error=self.reject):
+                item = self.parse_row(line_number, row)
+                if item is None:
+                    continue
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    self.write_batch(batch)
+                    batch = []
+                    self.report_progress(started)
+            if batch:
+                self.write_batch(batch)
+        except (ValueError, UnicodeDecodeError) as e:
+            raise CommandError(f'Fichier illisible : {e}')
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        if not self.dry_run and (self.created or self.updated):
+            # bulk_create / bulk_update ne déclenchent pas les signaux
+            bump_catalog_version(*self.spec['cache_names'])
+
+        prefix = '[dry-run] ' if self.dry_run else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}{self.created} créé(s), {self.updated} mis à jour, {self.errors} ligne(s) rejetée(s) '
+            f'en {time.monotonic() - started:.1f}s'
+        ))
+
+    def report_progress(self, started):
+        done = self.created + self.updated
+        elapsed = time.monotonic() - started
+        rate = done / elapsed if elapsed else 0
+        self.stdout.write(f'  {done} ligne(s) traitée(s) ({rate:.0f}/s)')
+
+    def reject(self, line_number, message):
+        self.errors += 1
+        self.stderr.write(f'Ligne {line_number} : {message}')
+        return None
+
+    def parse_row(self, line_number, row):
+        values = {}
+        for field, parse in self.spec['fields'].items():
+            raw = row.get(field)
+            if raw in (None, '') and field == 'name':
+                return self.reject(line_number, 'nom manquant')
+            if raw is None:
+                continue
+            try:
+                values[field] = parse(raw)
+            except ValueError as e:
+                return self.reject(line_number, f'{field} : {e}')
+            max_length = self.max_lengths[field]
+            if max_length and len(values[field]) > max_length:
+                return self.reject(line_number, f'{field} : plus de {max_length} caractères')
+
+        category = str(row.get('category') or '').strip()
+        if len(category) > self.category_max_length:
+            return self.reject(line_number, f'catégorie : plus de {self.category_max_length} caractères')
+        category_id = self.resolve_category(category)
+        if category_id is None:
+            return self.reject(line_number, f"catégorie inconnue : {row.get('category')!r}")
+        values['category_id'] = category_id
+
+        raw_id = row.get('id')
+        try:
+            item_id = int(raw_id) if raw_id not in (None, '') else None
+        except (TypeError, ValueError):
+            return self.reject(line_number, f'id invalide : {raw_id!r}')
+        return item_id, values
+
+    def resolve_category(self, name):
+        if not name:
+            return None
+        if name in self.categories:
+            return self.categories[name]
+        if not self.create_categories:
+            return None
+        if self.dry_run:
+            # Identifiant fictif : la catégorie serait créée lors du vrai import
+            self.categories[name] = 0
+        else:
+            self.categories[name] = self.spec['category_model'].objects.create(name=name).id
+        return self.categories[name]
+
+    def write_batch(self, batch):
+        ids = [item_id for item_id, values in batch if item_id is not None]
+        existing = self.model.objects.in_bulk(ids) if ids else {}
+
+        to_create, to_update = [], []
+        updated_fields = set()
+        for item_id, values in batch:
+            instance = existing.get(item_id)
+            if instance is None:
+                to_create.append(self.model(**values))
+            else:
+                for field, value in values.items():
+                    setattr(instance, field, value)
+                updated_fields.update(values)
+                to_update.append(instance)
+
+        self.created += len(to_create)
+        self.updated += len(to_update)
+        if self.dry_run:
+            return
+
+        with transaction.atomic():
+            if to_create:
+                self.model.objects.bulk_create(to_create, batch_size=self.batch_size)
+            if to_update:
+                self.model.objects.bulk_update(to_update, sorted(updated_fields), batch_size=self.batch_size)
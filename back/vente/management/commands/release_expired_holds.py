@@ -0,0 +1,34 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from vente.orders import release_expired_holds
+
+
+class Command(BaseCommand):
+    help = (
+        'Annuler les commandes non payées dont la réservation de stock a expiré et rendre '
+        'leur stock (à lancer via cron, ou en continu avec --interval)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Nombre de commandes traitées par transaction (défaut : 500)')
+        parser.add_argument('--grace', type=int, default=300,
+                            help='Délai en secondes après l\'expiration, pour laisser arriver un webhook '
+                                 'de paiement en retard (défaut : 300)')
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Relancer le balayage toutes les N secondes au lieu de s\'arrêter')
+
+    def handle(self, *args, **options):
+        while True:
+            now = timezone.now() - timedelta(seconds=options['grace'])
+            orders, units = release_expired_holds(now=now, batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f'{orders} commande(s) expirée(s) annulée(s), {units} unité(s) rendue(s) au stock'
+            ))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,131 @@
+from django.db import migrations
+
+
+CATALOG_TABLES = (
+    # table, type, décalage du rowid FTS5 (id * 2 + décalage)
+    ('vente_product', 'product', 0),
+    ('vente_equipment', 'equipment', 1),
+)
+
+POSTGRES_SETUP = """
+CREATE EXTENSION IF NOT EXISTS unaccent;
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'french_unaccent') THEN
+        CREATE TEXT SEARCH CONFIGURATION french_unaccent (COPY = french);
+        ALTER TEXT SEARCH CONFIGURATION french_unaccent
+            ALTER MAPPING FOR hword, hword_part, word WITH unaccent, french_stem;
+    END IF;
+END
+$$;
+CREATE OR REPLACE FUNCTION vente_catalog_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('french_unaccent', coalesce(NEW.name, '')), 'A') ||
+        setweight(to_tsvector('french_unaccent', coalesce(NEW.description, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+POSTGRES_TABLE = """
+ALTER TABLE {table} ADD COLUMN search_vector tsvector;
+UPDATE {table} SET search_vector =
+    setweight(to_tsvector('french_unaccent', coalesce(name, '')), 'A') ||
+    setweight(to_tsvector('french_unaccent', coalesce(description, '')), 'B');
+CREATE INDEX {table}_search_idx ON {table} USING GIN (search_vector);
+CREATE TRIGGER {table}_search_vector BEFORE INSERT OR UPDATE OF name, description ON {table}
+    FOR EACH ROW EXECUTE FUNCTION vente_catalog_search_vector();
+"""
+
+POSTGRES_TABLE_REVERSE = """
+DROP TRIGGER IF EXISTS {table}_search_vector ON {table};
+DROP INDEX IF EXISTS {table}_search_idx;
+ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector;
+"""
+
+SQLITE_SETUP = """
+CREATE VIRTUAL TABLE vente_catalog_search USING fts5(
+    name, description, kind UNINDEXED, item_id UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+);
+"""
+
+SQLITE_TABLE = """
+INSERT INTO vente_catalog_search (rowid, name, description, kind, item_id)
+    SELECT id * 2 + {offset}, name, coalesce(description, ''), '{kind}', id FROM {table};
+CREATE TRIGGER {table}_search_insert AFTER INSERT ON {table} BEGIN
+    INSERT INTO vente_catalog_search (rowid, name, description, kind, item_id)
+    VALUES (new.id * 2 + {offset}, new.name, coalesce(new.description, ''), '{kind}', new.id);
+END;
+CREATE TRIGGER {table}_search_update AFTER UPDATE OF name, description ON {table} BEGIN
+    UPDATE vente_catalog_search SET name = new.name, description = coalesce(new.description, '')
+    WHERE rowid = old.id * 2 + {offset};
+END;
+CREATE TRIGGER {table}_search_delete AFTER DELETE ON {table} BEGIN
+    DELETE FROM vente_catalog_search WHERE rowid = old.id * 2 + {offset};
+END;
+"""
+
+SQLITE_TABLE_REVERSE = """
+DROP TRIGGER IF EXISTS {table}_search_insert;
+DROP TRIGGER IF EXISTS {table}_search_update;
+DROP TRIGGER IF EXISTS {table}_search_delete;
+"""
+
+
+def run_statements(schema_editor, sql):
+    # PostgreSQL accepte plusieurs instructions à la fois, SQLite une seule
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(sql, params=None)
+        return
+    for statement in split_sqlite(sql):
+        schema_editor.execute(statement, params=None)
+
+
+def split_sqlite(sql):
+    statements, current = [], []
+    for line in sql.strip().splitlines():
+        current.append(line)
+        stripped = line.strip()
+        # Les triggers SQLite se terminent par « END; », les autres instructions par « ; »
+        in_trigger = current[0].lstrip().startswith('CREATE TRIGGER')
+        if (in_trigger and stripped == 'END;') or (not in_trigger and stripped.endswith(';')):
+            statements.append('\n'.join(current))
+            current = []
+    return statements
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        run_statements(schema_editor, POSTGRES_SETUP)
+        for table, kind, offset in CATALOG_TABLES:
+            run_statements(schema_editor, POSTGRES_TABLE.format(table=table))
+    elif vendor == 'sqlite':
+        run_statements(schema_editor, SQLITE_SETUP)
+        for table, kind, offset in CATALOG_TABLES:
+            run_statements(schema_editor, SQLITE_TABLE.format(table=table, kind=kind, offset=offset))
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for table, kind, offset in CATALOG_TABLES:
+            run_statements(schema_editor, POSTGRES_TABLE_REVERSE.format(table=table))
+        schema_editor.execute('DROP FUNCTION IF EXISTS vente_catalog_search_vector();', params=None)
+    elif vendor == 'sqlite':
+        for table, kind, offset in CATALOG_TABLES:
+            run_statements(schema_editor, SQLITE_TABLE_REVERSE.format(table=table))
+        schema_editor.execute('DROP TABLE IF EXISTS vente_catalog_search;', params=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vente', '0005_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
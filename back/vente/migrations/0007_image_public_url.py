@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 18:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vente', '0006_catalog_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='public_url',
+            field=models.CharField(blank=True, default='', max_length=500),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:01
+
+from django.db import migrations, models
+
+
+def build_summary(apps, schema_editor):
+    Review = apps.get_model('vente', 'Review')
+    ReviewSummary = apps.get_model('vente', 'ReviewSummary')
+    stats = Review.objects.filter(is_approved=True).aggregate(
+        count=models.Count('id'),
+        rating_sum=models.Sum('rating'),
+        **{f'rating_{rating}': models.Count('id', filter=models.Q(rating=rating)) for rating in range(1, 6)},
+    )
+    stats['rating_sum'] = stats['rating_sum'] or 0
+    ReviewSummary.objects.create(pk=1, **stats)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vente', '0009_image_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.PositiveIntegerField(default=0)),
+                ('rating_1', models.PositiveIntegerField(default=0)),
+                ('rating_2', models.PositiveIntegerField(default=0)),
+                ('rating_3', models.PositiveIntegerField(default=0)),
+                ('rating_4', models.PositiveIntegerField(default=0)),
+                ('rating_5', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(build_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vente', '0010_review_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CartItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner', models.CharField(max_length=100)),
+                ('item_id', models.CharField(max_length=50)),
+                ('item_type', models.CharField(max_length=20)),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('days', models.PositiveIntegerField(default=0)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('owner', 'item_id'), name='vente_cartitem_owner_item_uniq'),
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:20
+
+from importlib import import_module
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+search = import_module('vente.migrations.0006_catalog_search')
+
+POSTGRES_PERIOD_INDEX = """
+CREATE INDEX reservation_period_gist ON vente_reservation USING GIST (daterange(start_date, end_date));
+"""
+
+
+def restore_search_triggers(apps, schema_editor):
+    # Sous SQLite, l'ajout d'une colonne NOT NULL recrée la table vente_equipment
+    # et supprime ses triggers de recherche : les remettre en place
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table, kind, offset in search.CATALOG_TABLES:
+        if table != 'vente_equipment':
+            continue
+        search.run_statements(schema_editor, search.SQLITE_TABLE_REVERSE.format(table=table))
+        sql = search.SQLITE_TABLE.format(table=table, kind=kind, offset=offset)
+        for statement in search.split_sqlite(sql):
+            if statement.lstrip().startswith('CREATE TRIGGER'):
+                schema_editor.execute(statement, params=None)
+
+
+def create_period_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_PERIOD_INDEX, params=None)
+
+
+def drop_period_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS reservation_period_gist;', params=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vente', '0013_order_indexes'),
+    ]
+
+    operations = [
+        # Retour arrière : triggers remis après la suppression de la colonne
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.AddField(
+            model_name='equipment',
+            name='units',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='orderitem',
+            name='rental_start',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='Reservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('equipment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='vente.equipment')),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='vente.order')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['equipment', 'start_date', 'end_date'], name='reservation_period_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='reservation',
+            constraint=models.CheckConstraint(check=models.Q(('end_date__gt', models.F('start_date'))), name='reservation_end_after_start'),
+        ),
+        migrations.RunPython(create_period_index, drop_period_index),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:53
+
+from django.db import migrations, models
+
+
+def mark_cancelled_orders(apps, schema_editor):
+    # Les commandes annulées l'ont été par release_holds, qui a rendu leur stock
+    Order = apps.get_model('vente', 'Order')
+    Order.objects.filter(status='CANCELLED').update(stock_released=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vente', '0015_stock_holds'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='stock_released',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_cancelled_orders, migrations.RunPython.noop),
+    ]
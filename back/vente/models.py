@@ -1,7 +1,10 @@
-from django.db import models
+from django.db import models, connections
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
 from django.contrib.auth.models import User
 from django.utils import timezone
 from datetime import timedelta
+import hashlib
 
 class RefreshToken(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -9,6 +12,12 @@ class RefreshToken(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     expires_at = models.DateTimeField()
     is_active = models.BooleanField(default=True)
+
+    class Meta:
+        indexes = [
+            # Désactivation des jetons actifs d'un utilisateur à chaque connexion
+            models.Index(fields=['user'], name='refreshtoken_user_active_idx', condition=models.Q(is_active=True)),
+        ]
     
     def save(self, *args, **kwargs):
         if not self.expires_at:
@@ -39,10 +48,47 @@ class EquipmentCategory(models.Model):
 class Image(models.Model):
     image = models.ImageField(upload_to='images/')
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # URL publique résolue une seule fois à l'upload (évite un appel au stockage par affichage)
+    public_url = models.CharField(max_length=500, blank=True, default='')
+    # Déclinaisons redimensionnées : {"webp": {"200": url, ...}, "jpeg": {...}}
+    derivatives = models.JSONField(default=dict, blank=True)
+    # SHA-256 du contenu : un même fichier n'est stocké qu'une fois
+    content_hash = models.CharField(max_length=64, unique=True, null=True, blank=True)
 
     def __str__(self):
         return f"Image {self.id}"
 
+    @staticmethod
+    def hash_file(file):
+        digest = hashlib.sha256()
+        file.seek(0)
+        for chunk in iter(lambda: file.read(64 * 1024), b''):
+            digest.update(chunk)
+        file.seek(0)
+        return digest.hexdigest()
+
+    def upload(self):
+        """Envoyer le fichier au stockage (sans écrire en base) et enregistrer son URL définitive"""
+        if self.image and not self.image._committed:
+            if not self.content_hash:
+                self.content_hash = self.hash_file(self.image.file)
+            self.image.save(self.image.name, self.image.file, save=False)
+        if self.image and not self.public_url:
+            self.public_url = self.image.url
+
+    def save(self, *args, **kwargs):
+        # Envoyer le fichier au stockage avant l'INSERT pour connaître son URL définitive
+        self.upload()
+        super().save(*args, **kwargs)
+
+    def get_url(self):
+        """URL publique de l'image, calculée par le stockage seulement si elle n'est pas enregistrée"""
+        if self.public_url:
+            return self.public_url
+        if self.image:
+            return self.image.url
+        return None
+
 class Product(models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField(null=True)
@@ -52,6 +98,14 @@ class Product(models.Model):
     stock = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Pages de catégorie triées par nouveauté ou par prix
+            models.Index(fields=['category', '-created_at', '-id'], name='product_cat_created_idx'),
+            models.Index(fields=['category', 'price'], name='product_cat_price_idx'),
+            models.Index(fields=['-created_at', '-id'], name='product_created_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -66,9 +120,19 @@ class Equipment(models.Model):
     rental_price_per_day = models.DecimalField(max_digits=10, decimal_places=2)
     category = models.ForeignKey(EquipmentCategory, on_delete=models.CASCADE)
     images = models.ManyToManyField(Image, blank=True)
+    # En service ou non ; l'occupation par période est portée par les réservations
     available = models.BooleanField(default=True)
+    # Nombre d'exemplaires pouvant être loués en même temps
+    units = models.PositiveIntegerField(default=1)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['category', '-created_at', '-id'], name='equipment_cat_created_idx'),
+            models.Index(fields=['category', 'rental_price_per_day'], name='equipment_cat_price_idx'),
+            models.Index(fields=['-created_at', '-id'], name='equipment_created_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -118,6 +182,28 @@ class Order(models.Model):
     stripe_session_id = models.CharField(max_length=255, blank=True)
     stripe_payment_intent_id = models.CharField(max_length=255, blank=True)
 
+    # Fin de la réservation du stock tant que la commande n'est pas payée (None une fois réglée)
+    hold_expires_at = models.DateTimeField(null=True, blank=True)
+    # Stock et locations rendus par release_holds : à reprendre si la commande est confirmée ensuite
+    stock_released = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            # Commandes d'un client, les plus récentes d'abord (OrderViewSet, ETag par utilisateur)
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'),
+            # Toutes les commandes pour l'administration
+            models.Index(fields=['-created_at', '-id'], name='order_created_idx'),
+            # Files d'attente filtrées par statut de commande ou de paiement
+            models.Index(fields=['status', '-created_at'], name='order_status_created_idx'),
+            models.Index(fields=['payment_status', '-created_at'], name='order_payment_created_idx'),
+            # Webhook Stripe : seules les commandes passées par Stripe ont une session
+            models.Index(fields=['stripe_session_id'], name='order_stripe_session_idx',
+                         condition=~models.Q(stripe_session_id='')),
+            # Balayage des réservations expirées : seules les commandes non payées en ont une
+            models.Index(fields=['hold_expires_at'], name='order_hold_expires_idx',
+                         condition=models.Q(hold_expires_at__isnull=False)),
+        ]
+
     def __str__(self):
         return f"Order {self.id} by {self.user.username if self.user else 'Anonymous'}"
 
@@ -127,11 +213,63 @@ class OrderItem(models.Model):
     equipment = models.ForeignKey(Equipment, on_delete=models.CASCADE, null=True, blank=True)
     quantity = models.PositiveIntegerField()
     rental_days = models.PositiveIntegerField(default=0)
+    rental_start = models.DateField(null=True, blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
 
+    class Meta:
+        indexes = [
+            # Lignes d'une commande dans l'ordre d'ajout (détail, première ligne du résumé)
+            models.Index(fields=['order', 'id'], name='orderitem_order_id_idx'),
+        ]
+
     def __str__(self):
         return f"Item {self.id} in Order {self.order.id}"
 
+class StockHold(models.Model):
+    """Stock pris par une commande non payée, rendu si elle expire (Order.hold_expires_at)"""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='stock_holds')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_holds')
+    quantity = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product} pour la commande {self.order_id}"
+
+class ReservationQuerySet(models.QuerySet):
+    def overlapping(self, start, end):
+        """Réservations qui chevauchent la période [start, end)"""
+        if connections[self.db].vendor == 'postgresql':
+            # Opérateur && sur daterange : servi par l'index GiST créé dans la migration 0014
+            return self.filter(RawSQL(
+                'daterange("vente_reservation"."start_date", "vente_reservation"."end_date") && daterange(%s, %s)',
+                (start, end), output_field=BooleanField(),
+            ))
+        return self.filter(start_date__lt=end, end_date__gt=start)
+
+
+class Reservation(models.Model):
+    """Location d'un équipement sur une période [start_date, end_date) : la date de fin est exclue"""
+    equipment = models.ForeignKey(Equipment, on_delete=models.CASCADE, related_name='reservations')
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, null=True, blank=True, related_name='reservations')
+    start_date = models.DateField()
+    end_date = models.DateField()
+    quantity = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ReservationQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Réservations d'un équipement qui chevauchent une période (start_date < fin, end_date > début)
+            models.Index(fields=['equipment', 'start_date', 'end_date'], name='reservation_period_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(check=models.Q(end_date__gt=models.F('start_date')), name='reservation_end_after_start'),
+        ]
+
+    def __str__(self):
+        return f"{self.equipment} du {self.start_date} au {self.end_date}"
+
 class ContactMessage(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     name = models.CharField(max_length=100)
@@ -172,4 +310,107 @@ class Review(models.Model):
         return f"Avis de {self.name} - {self.rating} étoiles"
     
     def get_rating_display(self):
-        return f"{self.rating} étoile{'s' if self.rating > 1 else ''}"
\ No newline at end of file
+        return f"{self.rating} étoile{'s' if self.rating > 1 else ''}"
+
+class ReviewSummary(models.Model):
+    """
+    Statistiques des avis approuvés, tenues à jour à chaque création,
+    approbation ou suppression : une seule ligne (pk=1) à lire.
+    """
+    SINGLETON_ID = 1
+
+    count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.count} avis, moyenne {self.average}"
+
+    @property
+    def average(self):
+        return round(self.rating_sum / self.count, 2) if self.count else None
+
+    @property
+    def histogram(self):
+        return {str(rating): getattr(self, f'rating_{rating}') for rating, label in Review.RATING_CHOICES}
+
+    @classmethod
+    def record(cls, rating, delta):
+        """
+        Ajouter (delta=1) ou retirer (delta=-1) un avis approuvé.
+
+        Mise à jour par F() : atomique côté base, sans verrou ni lecture préalable.
+        À appeler dans la même transaction que l'écriture de l'avis.
+        """
+        updated = cls.objects.filter(pk=cls.SINGLETON_ID).update(**{
+            'count': models.F('count') + delta,
+            'rating_sum': models.F('rating_sum') + delta * rating,
+            f'rating_{rating}': models.F(f'rating_{rating}') + delta,
+            'updated_at': timezone.now(),
+        })
+        if not updated:
+            # Première utilisation : partir de l'état réel de la table
+            cls.rebuild()
+
+    @classmethod
+    def rebuild(cls):
+        """Recalculer les statistiques depuis les avis, en une seule agrégation"""
+        stats = Review.objects.filter(is_approved=True).aggregate(
+            count=models.Count('id'),
+            rating_sum=models.Sum('rating'),
+            **{
+                f'rating_{rating}': models.Count('id', filter=models.Q(rating=rating))
+                for rating, label in Review.RATING_CHOICES
+            },
+        )
+        stats['rating_sum'] = stats['rating_sum'] or 0
+        summary, created = cls.objects.update_or_create(pk=cls.SINGLETON_ID, defaults=stats)
+        return summary
+
+    @classmethod
+    def get(cls):
+        return cls.objects.filter(pk=cls.SINGLETON_ID).first() or cls.rebuild()
+
+
+class CartItem(models.Model):
+    """Ligne de panier (stockage DatabaseCartStore)"""
+    owner = models.CharField(max_length=100)
+    item_id = models.CharField(max_length=50)
+    item_type = models.CharField(max_length=20)
+    quantity = models.PositiveIntegerField(default=1)
+    days = models.PositiveIntegerField(default=0)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'item_id'], name='vente_cartitem_owner_item_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.owner} - {self.item_type} {self.item_id} x{self.quantity}"
+
+
+class IdempotencyKey(models.Model):
+    """Réponse enregistrée pour un en-tête Idempotency-Key (rejouée en cas de nouvel essai)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    scope = models.CharField(max_length=50)
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    # Vides tant que la première requête est en cours
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'scope', 'key'], name='vente_idempotency_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.key} ({self.user_id})"
@@ -0,0 +1,313 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Sum, Value, When
+from django.utils import timezone
+
+from .cache import bump_catalog_version
+from .models import Product, Equipment, Order, OrderItem, Reservation, StockHold
+from .reservations import peak_usage, rental_period, reserved_periods
+
+
+# Durée pendant laquelle le stock d'une commande non payée reste réservé
+DEFAULT_STOCK_HOLD_TIMEOUT = 60 * 30
+# Durée maximale de la réservation depuis la création de la commande, prolongations comprises
+DEFAULT_STOCK_HOLD_MAX_DURATION = 60 * 60 * 2
+# Durée minimale d'une session Checkout imposée par Stripe (30 minutes), plus une marge de latence
+STRIPE_MIN_SESSION = 60 * 30 + 30
+STRIPE_MAX_SESSION = 60 * 60 * 24 - 60
+# Prolongation accordée quand l'échéance est trop proche pour une session Stripe
+HOLD_EXTENSION = 60 * 32
+
+
+class OrderError(Exception):
+    """Commande refusée : message et code HTTP à renvoyer au client"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def lock_items(model, ids):
+    # Verrou des lignes dans un ordre stable : deux commandes concurrentes ne s'interbloquent pas
+    if not ids:
+        return {}
+    return model.objects.select_for_update().order_by('id').in_bulk(ids)
+
+
+def check_reservations(equipment, reservations):
+    """
+    Vérifier que chaque période demandée tient dans les exemplaires libres,
+    en comptant les réservations existantes et celles de la même commande.
+    """
+    start = min(reservation.start_date for reservation in reservations)
+    end = max(reservation.end_date for reservation in reservations)
+    periods = reserved_periods(list(equipment), start, end)
+    for reservation in reservations:
+        rented = equipment[reservation.equipment_id]
+        booked = periods[rented.id]
+        used = peak_usage(booked, reservation.start_date, reservation.end_date)
+        if not rented.available or used + reservation.quantity > rented.units:
+            raise OrderError(f'{rented.name} is not available for these dates', 409)
+        booked.append((reservation.start_date, reservation.end_date, reservation.quantity))
+
+
+def hold_expiry():
+    return timezone.now() + timedelta(seconds=getattr(settings, 'STOCK_HOLD_TIMEOUT', DEFAULT_STOCK_HOLD_TIMEOUT))
+
+
+def take_stock(product_quantities, products):
+    """Décrémenter le stock par des UPDATE conditionnels (stock >= quantité)"""
+    for product_id, quantity in product_quantities.items():
+        updated = Product.objects.filter(id=product_id, stock__gte=quantity).update(stock=F('stock') - quantity)
+        if not updated:
+            raise OrderError(f'Insufficient stock for {products[product_id].name}', 409)
+
+
+def place_order(user, lines, delivery_info):
+    """
+    Créer une commande de façon atomique.
+
+    `lines` est une liste validée de {'id', 'type', 'quantity', 'days', 'start_date'}.
+    Les articles sont lus et verrouillés en une requête par type, les lignes de
+    commande insérées avec un bulk_create, et le stock décrémenté par des UPDATE
+    conditionnels (stock >= quantité) : deux paiements simultanés ne peuvent pas
+    vendre plus que le stock. Les équipements sont réservés sur leur période de
+    location (verrou des lignes Equipment pendant la vérification). En cas de
+    manque, rien n'est écrit et OrderError est levée.
+
+    Le stock pris reste une réservation (StockHold) jusqu'au paiement : passé
+    `hold_expires_at`, la commande est annulée et le stock rendu par
+    release_expired_holds.
+    """
+    today = timezone.localdate()
+    product_quantities = defaultdict(int)
+    equipment_ids = set()
+    for line in lines:
+        if line['type'] == 'product':
+            product_quantities[line['id']] += line['quantity']
+        else:
+            equipment_ids.add(line['id'])
+
+    with transaction.atomic():
+        products = lock_items(Product, list(product_quantities))
+        equipment = lock_items(Equipment, sorted(equipment_ids))
+        if len(products) != len(product_quantities):
+            raise OrderError('Product not found', 404)
+        if len(equipment) != len(equipment_ids):
+            raise OrderError('Equipment not found', 404)
+
+        items, reservations, total_amount = [], [], 0
+        for line in lines:
+            if line['type'] == 'product':
+                product = products[line['id']]
+                total_amount += product.price * line['quantity']
+                items.append(OrderItem(product=product, quantity=line['quantity'], price=product.price))
+            else:
+                rented = equipment[line['id']]
+                start, end = rental_period(line.get('start_date') or today, line['days'])
+                total_amount += rented.rental_price_per_day * line['quantity'] * line['days']
+                items.append(OrderItem(equipment=rented, quantity=line['quantity'], rental_days=line['days'],
+                                       rental_start=start, price=rented.rental_price_per_day))
+                reservations.append(Reservation(equipment=rented, start_date=start, end_date=end,
+                                                quantity=line['quantity']))
+
+        take_stock(product_quantities, products)
+        if reservations:
+            check_reservations(equipment, reservations)
+
+        order = Order.objects.create(
+            user=user,
+            total_amount=total_amount,
+            session_key=None,
+            status='PENDING',
+            payment_status='PENDING',
+            hold_expires_at=hold_expiry(),
+            # Informations de livraison
+            requires_delivery=delivery_info.get('requires_delivery', False),
+            delivery_country=delivery_info.get('country', ''),
+            delivery_address=delivery_info.get('address', ''),
+            delivery_city=delivery_info.get('city', ''),
+            delivery_postal_code=delivery_info.get('postal_code', ''),
+            delivery_phone=delivery_info.get('phone', ''),
+            # Informations du destinataire
+            recipient_name=delivery_info.get('recipient_name', ''),
+            recipient_email=delivery_info.get('recipient_email', ''),
+            recipient_phone=delivery_info.get('recipient_phone', ''),
+        )
+        for item in items:
+            item.order = order
+        OrderItem.objects.bulk_create(items)
+        for reservation in reservations:
+            reservation.order = order
+        Reservation.objects.bulk_create(reservations)
+        StockHold.objects.bulk_create([
+            StockHold(order=order, product_id=product_id, quantity=quantity)
+            for product_id, quantity in product_quantities.items()
+        ])
+
+        # update() ne déclenche pas les signaux ; invalider après le commit pour ne pas
+        # remettre en cache l'ancien stock (les réservations ne changent pas les équipements)
+        if product_quantities:
+            transaction.on_commit(lambda: bump_catalog_version('product'))
+    return order
+
+
+def extend_hold(order):
+    """
+    Prolonger la réservation pour couvrir la session Stripe, qui dure au moins
+    30 minutes : Stripe refuse ensuite le paiement d'une commande expirée.
+
+    Une échéance encore assez lointaine est conservée : un nouvel essai envoie
+    à Stripe les mêmes paramètres avec la même clé d'idempotence. La réservation
+    ne dépasse jamais STOCK_HOLD_MAX_DURATION après la création de la commande.
+    Retourne la nouvelle échéance, ou None si la commande n'a pas de réservation.
+    """
+    if order.hold_expires_at is None:
+        return None
+    now = timezone.now()
+    expires_at = order.hold_expires_at
+    if expires_at < now + timedelta(seconds=STRIPE_MIN_SESSION):
+        limit = order.created_at + timedelta(
+            seconds=getattr(settings, 'STOCK_HOLD_MAX_DURATION', DEFAULT_STOCK_HOLD_MAX_DURATION))
+        expires_at = min(now + timedelta(seconds=HOLD_EXTENSION), limit)
+        if expires_at < now + timedelta(seconds=STRIPE_MIN_SESSION):
+            raise OrderError('Order expired', 409)
+    expires_at = min(expires_at, now + timedelta(seconds=STRIPE_MAX_SESSION))
+    # UPDATE conditionnel : le balayeur a pu annuler la commande entre-temps
+    updated = Order.objects.filter(pk=order.pk, status='PENDING', hold_expires_at__isnull=False).update(
+        hold_expires_at=expires_at, updated_at=now,
+    )
+    if not updated:
+        raise OrderError('Order expired', 409)
+    order.hold_expires_at = expires_at
+    return expires_at
+
+
+def release_holds(order_ids, status='CANCELLED'):
+    """
+    Rendre au stock les quantités réservées par des commandes et libérer leurs
+    périodes de location ; `status` devient le statut des commandes (None pour
+    ne pas le changer). Les commandes doivent être verrouillées par l'appelant.
+
+    Seules les commandes qui ont encore une réservation (hold_expires_at) rendent
+    leur stock : celui d'une commande confirmée est vendu et le reste. Elles sont
+    marquées stock_released pour que settle_order le reprenne.
+    Le stock est rendu par un seul UPDATE ... CASE sur les produits concernés.
+    Retourne le nombre d'unités rendues.
+    """
+    holding = {'order_id__in': order_ids, 'order__hold_expires_at__isnull': False}
+    quantities = dict(
+        StockHold.objects.filter(**holding).order_by()
+        .values('product_id').annotate(total=Sum('quantity')).values_list('product_id', 'total')
+    )
+    if quantities:
+        Product.objects.filter(id__in=quantities).update(stock=F('stock') + Case(
+            *[When(id=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+            default=Value(0),
+        ))
+        StockHold.objects.filter(**holding).delete()
+        transaction.on_commit(lambda: bump_catalog_version('product'))
+    Reservation.objects.filter(**holding).delete()
+    # Les valeurs de droite sont lues avant la mise à jour : hold_expires_at est encore l'ancienne
+    changes = {
+        'stock_released': Case(When(hold_expires_at__isnull=False, then=Value(True)), default=F('stock_released')),
+        'hold_expires_at': None,
+        'updated_at': timezone.now(),
+    }
+    if status:
+        changes['status'] = status
+    Order.objects.filter(id__in=order_ids).update(**changes)
+    return sum(quantities.values())
+
+
+def release_expired_holds(now=None, batch_size=500):
+    """
+    Annuler les commandes non payées dont la réservation a expiré et rendre leur
+    stock, par lots verrouillés (SKIP LOCKED : un webhook en cours de traitement
+    garde sa commande). Retourne (commandes annulées, unités rendues).
+    """
+    now = now or timezone.now()
+    orders = units = 0
+    while True:
+        with transaction.atomic():
+            ids = list(
+                Order.objects.select_for_update(skip_locked=True)
+                .filter(hold_expires_at__lte=now, status='PENDING').exclude(payment_status='PAID')
+                .order_by('hold_expires_at').values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            units += release_holds(ids)
+            orders += len(ids)
+    return orders, units
+
+
+def reclaim_stock(order):
+    """Reprendre le stock et les périodes de location rendus par release_holds"""
+    lines = [
+        {'id': item.product_id or item.equipment_id, 'type': 'product' if item.product_id else 'equipment',
+         'quantity': item.quantity, 'days': item.rental_days, 'start_date': item.rental_start}
+        for item in order.items.all()
+    ]
+    product_quantities = defaultdict(int)
+    for line in lines:
+        if line['type'] == 'product':
+            product_quantities[line['id']] += line['quantity']
+    products = lock_items(Product, list(product_quantities))
+    equipment = lock_items(Equipment, sorted({line['id'] for line in lines if line['type'] == 'equipment'}))
+    reservations = []
+    for line in lines:
+        if line['type'] == 'equipment' and line['id'] in equipment:
+            start, end = rental_period(line['start_date'] or timezone.localdate(), line['days'])
+            reservations.append(Reservation(order=order, equipment_id=line['id'], start_date=start, end_date=end,
+                                            quantity=line['quantity']))
+    take_stock(product_quantities, products)
+    if reservations:
+        check_reservations(equipment, reservations)
+        Reservation.objects.bulk_create(reservations)
+    if product_quantities:
+        transaction.on_commit(lambda: bump_catalog_version('product'))
+
+
+def settle_order(order):
+    """
+    Confirmer une commande verrouillée : le stock réservé devient une vente définitive.
+
+    Si la réservation a été rendue (stock_released : commande annulée par
+    expiration ou rejetée avant d'être réglée), le stock est repris s'il est
+    encore disponible, sinon OrderError est levée et rien n'est écrit : les
+    mêmes unités ne sont jamais vendues deux fois.
+    """
+    if order.stock_released:
+        with transaction.atomic():
+            reclaim_stock(order)
+        order.stock_released = False
+    StockHold.objects.filter(order=order).delete()
+    order.hold_expires_at = None
+    order.status = 'CONFIRMED'
+
+
+def confirm_payment(order, session_id):
+    """
+    Paiement reçu : la réservation de stock devient une vente définitive.
+
+    Si la commande a déjà rendu son stock et qu'il n'est plus disponible, elle
+    reste annulée, marquée payée, pour être remboursée.
+    """
+    with transaction.atomic():
+        order = Order.objects.select_for_update().get(pk=order.pk)
+        if order.payment_status == 'PAID':
+            # Webhook rejoué par Stripe
+            return order
+        try:
+            settle_order(order)
+        except OrderError:
+            pass
+        order.payment_status = 'PAID'
+        order.stripe_session_id = session_id
+        order.save()
+    return order
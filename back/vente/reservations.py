@@ -0,0 +1,74 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db.models import FilteredRelation, Q
+
+from .models import Equipment, Reservation
+
+
+def rental_period(start, days):
+    """Période [début, fin) d'une location de `days` jours"""
+    return start, start + timedelta(days=days)
+
+
+def peak_usage(periods, start, end):
+    """
+    Nombre maximal d'exemplaires loués en même temps sur [start, end).
+
+    `periods` est une liste de (début, fin, quantité). Balayage des débuts et
+    fins triés : une location qui se termine le jour où une autre commence ne
+    la chevauche pas (la fin passe avant le début à date égale).
+    """
+    events = []
+    for period_start, period_end, quantity in periods:
+        if period_start < end and period_end > start:
+            events.append((max(period_start, start), quantity))
+            events.append((min(period_end, end), -quantity))
+    peak = used = 0
+    for moment, change in sorted(events):
+        used += change
+        peak = max(peak, used)
+    return peak
+
+
+def reserved_periods(equipment_ids, start, end):
+    """Réservations existantes qui chevauchent [start, end), par équipement"""
+    periods = defaultdict(list)
+    rows = (
+        Reservation.objects.filter(equipment_id__in=equipment_ids).overlapping(start, end)
+        .values_list('equipment_id', 'start_date', 'end_date', 'quantity')
+    )
+    for equipment_id, period_start, period_end, quantity in rows:
+        periods[equipment_id].append((period_start, period_end, quantity))
+    return periods
+
+
+def equipment_availability(ids, start, end, quantity=1):
+    """
+    Disponibilité de plusieurs équipements sur [start, end) en une seule requête.
+
+    Jointure gauche des équipements sur leurs réservations qui chevauchent la
+    période (index reservation_period_idx), puis calcul du pic d'occupation.
+    Retourne {id: {'available': bool, 'remaining': exemplaires libres}} ; les
+    identifiants inconnus sont absents.
+    """
+    rows = (
+        Equipment.objects.filter(id__in=ids)
+        .annotate(booked=FilteredRelation(
+            'reservations',
+            condition=Q(reservations__start_date__lt=end, reservations__end_date__gt=start),
+        ))
+        .values_list('id', 'units', 'available', 'booked__start_date', 'booked__end_date', 'booked__quantity')
+    )
+    units, in_service, periods = {}, {}, defaultdict(list)
+    for equipment_id, total, available, period_start, period_end, booked in rows:
+        units[equipment_id] = total
+        in_service[equipment_id] = available
+        if period_start is not None:
+            periods[equipment_id].append((period_start, period_end, booked))
+
+    result = {}
+    for equipment_id, total in units.items():
+        remaining = max(total - peak_usage(periods[equipment_id], start, end), 0) if in_service[equipment_id] else 0
+        result[equipment_id] = {'available': remaining >= quantity, 'remaining': remaining}
+    return result
@@ -0,0 +1,61 @@
+import re
+
+from django.db import connection
+
+
+# Nombre maximal de mots pris en compte dans une recherche
+MAX_TERMS = 10
+
+# Configuration plein texte PostgreSQL : dictionnaire français sans accents
+# (créée par la migration 0006_catalog_search)
+POSTGRES_CONFIG = 'french_unaccent'
+
+# Table virtuelle FTS5 utilisée en local avec SQLite
+SQLITE_TABLE = 'vente_catalog_search'
+
+POSTGRES_SEARCH_SQL = f"""
+    SELECT 'product' AS kind, p.id, ts_rank_cd(p.search_vector, q) AS rank
+    FROM vente_product p, to_tsquery('{POSTGRES_CONFIG}', %s) q
+    WHERE p.search_vector @@ q
+    UNION ALL
+    SELECT 'equipment' AS kind, e.id, ts_rank_cd(e.search_vector, q) AS rank
+    FROM vente_equipment e, to_tsquery('{POSTGRES_CONFIG}', %s) q
+    WHERE e.search_vector @@ q
+    ORDER BY rank DESC, id DESC
+    LIMIT %s
+"""
+
+SQLITE_SEARCH_SQL = f"""
+    SELECT kind, item_id, -bm25({SQLITE_TABLE}, 10.0, 1.0) AS rank
+    FROM {SQLITE_TABLE}
+    WHERE {SQLITE_TABLE} MATCH %s
+    ORDER BY rank DESC, item_id DESC
+    LIMIT %s
+"""
+
+
+def get_terms(query):
+    """Découper la saisie utilisateur en mots, sans aucun opérateur de requête"""
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+
+def search_catalog(query, limit=20):
+    """
+    Rechercher dans le nom et la description des produits et équipements.
+
+    Chaque mot est cherché en préfixe (« perc » trouve « perceuse ») et sans
+    tenir compte des accents. Retourne une liste de (type, id, score) triée
+    par pertinence décroissante.
+    """
+    terms = get_terms(query)
+    if not terms:
+        return []
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            tsquery = ' & '.join(f'{term}:*' for term in terms)
+            cursor.execute(POSTGRES_SEARCH_SQL, [tsquery, tsquery, limit])
+        else:
+            match = ' '.join(f'"{term}"*' for term in terms)
+            cursor.execute(SQLITE_SEARCH_SQL, [match, limit])
+        return [(kind, item_id, float(rank)) for kind, item_id, rank in cursor.fetchall()]
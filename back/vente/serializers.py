@@ -1,6 +1,8 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.utils import timezone
 from .models import *
+from .images import attach_images
 import uuid
 
 class RefreshTokenSerializer(serializers.ModelSerializer):
@@ -8,25 +10,61 @@ class RefreshTokenSerializer(serializers.ModelSerializer):
         model = RefreshToken
         fields = ['token', 'expires_at']
 
+def absolute_url(url, request=None):
+    if request:
+        return request.build_absolute_uri(url)
+    # Fallback: construire l'URL manuellement
+    if url.startswith('http'):
+        return url
+    return f"https://flashxship.onrender.com{url}"
+
+def build_image_url(obj, request=None):
+    url = obj.get_url()
+    if not url:
+        return None
+    return absolute_url(url, request)
+
+def build_srcset(obj, request=None):
+    """{"webp": "url 200w, url 400w, ...", "jpeg": ...} à partir des déclinaisons enregistrées"""
+    return {
+        name: ', '.join(
+            f'{absolute_url(url, request)} {width}w'
+            for width, url in sorted(urls.items(), key=lambda item: int(item[0]))
+        )
+        for name, urls in (obj.derivatives or {}).items()
+    }
+
+class DynamicFieldsMixin:
+    """Limiter les champs sérialisés : Serializer(instance, fields=['id', 'name'])"""
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
 class ImageSerializer(serializers.ModelSerializer):
+    image = serializers.SerializerMethodField()
     image_url = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
     
     class Meta:
         model = Image
-        fields = ['id', 'image', 'image_url', 'uploaded_at']
+        fields = ['id', 'image', 'image_url', 'srcset', 'uploaded_at']
     
+    def get_image(self, obj):
+        # Même rendu que ImageField (URL absolue si la requête est connue), sans passer par le stockage
+        url = obj.get_url()
+        request = self.context.get('request')
+        if url and request:
+            return request.build_absolute_uri(url)
+        return url
+
     def get_image_url(self, obj):
-        if obj.image:
-            try:
-                request = self.context.get('request')
-                if request:
-                    return request.build_absolute_uri(obj.image.url)
-                # Fallback: construire l'URL manuellement
-                return f"https://flashxship.onrender.com{obj.image.url}"
-            except Exception as e:
-        
-                return f"https://flashxship.onrender.com{obj.image.url}"
-        return None
+        return build_image_url(obj, self.context.get('request'))
+
+    def get_srcset(self, obj):
+        return build_srcset(obj, self.context.get('request'))
 
 class ProductCategorySerializer(serializers.ModelSerializer):
     class Meta:
@@ -38,7 +76,7 @@ class EquipmentCategorySerializer(serializers.ModelSerializer):
         model = EquipmentCategory
         fields = ['id', 'name', 'description']
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     category = ProductCategorySerializer(read_only=True)
     category_id = serializers.PrimaryKeyRelatedField(queryset=ProductCategory.objects.all(), source='category', write_only=True)
     images = ImageSerializer(many=True, read_only=True)
@@ -52,10 +90,7 @@ class ProductSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         image_files = validated_data.pop('image_files', [])
         product = Product.objects.create(**validated_data)
-        for image_file in image_files:
-            if product.images.count() < 5:
-                image = Image.objects.create(image=image_file)
-                product.images.add(image)
+        attach_images(product, image_files, current_ids=())
         return product
 
     def update(self, instance, validated_data):
@@ -73,14 +108,11 @@ class ProductSerializer(serializers.ModelSerializer):
         instance = super().update(instance, validated_data)
         
         # Ajouter les nouvelles images
-        for image_file in image_files:
-            if instance.images.count() < 5:
-                image = Image.objects.create(image=image_file)
-                instance.images.add(image)
+        attach_images(instance, image_files)
         
         return instance
 
-class EquipmentSerializer(serializers.ModelSerializer):
+class EquipmentSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     category = EquipmentCategorySerializer(read_only=True)
     category_id = serializers.PrimaryKeyRelatedField(queryset=EquipmentCategory.objects.all(), source='category', write_only=True)
     images = ImageSerializer(many=True, read_only=True)
@@ -89,15 +121,12 @@ class EquipmentSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Equipment
-        fields = ['id', 'name', 'description', 'rental_price_per_day', 'category', 'category_id', 'images', 'image_files', 'existing_image_ids', 'available', 'created_at']
+        fields = ['id', 'name', 'description', 'rental_price_per_day', 'category', 'category_id', 'images', 'image_files', 'existing_image_ids', 'available', 'units', 'created_at']
 
     def create(self, validated_data):
         image_files = validated_data.pop('image_files', [])
         equipment = Equipment.objects.create(**validated_data)
-        for image_file in image_files:
-            if equipment.images.count() < 5:
-                image = Image.objects.create(image=image_file)
-                equipment.images.add(image)
+        attach_images(equipment, image_files, current_ids=())
         return equipment
 
     def update(self, instance, validated_data):
@@ -115,13 +144,87 @@ class EquipmentSerializer(serializers.ModelSerializer):
         instance = super().update(instance, validated_data)
         
         # Ajouter les nouvelles images
-        for image_file in image_files:
-            if instance.images.count() < 5:
-                image = Image.objects.create(image=image_file)
-                instance.images.add(image)
+        attach_images(instance, image_files)
         
         return instance
 
+class CardImageMixin:
+    """Première image d'un article, préchargée dans `card_images` par la vue"""
+    def get_first_image(self, obj):
+        images = getattr(obj, 'card_images', None)
+        if images is None:
+            images = obj.images.all()[:1]
+        return images[0] if images else None
+
+    def get_image_url(self, obj):
+        image = self.get_first_image(obj)
+        return build_image_url(image, self.context.get('request')) if image else None
+
+    def get_image_srcset(self, obj):
+        image = self.get_first_image(obj)
+        return build_srcset(image, self.context.get('request')) if image else {}
+
+class ProductCardSerializer(CardImageMixin, serializers.ModelSerializer):
+    """Représentation légère pour les listes (?view=card)"""
+    category_name = serializers.CharField(source='category.name', read_only=True)
+    image_url = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'price', 'stock', 'category_name', 'image_url', 'image_srcset']
+
+class EquipmentCardSerializer(CardImageMixin, serializers.ModelSerializer):
+    """Représentation légère pour les listes (?view=card)"""
+    category_name = serializers.CharField(source='category.name', read_only=True)
+    image_url = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Equipment
+        fields = ['id', 'name', 'rental_price_per_day', 'available', 'category_name', 'image_url', 'image_srcset']
+
+class ProductBulkUpdateSerializer(serializers.Serializer):
+    """Une ligne de mise à jour en masse : {id, price, stock}"""
+    id = serializers.IntegerField()
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    stock = serializers.IntegerField(min_value=0, required=False)
+
+class EquipmentBulkUpdateSerializer(serializers.Serializer):
+    """Une ligne de mise à jour en masse : {id, price, available}"""
+    id = serializers.IntegerField()
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False,
+                                     source='rental_price_per_day')
+    available = serializers.BooleanField(required=False)
+
+class CartOperationSerializer(serializers.Serializer):
+    """Une opération sur le panier : set (ajouter / remplacer), update (modifier) ou remove"""
+    op = serializers.ChoiceField(choices=['set', 'update', 'remove'])
+    item_id = serializers.IntegerField(min_value=1)
+    item_type = serializers.ChoiceField(choices=['product', 'equipment'], required=False)
+    quantity = serializers.IntegerField(min_value=1, required=False)
+    days = serializers.IntegerField(min_value=1, required=False)
+
+    def validate(self, data):
+        if data['op'] == 'set' and 'item_type' not in data:
+            raise serializers.ValidationError({'item_type': 'Obligatoire pour ajouter un article'})
+        return data
+
+
+class OrderLineSerializer(serializers.Serializer):
+    """Une ligne du panier envoyée à create_order"""
+    id = serializers.IntegerField(min_value=1)
+    type = serializers.ChoiceField(choices=['product', 'equipment'])
+    quantity = serializers.IntegerField(min_value=1)
+    days = serializers.IntegerField(min_value=1, default=1)
+    # Premier jour de location (équipements), aujourd'hui par défaut
+    start_date = serializers.DateField(required=False)
+
+    def validate_start_date(self, value):
+        if value < timezone.localdate():
+            raise serializers.ValidationError('La location ne peut pas commencer dans le passé')
+        return value
+
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -134,7 +237,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = OrderItem
-        fields = ['id', 'product', 'equipment', 'quantity', 'rental_days', 'price']
+        fields = ['id', 'product', 'equipment', 'quantity', 'rental_days', 'rental_start', 'price']
 
 class OrderSerializer(serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
@@ -147,9 +250,18 @@ class OrderSerializer(serializers.ModelSerializer):
             'total_amount', 'items', 'requires_delivery', 'delivery_country', 
             'delivery_address', 'delivery_city', 'delivery_postal_code', 
             'delivery_phone', 'recipient_name', 'recipient_email', 'recipient_phone',
-            'stripe_session_id', 'stripe_payment_intent_id'
+            'stripe_session_id', 'stripe_payment_intent_id', 'hold_expires_at'
         ]
 
+class OrderSummarySerializer(serializers.ModelSerializer):
+    """Liste allégée des commandes (?view=summary), champs calculés par annotations"""
+    item_count = serializers.IntegerField(read_only=True)
+    first_item_name = serializers.CharField(read_only=True, allow_null=True)
+
+    class Meta:
+        model = Order
+        fields = ['id', 'created_at', 'status', 'payment_status', 'total_amount', 'item_count', 'first_item_name']
+
 class ContactMessageSerializer(serializers.ModelSerializer):
     class Meta:
         model = ContactMessage
@@ -0,0 +1,37 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .cache import bump_catalog_version
+from .models import ProductCategory, EquipmentCategory, Image, Product, Equipment, Review
+
+
+CATALOG_MODELS = {
+    Product: 'product',
+    Equipment: 'equipment',
+    ProductCategory: 'product_category',
+    EquipmentCategory: 'equipment_category',
+    Image: 'image',
+    Review: 'review',
+}
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_catalog(sender, **kwargs):
+    name = CATALOG_MODELS.get(sender)
+    if name:
+        # Invalider après le commit : sinon une lecture concurrente remettrait l'ancien état en cache
+        transaction.on_commit(lambda: bump_catalog_version(name))
+
+
+@receiver(m2m_changed, sender=Product.images.through)
+def invalidate_product_images(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(lambda: bump_catalog_version('product'))
+
+
+@receiver(m2m_changed, sender=Equipment.images.through)
+def invalidate_equipment_images(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(lambda: bump_catalog_version('equipment'))
@@ -1,3 +1,1468 @@
-from django.test import TestCase
+import itertools
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest.mock import patch
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import InMemoryStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.utils import timezone
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from django.test.utils import CaptureQueriesContext
+from django.test import TestCase, TransactionTestCase, override_settings
+from PIL import Image as PILImage
+from rest_framework.test import APIClient
+import stripe
+
+from .cart import CacheCartStore, CartBusy, DatabaseCartStore, get_cart_store
+from .images import render_derivatives
+from .orders import OrderError, place_order
+from .reservations import peak_usage
+from .views import generate_access_token
+from .models import ProductCategory, EquipmentCategory, Product, Equipment, Image, Review, ReviewSummary, Order, OrderItem, CartItem, IdempotencyKey, Reservation, StockHold
+
+
+def create_catalog(count, images_per_item=2):
+    """Créer `count` produits et équipements avec leurs images"""
+    product_category = ProductCategory.objects.create(name='Produits', description='Catégorie de test')
+    equipment_category = EquipmentCategory.objects.create(name='Matériel', description='Catégorie de test')
+
+    products = Product.objects.bulk_create([
+        Product(name=f'Produit {i}', description='Description', price=Decimal('10.00'),
+                category=product_category, stock=5)
+        for i in range(count)
+    ])
+    equipment = Equipment.objects.bulk_create([
+        Equipment(name=f'Équipement {i}', description='Description', rental_price_per_day=Decimal('25.00'),
+                  category=equipment_category)
+        for i in range(count)
+    ])
+
+    images = Image.objects.bulk_create([
+        Image(image=f'images/test_{i}.jpg') for i in range(images_per_item)
+    ])
+    Product.images.through.objects.bulk_create([
+        Product.images.through(product_id=product.id, image_id=image.id)
+        for product in products for image in images
+    ])
+    Equipment.images.through.objects.bulk_create([
+        Equipment.images.through(equipment_id=item.id, image_id=image.id)
+        for item in equipment for image in images
+    ])
+    return products, equipment
+
+
+# Les réglages du projet envoient les fichiers vers Cloudinary : stockage en mémoire pour les tests
+local_storage = override_settings(
+    DEFAULT_FILE_STORAGE='django.core.files.storage.InMemoryStorage', MEDIA_URL='/media/',
+)
+
+
+class CatalogTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+
+class CatalogQueryBudgetTests(CatalogTestCase):
+    """Le nombre de requêtes d'une page du catalogue ne doit pas dépendre du nombre de lignes"""
+
+    # COUNT de la pagination + page avec jointure sur la catégorie + préchargement des images
+    LIST_QUERIES = 3
+    # Objet avec sa catégorie + préchargement des images
+    DETAIL_QUERIES = 2
+
+    def assert_list_budget(self, url, count):
+        with self.assertNumQueries(self.LIST_QUERIES):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], count)
+        first = response.json()['results'][0]
+        self.assertIn('name', first['category'])
+        self.assertEqual(len(first['images']), 2)
+
+    def assert_detail_budget(self, url):
+        with self.assertNumQueries(self.DETAIL_QUERIES):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['images']), 2)
+
+    def test_query_budget_by_catalog_size(self):
+        for count in (20, 100, 1000):
+            with self.subTest(count=count):
+                Product.objects.all().delete()
+                Equipment.objects.all().delete()
+                cache.clear()
+                products, equipment = create_catalog(count)
+
+                self.assert_list_budget('/products/', count)
+                self.assert_list_budget('/equipment/', count)
+                self.assert_detail_budget(f'/products/{products[-1].id}/')
+                self.assert_detail_budget(f'/equipment/{equipment[-1].id}/')
+
+
+class CatalogFilterTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tools = ProductCategory.objects.create(name='Outils')
+        self.parts = ProductCategory.objects.create(name='Pièces')
+        self.cheap = Product.objects.create(name='Clé', price=Decimal('5.00'), category=self.tools, stock=3)
+        self.expensive = Product.objects.create(name='Perceuse', price=Decimal('80.00'), category=self.tools, stock=0)
+        self.other = Product.objects.create(name='Vis', price=Decimal('1.00'), category=self.parts, stock=10)
+
+        self.rental = EquipmentCategory.objects.create(name='Location')
+        self.free = Equipment.objects.create(name='Nacelle', rental_price_per_day=Decimal('100.00'), category=self.rental)
+        self.rented = Equipment.objects.create(name='Grue', rental_price_per_day=Decimal('300.00'),
+                                               category=self.rental, available=False)
+
+    def ids(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.json()['results']]
+
+    def test_category_filter(self):
+        self.assertEqual(self.ids(f'/products/?category={self.tools.id}'), [self.expensive.id, self.cheap.id])
+
+    def test_price_range_and_ordering(self):
+        self.assertEqual(self.ids('/products/?min_price=2&max_price=80&ordering=price'),
+                         [self.cheap.id, self.expensive.id])
+        self.assertEqual(self.ids('/equipment/?ordering=-price'), [self.rented.id, self.free.id])
+
+    def test_available_filter(self):
+        self.assertEqual(self.ids('/products/?available=true&ordering=price'), [self.other.id, self.cheap.id])
+        self.assertEqual(self.ids('/equipment/?available=false'), [self.rented.id])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get('/products/?category=abc').status_code, 400)
+        self.assertEqual(self.client.get('/products/?ordering=name').status_code, 400)
+
+
+class KeysetPaginationTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        products, _ = create_catalog(45, images_per_item=1)
+        # Horodatages identiques pour vérifier le départage par id
+        Product.objects.filter(id__in=[p.id for p in products[:10]]).update(created_at=products[0].created_at)
+        self.expected = list(Product.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def test_walk_forward_and_back(self):
+        seen = []
+        url = '/products/?pagination=cursor'
+        pages = []
+        while url:
+            with self.assertNumQueries(2):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.json())
+            pages.append([item['id'] for item in response.json()['results']])
+            seen.extend(pages[-1])
+            url = response.json()['next']
+        self.assertEqual(seen, self.expected)
+        self.assertEqual([len(page) for page in pages], [20, 20, 5])
+
+        first = self.client.get('/products/?pagination=cursor')
+        response = self.client.get(first.json()['next'])
+        previous = self.client.get(response.json()['previous'])
+        self.assertEqual([item['id'] for item in previous.json()['results']], pages[0])
+        self.assertIsNone(previous.json()['previous'])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/products/?cursor=invalide').status_code, 404)
+        self.assertEqual(self.client.get('/products/?pagination=cursor&ordering=price').status_code, 400)
+
+    def test_page_number_mode_unchanged(self):
+        response = self.client.get('/products/?page=2')
+        self.assertEqual(response.json()['count'], 45)
+        self.assertEqual([item['id'] for item in response.json()['results']], self.expected[20:40])
+
+
+class CatalogCacheTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = ProductCategory.objects.create(name='Outils')
+        self.product = Product.objects.create(name='Clé', price=Decimal('5.00'), category=self.category, stock=3)
+
+    def test_hit_skips_database(self):
+        first = self.client.get('/products/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/products/')
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.content, first.content)
+
+    def test_query_params_are_part_of_the_key(self):
+        self.client.get('/products/?ordering=price')
+        with self.assertNumQueries(3):
+            self.client.get('/products/?ordering=-price')
+
+    def test_invalidated_on_save_and_delete(self):
+        self.client.get('/products/')
+        self.product.price = Decimal('7.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        self.assertEqual(self.client.get('/products/').json()['results'][0]['price'], '7.00')
+
+        self.category.name = 'Quincaillerie'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.save()
+        self.assertEqual(self.client.get('/products/').json()['results'][0]['category']['name'], 'Quincaillerie')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.delete()
+        self.assertEqual(self.client.get('/products/').json()['count'], 0)
+
+    def test_invalidated_on_image_link(self):
+        self.client.get(f'/products/{self.product.id}/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.images.add(Image.objects.create(image='images/test.jpg'))
+        self.assertEqual(len(self.client.get(f'/products/{self.product.id}/').json()['images']), 1)
+
+    def test_invalidated_only_after_commit(self):
+        self.client.get('/products/')
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.product.price = Decimal('7.00')
+            self.product.save()
+            # Aucune invalidation tant que la transaction n'est pas validée
+            self.assertEqual(self.client.get('/products/').json()['results'][0]['price'], '5.00')
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.client.get('/products/').json()['results'][0]['price'], '7.00')
+
+    def test_reviews_invalidated_on_new_review(self):
+        self.assertEqual(self.client.get('/reviews/').json(), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(name='Awa', email='awa@example.com', rating=5, comment='Parfait', is_approved=True)
+        self.assertEqual(len(self.client.get('/reviews/').json()), 1)
+
+
+class ConditionalGetTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = ProductCategory.objects.create(name='Outils')
+        self.product = Product.objects.create(name='Clé', price=Decimal('5.00'), category=self.category, stock=3)
+
+    def test_catalog_not_modified(self):
+        response = self.client.get('/products/')
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        self.product.stock = 0
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        response = self.client.get('/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_reviews_not_modified(self):
+        etag = self.client.get('/reviews/')['ETag']
+        self.assertEqual(self.client.get('/reviews/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_orders_not_modified(self):
+        user = User.objects.create_user(username='client', password='secret')
+        order = Order.objects.create(user=user, total_amount=Decimal('5.00'))
+        self.client.force_authenticate(user)
+
+        etag = self.client.get('/orders/')['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get('/orders/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        detail_etag = self.client.get(f'/orders/{order.id}/')['ETag']
+        order.status = 'CONFIRMED'
+        order.save()
+        self.assertEqual(self.client.get('/orders/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get(f'/orders/{order.id}/', HTTP_IF_NONE_MATCH=detail_etag).status_code, 200)
+
+
+class SearchTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        tools = ProductCategory.objects.create(name='Outils')
+        lifting = EquipmentCategory.objects.create(name='Levage')
+        self.drill = Product.objects.create(name='Perceuse électrique', description='Sans fil, 18V',
+                                            price=Decimal('80.00'), category=tools)
+        self.screw = Product.objects.create(name='Vis à bois', description='Pour perceuse',
+                                            price=Decimal('2.00'), category=tools)
+        self.crane = Equipment.objects.create(name='Grue mobile', description='Levage électrique',
+                                              rental_price_per_day=Decimal('300.00'), category=lifting)
+
+    def search(self, query):
+        response = self.client.get('/search/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [(hit['type'], hit['item']['id']) for hit in response.json()['results']]
+
+    def test_prefix_accent_insensitive_and_ranked(self):
+        # Le nom pèse plus que la description
+        self.assertEqual(self.search('perc'), [('product', self.drill.id), ('product', self.screw.id)])
+        self.assertEqual(set(self.search('electrique')), {('product', self.drill.id), ('equipment', self.crane.id)})
+        self.assertEqual(self.search('GRUE mob'), [('equipment', self.crane.id)])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.crane.name = 'Nacelle'
+        self.crane.save()
+        self.assertEqual(self.search('grue'), [])
+        self.assertEqual(self.search('nacelle'), [('equipment', self.crane.id)])
+
+        self.drill.delete()
+        self.assertEqual(self.search('perceuse'), [('product', self.screw.id)])
+
+    def test_query_syntax_is_ignored(self):
+        self.assertEqual(self.search('"perceuse"* -('), [('product', self.drill.id), ('product', self.screw.id)])
+        self.assertEqual(self.search('  '), [])
+
+
+class FacetTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tools = ProductCategory.objects.create(name='Outils')
+        self.garden = ProductCategory.objects.create(name='Jardin')
+        Product.objects.bulk_create([
+            Product(name='Perceuse', price=Decimal('80.00'), stock=3, category=self.tools),
+            Product(name='Marteau', price=Decimal('12.00'), stock=0, category=self.tools),
+            Product(name='Scie', price=Decimal('35.00'), stock=1, category=self.tools),
+            Product(name='Râteau', price=Decimal('20.00'), stock=5, category=self.garden),
+        ])
+
+    def facets(self, **params):
+        response = self.client.get('/catalog/facets/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_counts_and_buckets_in_two_queries(self):
+        with self.assertNumQueries(2):
+            facets = self.facets(buckets=4)
+        self.assertEqual(facets['total'], 4)
+        self.assertEqual(facets['categories'], [
+            {'id': self.garden.id, 'name': 'Jardin', 'count': 1},
+            {'id': self.tools.id, 'name': 'Outils', 'count': 3},
+        ])
+        self.assertEqual(facets['availability'], {'in_stock': 3, 'out_of_stock': 1})
+        self.assertEqual(facets['price']['buckets'], [
+            {'min': 0.0, 'max': 20.0, 'count': 1},
+            {'min': 20.0, 'max': 40.0, 'count': 2},
+            {'min': 40.0, 'max': 60.0, 'count': 0},
+            {'min': 60.0, 'max': 80.0, 'count': 1},
+        ])
+
+        # Deuxième appel : servi depuis le cache
+        with self.assertNumQueries(0):
+            self.facets(buckets=4)
+
+    def test_each_facet_ignores_its_own_filter(self):
+        facets = self.facets(category=self.tools.id, available='true', max_price='50')
+        self.assertEqual(facets['total'], 1)
+        # Les autres catégories restent proposées
+        self.assertEqual({c['name']: c['count'] for c in facets['categories']}, {'Outils': 1, 'Jardin': 1})
+        self.assertEqual(facets['availability'], {'in_stock': 1, 'out_of_stock': 1})
+        # L'histogramme ignore max_price
+        self.assertEqual(sum(bucket['count'] for bucket in facets['price']['buckets']), 2)
+
+    def test_invalidated_by_catalog_changes(self):
+        self.assertEqual(self.facets()['total'], 4)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='Pelle', price=Decimal('15.00'), stock=2, category=self.garden)
+        self.assertEqual(self.facets()['total'], 5)
+
+    def test_equipment_and_invalid_params(self):
+        lifting = EquipmentCategory.objects.create(name='Levage')
+        Equipment.objects.create(name='Grue', rental_price_per_day=Decimal('300.00'), available=False, category=lifting)
+        facets = self.facets(type='equipment')
+        self.assertEqual(facets['availability'], {'in_stock': 0, 'out_of_stock': 1})
+        self.assertEqual(facets['price']['buckets'], [{'min': 300.0, 'max': 300.0, 'count': 1}])
+
+        self.assertEqual(self.client.get('/catalog/facets/', {'type': 'order'}).status_code, 400)
+        self.assertEqual(self.client.get('/catalog/facets/', {'buckets': 99}).status_code, 400)
+        self.assertEqual(self.client.get('/catalog/facets/', {'buckets': 0}).status_code, 400)
+        self.assertEqual(self.client.get('/catalog/facets/', {'min_price': 'abc'}).status_code, 400)
+        for value in ('NaN', 'sNaN', 'Infinity', '-inf'):
+            self.assertEqual(self.client.get('/catalog/facets/', {'min_price': value}).status_code, 400)
+            self.assertEqual(self.client.get('/products/', {'max_price': value}).status_code, 400)
+
+
+class ReviewSummaryTests(CatalogTestCase):
+    def post_review(self, rating):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/reviews/create/', {
+                'name': 'Awa', 'email': 'awa@example.com', 'rating': rating, 'comment': 'Avis',
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def summary(self):
+        response = self.client.get('/reviews/summary/')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_maintained_on_create_approve_and_delete(self):
+        self.assertEqual(self.summary(), {
+            'count': 0, 'average': None, 'histogram': {'1': 0, '2': 0, '3': 0, '4': 0, '5': 0},
+        })
+        first = self.post_review(5)
+        self.post_review(4)
+        self.post_review(4)
+        self.assertEqual(self.summary(), {
+            'count': 3, 'average': 4.33, 'histogram': {'1': 0, '2': 0, '3': 0, '4': 2, '5': 1},
+        })
+
+        self.client.force_authenticate(User.objects.create_user(username='admin', password='secret', is_staff=True))
+        with self.captureOnCommitCallbacks(execute=True):
+            pending = Review.objects.create(name='Moussa', email='m@example.com', rating=1, comment='Bof')
+            self.assertEqual(self.client.put(f'/reviews/{pending.id}/').status_code, 200)
+            # Approuver deux fois ne compte l'avis qu'une fois
+            self.assertEqual(self.client.put(f'/reviews/{pending.id}/').status_code, 200)
+            self.assertEqual(self.client.delete(f'/reviews/{first}/').status_code, 204)
+            # Un avis déjà supprimé n'est pas décompté une seconde fois
+            self.assertEqual(self.client.delete(f'/reviews/{first}/').status_code, 404)
+
+        summary = self.summary()
+        self.assertEqual((summary['count'], summary['average']), (3, 3.0))
+        self.assertEqual(summary['histogram'], {'1': 1, '2': 0, '3': 0, '4': 2, '5': 0})
+        self.assertEqual(ReviewSummary.rebuild().histogram, summary['histogram'])
+
+    def test_single_row_read(self):
+        self.post_review(3)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.summary()['count'], 1)
+        with self.assertNumQueries(0):
+            self.summary()
+
+
+class CartPricingTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='client', password='secret')
+        self.client.force_authenticate(self.user)
+        products, equipment = create_catalog(30)
+        # Le panier est indexé par identifiant seul : produits et équipements sans identifiant commun
+        self.products, self.equipment = products[:15], equipment[15:]
+
+    def add(self, item, kind, quantity=1, days=1):
+        response = self.client.post('/cart/', {'item_id': item.id, 'item_type': kind, 'quantity': quantity, 'days': days})
+        self.assertEqual(response.status_code, 200)
+
+    def test_constant_queries_and_totals(self):
+        for product in self.products:
+            self.add(product, 'product', quantity=2)
+        for equipment in self.equipment:
+            self.add(equipment, 'equipment', days=3)
+
+        # session + (in_bulk + images) pour les produits puis pour les équipements
+        with self.assertNumQueries(5):
+            response = self.client.get('/cart/')
+        cart = response.json()
+        self.assertEqual(len(cart['items']), 30)
+        expected = sum(p.price * 2 for p in self.products) + sum(e.rental_price_per_day * 3 for e in self.equipment)
+        self.assertEqual(Decimal(str(cart['total'])), expected)
+        self.assertEqual(len(cart['items'][0]['item']['images']), 2)
+
+    def test_missing_items_removed(self):
+        self.add(self.products[0], 'product')
+        self.add(self.products[1], 'product')
+        self.products[0].delete()
+
+        self.assertEqual(len(self.client.get('/cart/').json()['items']), 1)
+        self.assertEqual(list(get_cart_store().get(f'user:{self.user.id}')), [str(self.products[1].id)])
+
+
+class CartStoreTestsMixin:
+    store_class = None
+
+    def setUp(self):
+        super().setUp()
+        self.store = self.store_class()
+
+    def test_per_item_updates_and_merge(self):
+        self.store.set_item('session:abc', 1, {'type': 'product', 'quantity': 2, 'days': 0})
+        self.store.set_item('session:abc', 2, {'type': 'equipment', 'quantity': 1, 'days': 3})
+        self.store.set_item('session:abc', 1, {'type': 'product', 'quantity': 5, 'days': 0})
+        self.store.set_item('user:1', 2, {'type': 'equipment', 'quantity': 1, 'days': 5})
+        self.assertEqual(self.store.get('session:abc')['1']['quantity'], 5)
+
+        self.store.merge('session:abc', 'user:1')
+        self.assertEqual(self.store.get('session:abc'), {})
+        self.assertEqual(self.store.get('user:1'), {
+            '1': {'type': 'product', 'quantity': 5, 'days': 0},
+            '2': {'type': 'equipment', 'quantity': 2, 'days': 5},
+        })
+
+        self.store.remove_items('user:1', ['2'])
+        self.assertEqual(list(self.store.get('user:1')), ['1'])
+        self.store.clear('user:1')
+        self.assertEqual(self.store.get('user:1'), {})
+
+
+class CacheCartStoreTests(CartStoreTestsMixin, CatalogTestCase):
+    store_class = CacheCartStore
+
+    def test_concurrent_adds_are_not_lost(self):
+        def add(item_id):
+            self.store.set_item('user:1', item_id, {'type': 'product', 'quantity': 1, 'days': 0})
+
+        threads = [threading.Thread(target=add, args=(item_id,)) for item_id in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.store.get('user:1')), 10)
+
+    @patch.object(CacheCartStore, 'lock_attempts', 2)
+    def test_busy_lock_is_neither_bypassed_nor_released(self):
+        lock = f"{self.store.key('user:1')}:lock"
+        cache.add(lock, 'autre-ecrivain', 5)
+        with self.assertRaises(CartBusy):
+            self.store.set_item('user:1', 1, {'type': 'product', 'quantity': 1, 'days': 0})
+        self.assertEqual(self.store.get('user:1'), {})
+        self.assertEqual(cache.get(lock), 'autre-ecrivain')
+
+        # Vue : 409 plutôt qu'une écriture sans verrou
+        user = User.objects.create_user(username='client', password='secret')
+        self.client.force_authenticate(user)
+        products, equipment = create_catalog(1)
+        cache.add(f"{self.store.key(f'user:{user.id}')}:lock", 'autre-ecrivain', 5)
+        with override_settings(CART_STORE='vente.cart.CacheCartStore'):
+            response = self.client.post('/cart/', {'item_id': products[0].id, 'item_type': 'product'})
+        self.assertEqual(response.status_code, 409)
+
+
+class DatabaseCartStoreTests(CartStoreTestsMixin, CatalogTestCase):
+    store_class = DatabaseCartStore
+
+    def test_expired_carts_ignored_and_swept(self):
+        self.store.set_item('session:old', 1, {'type': 'product', 'quantity': 1, 'days': 0})
+        self.store.set_item('session:new', 1, {'type': 'product', 'quantity': 1, 'days': 0})
+        CartItem.objects.filter(owner='session:old').update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(self.store.get('session:old'), {})
+        call_command('clear_expired_carts', stdout=StringIO())
+        self.assertEqual(list(CartItem.objects.values_list('owner', flat=True)), ['session:new'])
+
+
+class CartViewTests(CatalogTestCase):
+    def test_anonymous_cart_merged_on_login(self):
+        products, equipment = create_catalog(2)
+        # L'ajout anonyme passe par POST /cart/, refusé sans authentification : on remplit le stockage
+        get_cart_store().set_item(f'session:{self.client.session.session_key}', products[0].id,
+                                  {'type': 'product', 'quantity': 2, 'days': 0})
+        self.assertEqual(len(self.client.get('/cart/').json()['items']), 1)
+
+        user = User.objects.create_user(username='client', password='secret')
+        self.client.force_authenticate(user)
+        self.assertEqual(self.client.get('/cart/').json()['items'], [])
+        self.assertEqual(self.client.post('/merge-cart/').status_code, 200)
+        self.assertEqual(self.client.get('/cart/').json()['items'][0]['quantity'], 2)
+        # Aucune écriture du panier dans la session Django
+        self.assertNotIn('cart', ''.join(self.client.session.keys()))
+
+    def test_invalid_add_rejected_before_writing(self):
+        products, equipment = create_catalog(1)
+        self.client.force_authenticate(User.objects.create_user(username='client', password='secret'))
+        for body in ({'item_id': products[0].id, 'item_type': 'product', 'quantity': -1},
+                     {'item_id': products[0].id, 'quantity': 2},
+                     {'item_id': 'abc', 'item_type': 'product'},
+                     [{'item_id': products[0].id, 'item_type': 'product'}]):
+            self.assertEqual(self.client.post('/cart/', body, format='json').status_code, 400)
+        self.assertFalse(CartItem.objects.exists())
+
+
+class CartOperationTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(User.objects.create_user(username='client', password='secret'))
+        products, equipment = create_catalog(4)
+        self.products, self.equipment = products[:2], equipment[2:]
+        self.client.post('/cart/', {'item_id': self.products[0].id, 'item_type': 'product', 'quantity': 1})
+        self.client.post('/cart/', {'item_id': self.equipment[0].id, 'item_type': 'equipment', 'days': 2})
+
+    def test_patch_returns_line_and_total(self):
+        # lecture du panier x2 + prix des produits + prix des équipements + écriture (BEGIN/UPSERT/UPDATE/COMMIT)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(f'/cart/{self.products[0].id}/', {'quantity': 3}, format='json')
+        self.assertLessEqual(len(queries), 8)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['line'], {
+            'item_id': str(self.products[0].id), 'type': 'product', 'quantity': 3, 'unit_price': 10.0, 'total': 30.0,
+        })
+        self.assertEqual(response.json()['total'], 80.0)
+
+        response = self.client.patch(f'/cart/{self.equipment[0].id}/', {'days': 4}, format='json')
+        self.assertEqual(response.json()['line']['days'], 4)
+        self.assertEqual(response.json()['total'], 130.0)
+
+    def test_delete_and_missing_lines(self):
+        response = self.client.delete(f'/cart/{self.products[0].id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'lines': [], 'removed': [str(self.products[0].id)], 'total': 50.0})
+        self.assertEqual(self.client.delete(f'/cart/{self.products[0].id}/').status_code, 404)
+        self.assertEqual(self.client.patch('/cart/999/', {'quantity': 2}, format='json').status_code, 404)
+
+    def test_bulk_operations_are_all_or_nothing(self):
+        response = self.client.post('/cart/ops/', {'ops': [
+            {'op': 'set', 'item_id': self.products[1].id, 'item_type': 'product', 'quantity': 2},
+            {'op': 'remove', 'item_id': self.equipment[0].id},
+            {'op': 'update', 'item_id': self.products[0].id, 'quantity': 5},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([line['quantity'] for line in response.json()['lines']], [2, 5])
+        self.assertEqual(response.json()['total'], 70.0)
+
+        response = self.client.post('/cart/ops/', {'ops': [
+            {'op': 'set', 'item_id': self.products[1].id, 'item_type': 'product', 'quantity': 9},
+            {'op': 'set', 'item_id': 999, 'item_type': 'product'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], {'1': 'Article introuvable'})
+        self.assertEqual(self.client.get('/cart/').json()['total'], 70.0)
+        self.assertEqual(self.client.post('/cart/ops/', {'ops': [{'op': 'set', 'item_id': 1}]}, format='json').status_code, 400)
+        # Un tableau JSON à la place de l'objet attendu
+        self.assertEqual(self.client.post('/cart/ops/', [{'op': 'remove', 'item_id': 1}], format='json').status_code, 400)
+        self.assertEqual(self.client.patch(f'/cart/{self.products[1].id}/', ['quantity'], format='json').status_code, 400)
+
+
+class CreateOrderTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='client', password='secret')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {generate_access_token(self.user)}')
+        self.category = ProductCategory.objects.create(name='Outils')
+        self.drill = Product.objects.create(name='Perceuse', price=Decimal('80.00'), stock=3, category=self.category)
+        self.screw = Product.objects.create(name='Vis', price=Decimal('0.50'), stock=100, category=self.category)
+        self.crane = Equipment.objects.create(name='Grue', rental_price_per_day=Decimal('300.00'),
+                                              category=EquipmentCategory.objects.create(name='Levage'))
+
+    def order(self, items):
+        return self.client.post('/create-order/', {'items': items, 'delivery_info': {'city': 'Dakar'}}, format='json')
+
+    def test_created_with_bulk_inserts(self):
+        items = [
+            {'id': self.drill.id, 'type': 'product', 'quantity': 2},
+            {'id': self.screw.id, 'type': 'product', 'quantity': 40},
+            {'id': self.crane.id, 'type': 'equipment', 'quantity': 1, 'days': 3},
+        ]
+        # utilisateur + 2 SELECT ... FOR UPDATE + 2 UPDATE de stock + réservations existantes
+        # + INSERT commande + bulk_create des lignes, des réservations et du stock réservé
+        # (+ SAVEPOINT / RELEASE)
+        with self.assertNumQueries(12):
+            response = self.order(items)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Decimal(str(response.json()['total_amount'])), Decimal('1080.00'))
+
+        order = Order.objects.get(id=response.json()['order_id'])
+        self.assertEqual((order.delivery_city, order.items.count()), ('Dakar', 3))
+        self.drill.refresh_from_db()
+        self.crane.refresh_from_db()
+        self.assertEqual((self.drill.stock, self.crane.available), (1, True))
+        self.assertEqual(order.reservations.get().end_date - order.reservations.get().start_date, timedelta(days=3))
+
+    def test_short_stock_rolls_back_everything(self):
+        response = self.order([
+            {'id': self.screw.id, 'type': 'product', 'quantity': 10},
+            {'id': self.drill.id, 'type': 'product', 'quantity': 2},
+            {'id': self.drill.id, 'type': 'product', 'quantity': 2},
+        ])
+        self.assertEqual(response.status_code, 409)
+        self.screw.refresh_from_db()
+        self.assertEqual(self.screw.stock, 100)
+        self.assertFalse(Order.objects.exists())
+
+    def test_invalid_items(self):
+        self.assertEqual(self.order([]).status_code, 400)
+        self.assertEqual(self.order([{'id': self.drill.id, 'type': 'product', 'quantity': 0}]).status_code, 400)
+        self.assertEqual(self.order([{'id': 999, 'type': 'product', 'quantity': 1}]).status_code, 404)
+
+
+class ReservationTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='client', password='secret')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {generate_access_token(self.user)}')
+        self.category = EquipmentCategory.objects.create(name='Levage')
+        self.crane = Equipment.objects.create(name='Grue', rental_price_per_day=Decimal('300.00'),
+                                              category=self.category, units=2)
+        self.start = timezone.localdate() + timedelta(days=7)
+
+    def rent(self, equipment, start, days, quantity=1):
+        item = {'id': equipment.id, 'type': 'equipment', 'quantity': quantity, 'days': days,
+                'start_date': start.isoformat()}
+        return self.client.post('/create-order/', {'items': [item], 'delivery_info': {}}, format='json')
+
+    def availability(self, ids, start, end, **params):
+        return self.client.get('/equipment/availability/', {
+            'ids': ','.join(str(pk) for pk in ids), 'start': start.isoformat(), 'end': end.isoformat(), **params,
+        })
+
+    def test_peak_usage(self):
+        day = self.start
+        periods = [(day, day + timedelta(days=2), 1), (day + timedelta(days=2), day + timedelta(days=4), 1),
+                   (day + timedelta(days=1), day + timedelta(days=3), 2)]
+        self.assertEqual(peak_usage(periods[:2], day, day + timedelta(days=4)), 1)
+        self.assertEqual(peak_usage(periods, day, day + timedelta(days=4)), 3)
+        self.assertEqual(peak_usage(periods, day + timedelta(days=3), day + timedelta(days=5)), 1)
+
+    def test_orders_reserve_dates_instead_of_blocking_the_item(self):
+        self.assertEqual(self.rent(self.crane, self.start, 3, quantity=2).status_code, 201)
+        self.assertEqual(self.rent(self.crane, self.start + timedelta(days=2), 2).status_code, 409)
+        # Location qui commence le jour du retour : pas de chevauchement
+        self.assertEqual(self.rent(self.crane, self.start + timedelta(days=3), 2).status_code, 201)
+        self.assertEqual(self.rent(self.crane, self.start - timedelta(days=10), 1).status_code, 400)
+
+        order = Order.objects.order_by('id').first()
+        item = order.items.get()
+        self.assertEqual((item.rental_start, item.rental_days), (self.start, 3))
+        self.crane.refresh_from_db()
+        self.assertTrue(self.crane.available)
+
+        admin = User.objects.create_user(username='admin', password='secret', is_staff=True)
+        self.client.force_authenticate(admin)
+        self.client.post(f'/api/admin/orders/{order.id}/reject/')
+        self.assertFalse(order.reservations.exists())
+        self.assertEqual(self.rent(self.crane, self.start + timedelta(days=2), 1).status_code, 201)
+
+    def test_bulk_availability_in_one_query(self):
+        fleet = Equipment.objects.bulk_create([
+            Equipment(name=f'Nacelle {i}', rental_price_per_day=Decimal('50.00'), category=self.category,
+                      units=2, available=i != 5)
+            for i in range(199)
+        ])
+        day = self.start
+        Reservation.objects.bulk_create(
+            [Reservation(equipment=fleet[0], start_date=day, end_date=day + timedelta(days=5), quantity=2),
+             Reservation(equipment=fleet[1], start_date=day, end_date=day + timedelta(days=2)),
+             Reservation(equipment=fleet[1], start_date=day + timedelta(days=2), end_date=day + timedelta(days=4)),
+             Reservation(equipment=fleet[2], start_date=day - timedelta(days=9), end_date=day)]
+        )
+        ids = [item.id for item in fleet] + [999999]
+        self.client.credentials()
+        with self.assertNumQueries(1):
+            response = self.availability(ids, day, day + timedelta(days=4))
+        self.assertEqual(response.status_code, 200)
+        results = {row['id']: row for row in response.json()['results']}
+        self.assertEqual(len(results), 199)
+        self.assertEqual(results[fleet[0].id], {'id': fleet[0].id, 'available': False, 'remaining': 0})
+        self.assertEqual(results[fleet[1].id]['remaining'], 1)
+        self.assertEqual(results[fleet[2].id]['remaining'], 2)
+        self.assertFalse(results[fleet[5].id]['available'])
+
+        results = {row['id']: row for row in self.availability(
+            ids[:3], day, day + timedelta(days=4), quantity=2).json()['results']}
+        self.assertEqual([results[item.id]['available'] for item in fleet[:3]], [False, False, True])
+
+    def test_availability_validation(self):
+        day = self.start
+        self.assertEqual(self.availability([self.crane.id], day, day).status_code, 400)
+        self.assertEqual(self.availability(range(1, 202), day, day + timedelta(days=1)).status_code, 400)
+        self.assertEqual(self.client.get('/equipment/availability/', {'ids': 'a', 'start': day, 'end': day}).status_code, 400)
+        self.assertEqual(self.client.get('/equipment/availability/').status_code, 400)
+
+
+class StockHoldTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='client', password='secret')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {generate_access_token(self.user)}')
+        category = ProductCategory.objects.create(name='Outils')
+        self.drill = Product.objects.create(name='Perceuse', price=Decimal('80.00'), stock=3, category=category)
+        self.screw = Product.objects.create(name='Vis', price=Decimal('0.50'), stock=100, category=category)
+        self.crane = Equipment.objects.create(name='Grue', rental_price_per_day=Decimal('300.00'),
+                                              category=EquipmentCategory.objects.create(name='Levage'))
+
+    def order(self, *lines):
+        items = [{'id': product.id, 'type': 'product', 'quantity': quantity} for product, quantity in lines]
+        response = self.client.post('/create-order/', {'items': items, 'delivery_info': {}}, format='json')
+        self.assertEqual(response.status_code, 201)
+        return Order.objects.get(id=response.json()['order_id'])
+
+    def expire(self, *orders):
+        Order.objects.filter(id__in=[order.id for order in orders]).update(
+            hold_expires_at=timezone.now() - timedelta(minutes=1))
+
+    def webhook(self, order, kind='checkout.session.completed', session_id=None):
+        session = {'id': session_id or f'cs_{order.id}', 'metadata': {'order_id': order.id}}
+        event = {'type': kind, 'data': {'object': session}}
+        with patch('stripe.Webhook.construct_event', return_value=event):
+            self.client.post('/stripe-webhook/', {}, format='json')
+        order.refresh_from_db()
+
+    def stock(self):
+        return tuple(Product.objects.order_by('id').values_list('stock', flat=True))
+
+    def test_sweeper_releases_expired_holds_in_bulk(self):
+        first = self.order((self.drill, 2), (self.screw, 10))
+        second = self.order((self.drill, 1), (self.screw, 5))
+        kept = self.order((self.screw, 1))
+        self.assertEqual((self.stock(), first.stock_holds.count()), ((0, 84), 2))
+        self.expire(first, second)
+
+        with CaptureQueriesContext(connection) as queries:
+            call_command('release_expired_holds', grace=0, stdout=StringIO())
+        self.assertEqual(sum('UPDATE "vente_product"' in query['sql'] for query in queries), 1)
+        self.assertEqual(self.stock(), (3, 99))
+        self.assertEqual(list(Order.objects.order_by('id').values_list('status', flat=True)),
+                         ['CANCELLED', 'CANCELLED', 'PENDING'])
+        self.assertEqual(list(StockHold.objects.values_list('order_id', flat=True)), [kept.id])
+
+        call_command('release_expired_holds', grace=0, stdout=StringIO())
+        self.assertEqual(self.stock(), (3, 99))
+
+    def test_payment_converts_holds_to_sales(self):
+        order = self.order((self.drill, 2))
+        self.webhook(order)
+        self.assertEqual((order.status, order.payment_status, order.hold_expires_at), ('CONFIRMED', 'PAID', None))
+        self.assertFalse(order.stock_holds.exists())
+        self.expire(order)
+        call_command('release_expired_holds', grace=0, stdout=StringIO())
+        self.assertEqual(self.stock()[0], 1)
+
+    def test_late_payment_after_expiry(self):
+        late = self.order((self.drill, 2))
+        self.expire(late)
+        call_command('release_expired_holds', grace=0, stdout=StringIO())
+        self.webhook(late)
+        self.assertEqual((late.status, late.payment_status, self.stock()[0]), ('CONFIRMED', 'PAID', 1))
+
+        # Stock revendu entre-temps : commande payée mais annulée, à rembourser
+        refused = self.order((self.drill, 1))
+        self.expire(refused)
+        call_command('release_expired_holds', grace=0, stdout=StringIO())
+        self.order((self.drill, 1))
+        self.webhook(refused)
+        self.assertEqual((refused.status, refused.payment_status, self.stock()[0]), ('CANCELLED', 'PAID', 0))
+
+    def test_abandoned_session_releases_immediately(self):
+        order = self.order((self.drill, 3))
+        Order.objects.filter(pk=order.pk).update(stripe_session_id='cs_second')
+        # Une session plus ancienne expire : la session courante peut encore être payée
+        self.webhook(order, kind='checkout.session.expired', session_id='cs_first')
+        self.assertEqual((order.status, self.stock()[0]), ('PENDING', 0))
+
+        self.webhook(order, kind='checkout.session.expired', session_id='cs_second')
+        self.assertEqual((order.status, self.stock()[0]), ('CANCELLED', 3))
+        response = self.client.post('/create_payment_session/', {'order_id': order.id}, format='json')
+        self.assertEqual(response.status_code, 409)
+
+    def test_admin_confirm_after_release_never_sells_twice(self):
+        admin = User.objects.create_user(username='admin', password='secret', is_staff=True)
+        expired = self.order((self.drill, 2))
+        self.expire(expired)
+        call_command('release_expired_holds', grace=0, stdout=StringIO())
+        self.order((self.drill, 2))
+        self.client.force_authenticate(admin)
+        response = self.client.post(f'/api/admin/orders/{expired.id}/confirm/')
+        expired.refresh_from_db()
+        self.assertEqual((response.status_code, expired.status, self.stock()[0]), (409, 'CANCELLED', 1))
+
+        rejected = self.order((self.drill, 1))
+        self.client.post(f'/api/admin/orders/{rejected.id}/reject/')
+        self.assertEqual(self.stock()[0], 1)
+        # Stock encore disponible : repris à la confirmation
+        self.assertEqual(self.client.post(f'/api/admin/orders/{rejected.id}/confirm/').status_code, 200)
+        rejected.refresh_from_db()
+        self.assertEqual((rejected.status, self.stock()[0]), ('CONFIRMED', 0))
+        self.assertFalse(rejected.stock_holds.exists())
+
+    def test_reject_after_confirm_keeps_sale(self):
+        self.client.force_authenticate(User.objects.create_user(username='admin', password='secret', is_staff=True))
+        order = self.order((self.drill, 2), (self.screw, 3))
+        self.assertEqual(self.stock(), (1, 97))
+        self.assertEqual(self.client.post(f'/api/admin/orders/{order.id}/confirm/').status_code, 200)
+        # Stock déjà vendu : le rejet ne le rend pas, la confirmation suivante ne le reprend pas
+        self.client.post(f'/api/admin/orders/{order.id}/reject/')
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.stock_released, self.stock()), ('REJECTED', False, (1, 97)))
+        self.assertEqual(self.client.post(f'/api/admin/orders/{order.id}/confirm/').status_code, 200)
+        order.refresh_from_db()
+        self.assertEqual((order.status, self.stock()), ('CONFIRMED', (1, 97)))
+
+    def test_payment_session_extends_hold(self):
+        order = self.order((self.drill, 1))
+        session = type('Session', (), {'id': 'cs_test_1', 'url': 'https://checkout.stripe.com/c/cs_test_1'})
+        with patch('vente.views.stripe_checkout.Session.create', return_value=session) as create:
+            self.client.post('/create_payment_session/', {'order_id': order.id}, format='json')
+        order.refresh_from_db()
+        self.assertEqual(create.call_args.kwargs['expires_at'], int(order.hold_expires_at.timestamp()))
+        self.assertGreaterEqual(order.hold_expires_at, timezone.now() + timedelta(minutes=30))
+
+    def test_payment_session_retry_sends_same_parameters(self):
+        order = self.order((self.drill, 1))
+        session = type('Session', (), {'id': 'cs_test_1', 'url': 'https://checkout.stripe.com/c/cs_test_1'})
+        with patch('vente.views.stripe_checkout.Session.create',
+                   side_effect=[stripe.error.APIConnectionError('timeout'), session]) as create:
+            self.client.post('/create_payment_session/', {'order_id': order.id}, format='json',
+                             HTTP_IDEMPOTENCY_KEY='pay-1')
+            # Nouvel essai quelques secondes plus tard, avec la même clé
+            with patch('vente.orders.timezone.now', return_value=timezone.now() + timedelta(seconds=5)):
+                self.client.post('/create_payment_session/', {'order_id': order.id}, format='json',
+                                 HTTP_IDEMPOTENCY_KEY='pay-1')
+        first, retry = create.call_args_list
+        self.assertEqual(first.kwargs, retry.kwargs)
+
+        # Pas de prolongation au-delà de STOCK_HOLD_MAX_DURATION après la création
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(hours=2),
+                                                 hold_expires_at=timezone.now() + timedelta(minutes=5))
+        response = self.client.post('/create_payment_session/', {'order_id': order.id}, format='json')
+        self.assertEqual(response.status_code, 409)
+
+
+class IdempotencyTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='client', password='secret', email='c@example.com')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {generate_access_token(self.user)}')
+        category = ProductCategory.objects.create(name='Outils')
+        self.drill = Product.objects.create(name='Perceuse', price=Decimal('80.00'), stock=5, category=category)
+        self.items = {'items': [{'id': self.drill.id, 'type': 'product', 'quantity': 2}]}
+
+    def order(self, key, payload=None):
+        return self.client.post('/create-order/', payload or self.items, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_stored_response(self):
+        first = self.order('abc')
+        self.assertEqual(first.status_code, 201)
+        # utilisateur, réservation refusée (dans un savepoint) puis lecture de la clé : aucune écriture de commande
+        with self.assertNumQueries(6):
+            retry = self.order('abc')
+        self.assertEqual((retry.status_code, retry.json()), (201, first.json()))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+
+        self.drill.refresh_from_db()
+        self.assertEqual((Order.objects.count(), self.drill.stock), (1, 3))
+        # Nouvelle clé : nouvelle commande
+        self.assertEqual(self.order('def').status_code, 201)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_key_reused_for_other_payload_and_failures_not_stored(self):
+        self.order('abc')
+        other = {'items': [{'id': self.drill.id, 'type': 'product', 'quantity': 1}]}
+        self.assertEqual(self.order('abc', other).status_code, 422)
+
+        too_many = {'items': [{'id': self.drill.id, 'type': 'product', 'quantity': 9}]}
+        self.assertEqual(self.order('xyz', too_many).status_code, 409)
+        self.assertFalse(IdempotencyKey.objects.filter(key='xyz').exists())
+
+    def test_expired_keys(self):
+        self.order('abc')
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.order('abc').status_code, 201)
+        self.assertEqual(Order.objects.count(), 2)
+
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        call_command('clear_expired_idempotency_keys', stdout=StringIO())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_payment_session_not_recreated(self):
+        order_id = self.order('abc').json()['order_id']
+        session = type('Session', (), {'id': 'cs_test_1', 'url': 'https://checkout.stripe.com/c/cs_test_1'})
+        with patch('vente.views.stripe_checkout.Session.create', return_value=session) as create:
+            for attempt in range(2):
+                response = self.client.post('/create_payment_session/', {'order_id': order_id}, format='json',
+                                            HTTP_IDEMPOTENCY_KEY='pay-1')
+                self.assertEqual(response.json(), {'session_id': 'cs_test_1', 'url': session.url})
+        self.assertEqual(create.call_count, 1)
+        self.assertEqual(create.call_args.kwargs['idempotency_key'], f'checkout-{self.user.id}-pay-1')
+
+
+class OrderListTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user(username='admin', password='secret', is_staff=True)
+        self.client.force_authenticate(self.admin)
+        self.products, self.equipment = create_catalog(5)
+
+    def create_orders(self, count, lines=3):
+        for number in range(count):
+            order = Order.objects.create(user=self.admin, total_amount=Decimal('10.00'))
+            OrderItem.objects.bulk_create(
+                [OrderItem(order=order, product=self.products[line], quantity=1, price=Decimal('10.00'))
+                 for line in range(lines)]
+                + [OrderItem(order=order, equipment=self.equipment[0], quantity=1, rental_days=2, price=Decimal('25.00'))]
+            )
+
+    def test_full_list_query_count_does_not_grow(self):
+        self.create_orders(2)
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(len(self.client.get('/orders/').json()['results']), 2)
+        self.create_orders(18, lines=5)
+        with CaptureQueriesContext(connection) as large:
+            results = self.client.get('/orders/').json()['results']
+        self.assertEqual(len(results), 20)
+        self.assertEqual(len(large), len(small))
+        self.assertEqual(len(results[0]['items'][0]['product']['images']), 2)
+
+    def test_detail_prefetch_plan(self):
+        self.create_orders(1, lines=5)
+        order = Order.objects.get()
+        # ETag + commande et utilisateur + lignes avec articles et catégories + images des produits + des équipements
+        with self.assertNumQueries(5):
+            response = self.client.get(f'/orders/{order.id}/')
+        self.assertEqual(len(response.json()['items']), 6)
+        self.assertEqual(self.client.get('/orders/abc/').status_code, 404)
+
+    def test_summary_view(self):
+        self.create_orders(3)
+        # ETag + COUNT + page annotée
+        with self.assertNumQueries(3):
+            response = self.client.get('/orders/', {'view': 'summary'})
+        summary = response.json()['results'][0]
+        self.assertEqual(set(summary), {
+            'id', 'created_at', 'status', 'payment_status', 'total_amount', 'item_count', 'first_item_name',
+        })
+        self.assertEqual((summary['item_count'], summary['first_item_name']), (4, self.products[0].name))
+
+        cursor_page = self.client.get('/orders/', {'view': 'summary', 'pagination': 'cursor'}).json()
+        self.assertEqual([order['item_count'] for order in cursor_page['results']], [4, 4, 4])
+
+    def test_webhook_finds_order_by_stripe_session(self):
+        order = Order.objects.create(user=self.admin, total_amount=Decimal('10.00'), stripe_session_id='cs_test_1')
+        Order.objects.create(user=self.admin, total_amount=Decimal('10.00'))
+        event = {'type': 'checkout.session.completed', 'data': {'object': {'id': 'cs_test_1', 'metadata': {}}}}
+        with patch('stripe.Webhook.construct_event', return_value=event):
+            self.client.post('/stripe-webhook/', {}, format='json')
+        order.refresh_from_db()
+        self.assertEqual((order.payment_status, order.status), ('PAID', 'CONFIRMED'))
+        self.assertEqual(Order.objects.filter(payment_status='PAID').count(), 1)
+
+
+class AdminOrderQueueTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user(username='admin', password='secret', is_staff=True)
+        self.customer = User.objects.create_user(username='client', password='secret')
+        self.client.force_authenticate(self.admin)
+        statuses = ['PENDING'] * 25 + ['CONFIRMED'] * 4 + ['SHIPPED'] * 2
+        Order.objects.bulk_create([
+            Order(user=self.customer, status=value, total_amount=Decimal('10.00'),
+                  payment_status='PAID' if index % 2 else 'PENDING', requires_delivery=index % 3 == 0)
+            for index, value in enumerate(statuses)
+        ])
+
+    def test_filtered_page_with_status_counts(self):
+        # GROUP BY des compteurs + COUNT + page
+        with self.assertNumQueries(3):
+            response = self.client.get('/orders/queue/', {'status': 'PENDING', 'view': 'summary'})
+        data = response.json()
+        self.assertEqual((data['count'], len(data['results'])), (25, 20))
+        self.assertEqual(data['status_counts'], {
+            'PENDING': 25, 'CONFIRMED': 4, 'REJECTED': 0, 'SHIPPED': 2, 'DELIVERED': 0, 'CANCELLED': 0,
+        })
+        self.assertEqual({order['status'] for order in data['results']}, {'PENDING'})
+
+        data = self.client.get('/orders/queue/', {'status': 'confirmed,shipped', 'payment_status': 'PAID'}).json()
+        self.assertEqual(data['count'], Order.objects.filter(
+            status__in=['CONFIRMED', 'SHIPPED'], payment_status='PAID').count())
+        self.assertEqual(sum(data['status_counts'].values()), Order.objects.filter(payment_status='PAID').count())
+
+    def test_delivery_and_date_filters(self):
+        old = Order.objects.filter(status='SHIPPED').first()
+        Order.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=10))
+        today = timezone.localdate().isoformat()
+        data = self.client.get('/orders/queue/', {'created_after': today, 'created_before': today}).json()
+        self.assertEqual(data['count'], 30)
+        self.assertEqual(data['status_counts']['SHIPPED'], 1)
+
+        data = self.client.get('/orders/queue/', {'requires_delivery': 'true'}).json()
+        self.assertEqual(data['count'], Order.objects.filter(requires_delivery=True).count())
+
+        for params in ({'status': 'LOST'}, {'created_after': 'yesterday'}, {'requires_delivery': 'maybe'}):
+            self.assertEqual(self.client.get('/orders/queue/', params).status_code, 400)
+
+    def test_etag_follows_orders_outside_the_status_filter(self):
+        response = self.client.get('/orders/queue/', {'status': 'PENDING'})
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/orders/queue/', {'status': 'PENDING'},
+                                         HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        shipped = Order.objects.filter(status='SHIPPED').first()
+        shipped.status = 'DELIVERED'
+        shipped.save()
+        response = self.client.get('/orders/queue/', {'status': 'PENDING'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status_counts']['DELIVERED'], 1)
+
+    def test_admin_only(self):
+        self.client.force_authenticate(self.customer)
+        self.assertEqual(self.client.get('/orders/queue/').status_code, 403)
+
+
+class OrderStressTests(TransactionTestCase):
+    """
+    Paiements simultanés sur un stock limité : jamais de survente.
+    Le débit dépend de la machine : il est mesuré par la commande benchmark_orders.
+    """
+    threads = 8
+    attempts = 10
+
+    def test_no_oversell_under_concurrency(self):
+        category = ProductCategory.objects.create(name='Outils')
+        product = Product.objects.create(name='Perceuse', price=Decimal('80.00'), stock=25, category=category)
+        users = [User.objects.create_user(username=f'client{i}') for i in range(self.threads)]
+        results = {'sold': 0, 'refused': 0}
+        lock = threading.Lock()
+
+        def buy(user):
+            try:
+                for attempt in range(self.attempts):
+                    while True:
+                        try:
+                            place_order(user, [{'id': product.id, 'type': 'product', 'quantity': 2, 'days': 1}], {})
+                            outcome = 'sold'
+                        except OrderError:
+                            outcome = 'refused'
+                        except OperationalError:
+                            # SQLite : base verrouillée par une autre écriture, on réessaie
+                            time.sleep(0.001)
+                            continue
+                        break
+                    with lock:
+                        results[outcome] += 1
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=buy, args=(user,)) for user in users]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        product.refresh_from_db()
+        self.assertEqual(results['sold'], 12)
+        self.assertEqual(results['refused'], self.threads * self.attempts - 12)
+        self.assertEqual(product.stock, 1)
+        self.assertEqual(OrderItem.objects.aggregate(total=Sum('quantity'))['total'], 24)
+
+
+@local_storage
+class CatalogRepresentationTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        create_catalog(30)
+
+    def test_card_view(self):
+        # COUNT + page avec catégorie + première image de chaque article
+        with self.assertNumQueries(3):
+            response = self.client.get('/products/?view=card')
+        item = response.json()['results'][0]
+        self.assertEqual(set(item), {'id', 'name', 'price', 'stock', 'category_name', 'image_url', 'image_srcset'})
+        self.assertEqual(item['category_name'], 'Produits')
+        self.assertTrue(item['image_url'].endswith('/media/images/test_0.jpg'))
+
+        item = self.client.get('/equipment/?view=card&pagination=cursor').json()['results'][0]
+        self.assertEqual(set(item), {'id', 'name', 'rental_price_per_day', 'available', 'category_name', 'image_url',
+                                    'image_srcset'})
+
+    def test_sparse_fields(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/products/?fields=id,name,price')
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'name', 'price'})
+
+        item = self.client.get('/equipment/?fields=name,category,images').json()['results'][0]
+        self.assertEqual(set(item), {'name', 'category', 'images'})
+        self.assertEqual(len(item['images']), 2)
+
+    def test_unknown_or_write_only_fields(self):
+        self.assertEqual(self.client.get('/products/?fields=name,secret').status_code, 400)
+        self.assertEqual(self.client.get('/products/?fields=image_files').status_code, 400)
+
+
+@local_storage
+class ImageUrlTests(CatalogTestCase):
+    def test_url_resolved_once_at_upload(self):
+        image = Image.objects.create(image=SimpleUploadedFile('photo.jpg', b'jpeg', content_type='image/jpeg'))
+        self.assertTrue(image.public_url.startswith('/media/images/photo'))
+
+        category = ProductCategory.objects.create(name='Outils')
+        product = Product.objects.create(name='Clé', price=Decimal('5.00'), category=category)
+        product.images.add(image)
+        with patch.object(InMemoryStorage, 'url', side_effect=AssertionError('appel au stockage')):
+            data = self.client.get(f'/products/{product.id}/').json()
+        self.assertEqual(data['images'][0]['image_url'], f'http://testserver{image.public_url}')
+        self.assertEqual(data['images'][0]['image'], data['images'][0]['image_url'])
+
+    def test_backfill_command(self):
+        Image.objects.bulk_create([Image(image=f'images/old_{i}.jpg') for i in range(5)])
+        call_command('backfill_image_urls', batch_size=2, stdout=StringIO())
+        self.assertEqual(
+            sorted(Image.objects.values_list('public_url', flat=True)),
+            [f'/media/images/old_{i}.jpg' for i in range(5)],
+        )
+
+
+_colors = itertools.count()
+
+
+def make_jpeg(width=1000, height=500, name='photo.jpg', color=None):
+    """JPEG de test ; une couleur différente à chaque appel pour ne pas être dédoublonné"""
+    if color is None:
+        color = next(_colors) * 37 % 256
+    buffer = BytesIO()
+    PILImage.new('RGB', (width, height), (200, color, 30)).save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+@local_storage
+@override_settings(IMAGE_DERIVATIVES_ASYNC=False)
+class ImageDerivativeTests(CatalogTestCase):
+    def test_render_never_upscales(self):
+        rendered = render_derivatives(make_jpeg(300, 150).read())
+        self.assertEqual(sorted(rendered), [('jpeg', 200), ('jpeg', 300), ('webp', 200), ('webp', 300)])
+        with PILImage.open(BytesIO(rendered[('webp', 200)])) as thumbnail:
+            self.assertEqual((thumbnail.format, thumbnail.size), ('WEBP', (200, 100)))
+
+    def test_generated_after_upload(self):
+        admin = User.objects.create_user(username='admin', password='secret', is_staff=True)
+        self.client.force_authenticate(admin)
+        category = ProductCategory.objects.create(name='Outils')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/products/', {
+                'name': 'Perceuse', 'description': '18V', 'price': '80.00', 'stock': 2,
+                'category_id': category.id, 'image_files': [make_jpeg()],
+            }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+
+        image = Product.objects.get(id=response.json()['id']).images.get()
+        self.assertEqual(sorted(image.derivatives['webp']), ['200', '400', '800'])
+
+        srcset = self.client.get(f"/products/{response.json()['id']}/").json()['images'][0]['srcset']
+        self.assertRegex(srcset['webp'], r'^http://testserver/media/images/derivatives/\S+\.webp 200w, \S+ 400w, \S+ 800w$')
+        self.assertRegex(srcset['jpeg'], r'\.jpg 800w$')
+
+    def test_backfill_command(self):
+        Image.objects.create(image=make_jpeg(500, 500))
+        Image.objects.create(image=make_jpeg(100, 50))
+        call_command('generate_image_derivatives', workers=2, stdout=StringIO(), stderr=StringIO())
+        self.assertFalse(Image.objects.filter(derivatives={}).exists())
+        self.assertEqual(Image.objects.order_by('id').last().derivatives['jpeg'].keys(), {'100'})
+
+
+class CatalogImportExportTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def write(self, name, content):
+        with open(self.path(name), 'w', encoding='utf-8') as output:
+            output.write(content)
+        return self.path(name)
+
+    def test_import_creates_updates_and_rejects(self):
+        tools = ProductCategory.objects.create(name='Outils')
+        existing = Product.objects.create(name='Clé', price=Decimal('5.00'), category=tools, stock=1)
+        path = self.write('products.csv', (
+            'id,name,description,price,stock,category\n'
+            f'{existing.id},Clé plate,,6.50,10,Outils\n'
+            ',Perceuse,18V,80,2,Outils\n'
+            ',Vis,,1.00,100,Pièces\n'
+            ',Marteau,,abc,1,Outils\n'
+            ',Scie,,NaN,1,Outils\n'
+            ',Niveau,,1.999,1,Outils\n'
+            ',Grue,,1E+12,1,Outils\n'
+        ))
+        err = StringIO()
+        call_command('import_catalog', 'product', path, batch_size=2, stdout=StringIO(), stderr=err)
+
+        existing.refresh_from_db()
+        self.assertEqual((existing.name, existing.price, existing.stock), ('Clé plate', Decimal('6.50'), 10))
+        self.assertTrue(Product.objects.filter(name='Perceuse', category=tools, stock=2).exists())
+        self.assertFalse(Product.objects.filter(name__in=['Vis', 'Marteau', 'Scie', 'Niveau', 'Grue']).exists())
+        for line in range(4, 9):
+            self.assertIn(f'Ligne {line}', err.getvalue())
+
+    def test_dry_run_writes_nothing(self):
+        path = self.write('equipment.ndjson', '{"name": "Grue", "rental_price_per_day": "300", "category": "Levage"}\n')
+        out = StringIO()
+        call_command('import_catalog', 'equipment', path, dry_run=True, create_categories=True, stdout=out)
+        self.assertIn('[dry-run] 1 créé(s)', out.getvalue())
+        self.assertFalse(Equipment.objects.exists())
+        self.assertFalse(EquipmentCategory.objects.exists())
+
+    def test_bad_ndjson_lines_rejected_one_by_one(self):
+        path = self.write('equipment.ndjson', '\n'.join([
+            '{"name": "Grue", "rental_price_per_day": "300", "category": "Levage"}',
+            '[1, 2]',
+            '"x"',
+            '{"name": "Nacelle", ',
+            '{"name": "%s", "rental_price_per_day": "10", "category": "Levage"}' % ('N' * 201),
+            '{"name": "Treuil", "rental_price_per_day": "50", "category": "%s"}' % ('C' * 101),
+            '{"name": "Palan", "rental_price_per_day": "20", "category": "Levage"}',
+        ]) + '\n')
+        err = StringIO()
+        call_command('import_catalog', 'equipment', path, batch_size=1, create_categories=True,
+                     stdout=StringIO(), stderr=err)
+        self.assertEqual(sorted(Equipment.objects.values_list('name', flat=True)), ['Grue', 'Palan'])
+        for line in range(2, 7):
+            self.assertIn(f'Ligne {line}', err.getvalue())
+
+    def test_round_trip(self):
+        create_catalog(25, images_per_item=0)
+        for fmt in ('csv', 'ndjson'):
+            with self.subTest(fmt=fmt):
+                path = self.path(f'equipment.{fmt}')
+                call_command('export_catalog', 'equipment', output=path, chunk_size=10, stdout=StringIO())
+                Equipment.objects.update(rental_price_per_day=Decimal('1.00'), available=False)
+
+                call_command('import_catalog', 'equipment', path, stdout=StringIO(), stderr=StringIO())
+                self.assertEqual(Equipment.objects.count(), 25)
+                self.assertFalse(Equipment.objects.exclude(rental_price_per_day=Decimal('25.00')).exists())
+                self.assertFalse(Equipment.objects.filter(available=False).exists())
+
+
+class BulkUpdateTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(User.objects.create_user(username='admin', password='secret', is_staff=True))
+        self.products, self.equipment = create_catalog(1000)
+
+    def test_products_in_a_handful_of_queries(self):
+        rows = [{'id': product.id, 'price': '12.50', 'stock': 7} for product in self.products]
+        rows += [{'id': self.products[0].id, 'stock': 3}, {'id': 999999, 'price': '1.00'}, {'id': 1, 'price': '-2'}]
+
+        # SELECT des ids + SAVEPOINT/RELEASE + quelques UPDATE ... CASE (taille des lots bornée par la base)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/products/bulk-update/', {'items': rows}, format='json')
+        self.assertLessEqual(len(queries), 10)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body['updated'], body['errors']), (1001, 2))
+        self.assertEqual([r['status'] for r in body['results'][-2:]], ['not_found', 'invalid'])
+
+        self.assertEqual(Product.objects.filter(price=Decimal('12.50'), stock=7).count(), 999)
+        self.assertEqual(Product.objects.get(id=self.products[0].id).stock, 3)
+        self.assertEqual(Product.objects.get(id=self.products[0].id).images.count(), 2)
+
+    def test_equipment_price_and_availability(self):
+        target = self.equipment[0]
+        response = self.client.post('/equipment/bulk-update/',
+                                    [{'id': target.id, 'price': '40.00', 'available': False}], format='json')
+        self.assertEqual(response.json()['updated'], 1)
+        target.refresh_from_db()
+        self.assertEqual((target.rental_price_per_day, target.available), (Decimal('40.00'), False))
+
+    def test_refreshes_cached_catalog(self):
+        self.client.get('/products/')
+        self.client.post('/products/bulk-update/', [{'id': self.products[-1].id, 'price': '99.00'}], format='json')
+        self.assertEqual(self.client.get('/products/').json()['results'][0]['price'], '99.00')
+
+    def test_admin_only(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.post('/products/bulk-update/', [], format='json').status_code, 403)
+
+
+class SlowFakeStorage(InMemoryStorage):
+    """Stockage local en mémoire qui simule la latence réseau d'un envoi"""
+    delay = 0.2
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.upload_threads = set()
+
+    def _save(self, name, content):
+        self.upload_threads.add(threading.current_thread().name)
+        time.sleep(self.delay)
+        return super()._save(name, content)
+
+
+@override_settings(IMAGE_DERIVATIVES_ASYNC=False, IMAGE_UPLOAD_WORKERS=5)
+class ImageAttachmentTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.storage = SlowFakeStorage(base_url='/media/')
+        patcher = patch.object(Image._meta.get_field('image'), 'storage', self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client.force_authenticate(User.objects.create_user(username='admin', password='secret', is_staff=True))
+        self.category = ProductCategory.objects.create(name='Outils')
+
+    def post_product(self, files):
+        return self.client.post('/products/', {
+            'name': 'Perceuse', 'price': '80.00', 'stock': 1, 'category_id': self.category.id,
+            'image_files': files,
+        }, format='multipart')
+
+    def test_uploads_run_concurrently_with_bulk_inserts(self):
+        files = [make_jpeg(40, 40, name=f'photo_{i}.jpg') for i in range(5)]
+        # catégorie + INSERT produit + recherche des empreintes + bulk_create des images (dans un savepoint)
+        # + bulk_create des liens + lecture pour la réponse
+        with self.assertNumQueries(8):
+            response = self.post_product(files)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['images']), 5)
+        # Un thread par envoi : les envois se font en parallèle
+        self.assertEqual(len(self.storage.upload_threads), 5)
+
+    def test_update_respects_limit_with_single_count(self):
+        product = Product.objects.get(id=self.post_product([make_jpeg(40, 40) for _ in range(3)]).json()['id'])
+        kept = list(product.images.values_list('id', flat=True))
+
+        # produit et images préchargées + catégorie + images à retirer + UPDATE produit
+        # + une seule lecture des images liées pour la limite + recherche des empreintes
+        # + bulk_create des images (dans un savepoint) + bulk_create des liens + lecture pour la réponse
+        with self.assertNumQueries(12):
+            response = self.client.put(f'/products/{product.id}/', {
+                'name': 'Perceuse', 'price': '80.00', 'stock': 1, 'category_id': self.category.id,
+                'existing_image_ids': kept, 'image_files': [make_jpeg(40, 40) for _ in range(4)],
+            }, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(product.images.count(), 5)
+        self.assertTrue(set(kept) <= set(product.images.values_list('id', flat=True)))
+
+
+@local_storage
+@override_settings(IMAGE_DERIVATIVES_ASYNC=False)
+class ImageDedupTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(User.objects.create_user(username='admin', password='secret', is_staff=True))
+        self.category = ProductCategory.objects.create(name='Outils')
+
+    def post_product(self, files):
+        return self.client.post('/products/', {
+            'name': 'Perceuse', 'price': '80.00', 'stock': 1, 'category_id': self.category.id,
+            'image_files': files,
+        }, format='multipart')
+
+    def test_same_content_reuses_image(self):
+        first = self.post_product([make_jpeg(40, 40, color=10), make_jpeg(40, 40, name='copie.jpg', color=10)])
+        second = self.post_product([make_jpeg(40, 40, name='autre.jpg', color=10), make_jpeg(40, 40, color=200)])
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+
+        self.assertEqual(Image.objects.count(), 2)
+        self.assertEqual(len(first.json()['images']), 1)
+        self.assertEqual(second.json()['images'][0]['id'], first.json()['images'][0]['id'])
+
+    def test_dedupe_command_merges_links(self):
+        data = make_jpeg(40, 40, color=60).read()
+        storage = Image._meta.get_field('image').storage
+        # Doublons antérieurs à l'empreinte : fichiers distincts, même contenu
+        images = Image.objects.bulk_create([
+            Image(image=storage.save(f'images/copie_{i}.jpg', ContentFile(data))) for i in range(3)
+        ])
+        other = Image.objects.create(image=make_jpeg(40, 40, color=120))
+        Image.objects.update(content_hash=None)
+
+        first = Product.objects.create(name='A', price=1, stock=1, category=self.category)
+        first.images.set([images[0], images[1], other])
+        second = Product.objects.create(name='B', price=1, stock=1, category=self.category)
+        second.images.set([images[2]])
+
+        call_command('dedupe_images', batch_size=2, stdout=StringIO())
+        self.assertEqual(Image.objects.count(), 2)
+        self.assertFalse(Image.objects.filter(content_hash__isnull=True).exists())
+        self.assertEqual(set(first.images.values_list('id', flat=True)), {images[0].id, other.id})
+        self.assertEqual(list(second.images.values_list('id', flat=True)), [images[0].id])
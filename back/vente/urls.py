@@ -20,6 +20,8 @@ urlpatterns = [
     
     # Cart
     path('cart/', views.cart, name='cart'),
+    path('cart/ops/', views.cart_operations, name='cart_operations'),
+    path('cart/<int:item_id>/', views.cart_item, name='cart_item'),
     path('merge-cart/', views.merge_cart, name='merge_cart'),
     
     # Orders
@@ -38,9 +40,14 @@ urlpatterns = [
     # Contact
     path('contact/', views.contact, name='contact'),
     
+    # Search
+    path('search/', views.search, name='search'),
+    path('catalog/facets/', views.catalog_facets, name='catalog_facets'),
+    
     # Reviews
     path('reviews/', views.get_reviews, name='get_reviews'),
     path('reviews/all/', views.get_all_reviews, name='get_all_reviews'),
+    path('reviews/summary/', views.review_summary, name='review_summary'),
     path('reviews/create/', views.create_review, name='create_review'),
     path('reviews/<int:review_id>/', views.manage_review, name='manage_review'),
     
@@ -1,21 +1,44 @@
 from django.core.mail import send_mail
 from django.shortcuts import render
 from rest_framework import viewsets, status
-from rest_framework.decorators import api_view, permission_classes, authentication_classes
+from rest_framework.decorators import api_view, permission_classes, authentication_classes, action
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError, NotFound
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.utils import timezone
+from django.db import transaction
+from django.db.models import Max, Count, Prefetch, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from .models import ProductCategory, EquipmentCategory, Product, Equipment, Order, OrderItem, ContactMessage, Image
 from .serializers import (
     ProductCategorySerializer, EquipmentCategorySerializer, ProductSerializer, EquipmentSerializer,
-    OrderSerializer, OrderItemSerializer, ContactMessageSerializer,
+    ProductCardSerializer, EquipmentCardSerializer,
+    ProductBulkUpdateSerializer, EquipmentBulkUpdateSerializer, CartOperationSerializer, OrderLineSerializer,
+    OrderSerializer, OrderSummarySerializer, OrderItemSerializer, ContactMessageSerializer,
     UserSerializer, RegisterSerializer
 )
 from .permissions import IsAdminOrReadOnly
+from .filters import CatalogFilterBackend, OrderFilterBackend, filter_orders, parse_day, parse_id_list, parse_int
+from .pagination import OptionalKeysetPagination
+from .conditional import conditional_response
+from .search import search_catalog
+from .facets import compute_facets
+from .orders import place_order, confirm_payment, extend_hold, release_holds, settle_order, OrderError
+from .reservations import equipment_availability
+from .idempotency import idempotent, HEADER as IDEMPOTENCY_HEADER
+from .cart import (
+    price_cart, get_cart_store, get_cart_owner, get_session_owner,
+    apply_cart_operations, load_prices, cart_line, cart_total, CartBusy,
+)
+from .cache import (
+    CatalogCacheMixin, cached_response, get_catalog_state, bump_catalog_version, PRODUCT_DEPENDENCIES, EQUIPMENT_DEPENDENCIES,
+    PRODUCT_CATEGORY_DEPENDENCIES, EQUIPMENT_CATEGORY_DEPENDENCIES, REVIEW_DEPENDENCIES,
+    PRODUCT_FACET_DEPENDENCIES, EQUIPMENT_FACET_DEPENDENCIES,
+)
 from .authentication import JWTAuthentication
 import stripe
 import importlib
@@ -41,7 +64,7 @@ import uuid
 from datetime import timedelta
 from .models import RefreshToken
 from .serializers import ReviewSerializer
-from .models import Review
+from .models import Review, ReviewSummary
 
 # Configuration JWT
 JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your-secret-key-change-in-production')
@@ -83,23 +106,147 @@ def verify_token(request):
     except (jwt.ExpiredSignatureError, jwt.InvalidTokenError, User.DoesNotExist):
         return None
 
-class ProductCategoryViewSet(viewsets.ModelViewSet):
-    queryset = ProductCategory.objects.all()
+class ProductCategoryViewSet(CatalogCacheMixin, viewsets.ModelViewSet):
+    queryset = ProductCategory.objects.order_by('id')
     serializer_class = ProductCategorySerializer
     permission_classes = [IsAdminOrReadOnly]
     authentication_classes = [JWTAuthentication]
+    cache_namespace = 'product-categories'
+    cache_dependencies = PRODUCT_CATEGORY_DEPENDENCIES
 
-class EquipmentCategoryViewSet(viewsets.ModelViewSet):
-    queryset = EquipmentCategory.objects.all()
+class EquipmentCategoryViewSet(CatalogCacheMixin, viewsets.ModelViewSet):
+    queryset = EquipmentCategory.objects.order_by('id')
     serializer_class = EquipmentCategorySerializer
     permission_classes = [IsAdminOrReadOnly]
     authentication_classes = [JWTAuthentication]
+    cache_namespace = 'equipment-categories'
+    cache_dependencies = EQUIPMENT_CATEGORY_DEPENDENCIES
+
+class CatalogRepresentationMixin:
+    """
+    Représentations allégées pour les listes du catalogue :
+    - ?view=card : id, nom, prix, catégorie et première image seulement
+    - ?fields=id,name,... : sous-ensemble des champs du serializer complet
+    La requête SQL est réduite en conséquence (only() et préchargements utiles).
+    """
+    card_serializer_class = None
+    card_only_fields = ()
+
+    def is_card_view(self):
+        return self.action in ('list', 'retrieve') and self.request.query_params.get('view') == 'card'
+
+    def get_requested_fields(self):
+        fields = self.request.query_params.get('fields')
+        if not fields or self.action not in ('list', 'retrieve') or self.is_card_view():
+            return None
+        requested = [name.strip() for name in fields.split(',') if name.strip()]
+        readable = [name for name, field in self.serializer_class().fields.items() if not field.write_only]
+        unknown = [name for name in requested if name not in readable]
+        if unknown:
+            raise ValidationError({'fields': f"Champs inconnus : {', '.join(unknown)}. Champs possibles : {', '.join(readable)}"})
+        return requested
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.is_card_view():
+            first_image = Prefetch('images', queryset=Image.objects.only('id', 'image', 'public_url', 'derivatives').order_by('id')[:1],
+                                  to_attr='card_images')
+            return queryset.prefetch_related(None).prefetch_related(first_image).only(*self.card_only_fields)
+
+        fields = self.get_requested_fields()
+        if fields is None:
+            return queryset
+        concrete = {field.name for field in queryset.model._meta.concrete_fields}
+        # created_at sert au tri et à la pagination par curseur
+        only = ['id', 'created_at'] + [name for name in fields if name in concrete]
+        if 'category' not in fields:
+            queryset = queryset.select_related(None)
+        if 'images' not in fields:
+            queryset = queryset.prefetch_related(None)
+        return queryset.only(*only)
+
+    def get_serializer_class(self):
+        if self.is_card_view():
+            return self.card_serializer_class
+        return super().get_serializer_class()
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_requested_fields()
+        if fields is not None:
+            kwargs['fields'] = fields
+        return super().get_serializer(*args, **kwargs)
+
+class BulkUpdateMixin:
+    """
+    POST /<ressource>/bulk-update/ : applique des milliers de lignes {id, prix, stock/disponibilité}
+    en quelques UPDATE ... CASE, dans une seule transaction, sans toucher aux images.
+    """
+    bulk_update_serializer_class = None
+    bulk_update_max_rows = 5000
+    bulk_update_batch_size = 500
+
+    @action(detail=False, methods=['post'], url_path='bulk-update')
+    def bulk_update(self, request):
+        rows = request.data.get('items') if isinstance(request.data, dict) else request.data
+        if not isinstance(rows, list) or not rows:
+            return Response({'error': 'Une liste « items » non vide est requise'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > self.bulk_update_max_rows:
+            return Response({'error': f'{self.bulk_update_max_rows} lignes maximum par requête'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        model = self.get_queryset().model
+        results = []
+        valid = []
+        for row in rows:
+            serializer = self.bulk_update_serializer_class(data=row)
+            if serializer.is_valid():
+                valid.append(serializer.validated_data)
+                results.append({'id': serializer.validated_data['id'], 'status': 'updated'})
+            else:
+                results.append({'id': row.get('id') if isinstance(row, dict) else None,
+                                'status': 'invalid', 'errors': serializer.errors})
+
+        existing = set(model.objects.filter(id__in=[data['id'] for data in valid]).values_list('id', flat=True))
+        for result in results:
+            if result['status'] == 'updated' and result['id'] not in existing:
+                result['status'] = 'not_found'
+
+        # Regrouper les lignes par ensemble de champs modifiés : un bulk_update par groupe
+        groups = {}
+        for data in valid:
+            if data['id'] in existing:
+                fields = tuple(sorted(name for name in data if name != 'id'))
+                if fields:
+                    # Une ligne en double remplace la précédente (dernière valeur gagnante)
+                    groups.setdefault(fields, {})[data['id']] = model(**data)
 
-class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.all()
+        with transaction.atomic():
+            for fields, objects in groups.items():
+                model.objects.bulk_update(list(objects.values()), fields, batch_size=self.bulk_update_batch_size)
+
+        if groups:
+            # bulk_update ne déclenche pas les signaux
+            bump_catalog_version(self.cache_model_name)
+
+        updated = sum(1 for result in results if result['status'] == 'updated')
+        return Response({'updated': updated, 'errors': len(results) - updated, 'results': results})
+
+class ProductViewSet(BulkUpdateMixin, CatalogRepresentationMixin, CatalogCacheMixin, viewsets.ModelViewSet):
+    # Charger la catégorie par jointure et les images en une seule requête groupée
+    queryset = Product.objects.select_related('category').prefetch_related('images')
     serializer_class = ProductSerializer
     permission_classes = [IsAdminOrReadOnly]
     authentication_classes = [JWTAuthentication]
+    filter_backends = [CatalogFilterBackend]
+    pagination_class = OptionalKeysetPagination
+    price_field = 'price'
+    available_filter = {'stock__gt': 0}
+    cache_namespace = 'products'
+    cache_dependencies = PRODUCT_DEPENDENCIES
+    card_serializer_class = ProductCardSerializer
+    bulk_update_serializer_class = ProductBulkUpdateSerializer
+    cache_model_name = 'product'
+    card_only_fields = ('id', 'name', 'price', 'stock', 'created_at', 'category__name')
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -113,11 +260,24 @@ class ProductViewSet(viewsets.ModelViewSet):
         instance.save()
         return super().destroy(request, *args, **kwargs)
 
-class EquipmentViewSet(viewsets.ModelViewSet):
-    queryset = Equipment.objects.all()
+# Nombre maximal d'équipements par requête de disponibilité
+MAX_AVAILABILITY_IDS = 200
+
+class EquipmentViewSet(BulkUpdateMixin, CatalogRepresentationMixin, CatalogCacheMixin, viewsets.ModelViewSet):
+    queryset = Equipment.objects.select_related('category').prefetch_related('images')
     serializer_class = EquipmentSerializer
     permission_classes = [IsAdminOrReadOnly]
     authentication_classes = [JWTAuthentication]
+    filter_backends = [CatalogFilterBackend]
+    pagination_class = OptionalKeysetPagination
+    price_field = 'rental_price_per_day'
+    available_filter = {'available': True}
+    cache_namespace = 'equipment'
+    cache_dependencies = EQUIPMENT_DEPENDENCIES
+    card_serializer_class = EquipmentCardSerializer
+    bulk_update_serializer_class = EquipmentBulkUpdateSerializer
+    cache_model_name = 'equipment'
+    card_only_fields = ('id', 'name', 'rental_price_per_day', 'available', 'created_at', 'category__name')
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -131,16 +291,129 @@ class EquipmentViewSet(viewsets.ModelViewSet):
         instance.save()
         return super().destroy(request, *args, **kwargs)
 
+    @action(detail=False, methods=['get'])
+    def availability(self, request):
+        """
+        Disponibilité de plusieurs équipements sur une période, en une requête.
+
+        ?ids=1,2,3&start=AAAA-MM-JJ&end=AAAA-MM-JJ&quantity=1 ; `end` est la date
+        de retour (exclue). Les identifiants inconnus sont absents des résultats.
+        """
+        params = request.query_params
+        ids = parse_id_list(params, 'ids', MAX_AVAILABILITY_IDS)
+        start = parse_day(params, 'start')
+        end = parse_day(params, 'end')
+        quantity = parse_int(params, 'quantity') or 1
+        if not ids or start is None or end is None:
+            raise ValidationError({'detail': 'ids, start et end sont requis'})
+        if end <= start:
+            raise ValidationError({'end': 'Doit être postérieure à start'})
+        if quantity < 1:
+            raise ValidationError({'quantity': 'Doit être supérieure à 0'})
+
+        availability = equipment_availability(ids, start, end, quantity)
+        return Response({
+            'start': start,
+            'end': end,
+            'quantity': quantity,
+            'results': [{'id': pk, **availability[pk]} for pk in ids if pk in availability],
+        })
+
 class OrderViewSet(viewsets.ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = OptionalKeysetPagination
+    filter_backends = [OrderFilterBackend]
 
-    def get_queryset(self):
+    def get_base_queryset(self):
         if self.request.user.is_staff:
             return Order.objects.all()
         return Order.objects.filter(user=self.request.user)
 
+    def is_summary_view(self):
+        """?view=summary : liste allégée calculée par annotations, sans serializers imbriqués"""
+        return self.action in ('list', 'queue') and self.request.query_params.get('view') == 'summary'
+
+    def get_queryset(self):
+        queryset = self.get_base_queryset().order_by('-created_at', '-id')
+        if self.is_summary_view():
+            first_item = (
+                OrderItem.objects.filter(order=OuterRef('pk')).order_by('id')
+                .annotate(name=Coalesce('product__name', 'equipment__name')).values('name')[:1]
+            )
+            return queryset.only('id', 'status', 'payment_status', 'total_amount', 'created_at').annotate(
+                item_count=Count('items'),
+                first_item_name=Subquery(first_item),
+            )
+        # Détail complet : lignes, articles, catégories et images chargés en un nombre fixe de requêtes
+        items = Prefetch(
+            'items',
+            queryset=OrderItem.objects.select_related('product__category', 'equipment__category')
+            .prefetch_related('product__images', 'equipment__images').order_by('id'),
+        )
+        return queryset.select_related('user').prefetch_related(items)
+
+    def get_serializer_class(self):
+        if self.is_summary_view():
+            return OrderSummarySerializer
+        return super().get_serializer_class()
+
+    def conditional(self, request, state, build_response):
+        """ETag calculé à partir de la dernière mise à jour et du nombre de commandes"""
+        # Les articles imbriquent les produits et équipements du catalogue
+        versions, catalog_modified = get_catalog_state(PRODUCT_DEPENDENCIES + EQUIPMENT_DEPENDENCIES)
+        last_modified = catalog_modified
+        if state['last_update']:
+            last_modified = max(last_modified, int(state['last_update'].timestamp()))
+        etag_state = (f"orders:{request.user.id}:{request.get_full_path()}:{state['count']}:"
+                      f"{state['last_update']}:{versions}")
+        return conditional_response(request, etag_state, last_modified, build_response, private=True)
+
+    def get_state(self, queryset):
+        return queryset.aggregate(last_update=Max('updated_at'), count=Count('id'))
+
+    def list(self, request, *args, **kwargs):
+        state = self.get_state(self.filter_queryset(self.get_base_queryset()))
+        return self.conditional(request, state, lambda: super(OrderViewSet, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            queryset = self.filter_queryset(self.get_base_queryset()).filter(pk=kwargs['pk'])
+        except (TypeError, ValueError):
+            # Identifiant non numérique : même réponse que get_object()
+            raise NotFound()
+        state = self.get_state(queryset)
+        return self.conditional(request, state, lambda: super(OrderViewSet, self).retrieve(request, *args, **kwargs))
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def queue(self, request):
+        """
+        File des commandes pour l'administration : filtres côté serveur, page de
+        résultats et compteurs par statut.
+
+        Les compteurs ignorent le filtre `status` (les onglets affichent les
+        autres statuts) et sortent d'un seul GROUP BY, qui fournit aussi l'état
+        de l'ETag : une requête de plus que la page elle-même.
+        """
+        rows = (
+            filter_orders(self.get_base_queryset(), request.query_params, ignore=('status',))
+            .order_by().values('status').annotate(count=Count('id'), last_update=Max('updated_at'))
+        )
+        status_counts = {choice: 0 for choice, label in Order.STATUS_CHOICES}
+        updates = []
+        for row in rows:
+            status_counts[row['status']] = row['count']
+            updates.append(row['last_update'])
+        state = {'count': sum(status_counts.values()), 'last_update': max(updates, default=None)}
+
+        def build_response():
+            page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+            response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+            response.data['status_counts'] = status_counts
+            return response
+        return self.conditional(request, state, build_response)
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def register(request):
@@ -269,64 +542,115 @@ def password_reset_confirm(request, uidb64, token):
 
 @api_view(['GET', 'POST'])
 def cart(request):
-    # Utiliser un identifiant unique pour le panier basé sur l'utilisateur
-    if request.user.is_authenticated:
-        cart_key = f"cart_user_{request.user.id}"
-    else:
-        cart_key = f"cart_session_{request.session.session_key or 'anonymous'}"
-    
-    cart = request.session.get(cart_key, {})
+    # Panier rattaché à l'utilisateur connecté, sinon à la session
+    store = get_cart_store()
     
     if request.method == 'GET':
-        items = []
-        total = 0
-        for item_id, item_data in cart.items():
+        owner = get_cart_owner(request)
+        cart = store.get(owner) if owner else {}
+        items, total, missing = price_cart(cart)
+        if missing:
+            # Retirer en une seule écriture les articles qui n'existent plus
             try:
-                if item_data['type'] == 'product':
-                    product = Product.objects.get(id=item_id)
-                    item_total = product.price * item_data['quantity']
-                    items.append({
-                        'item': ProductSerializer(product).data,
-                        'quantity': item_data['quantity'],
-                        'total': item_total
-                    })
-                    total += item_total
-                else:
-                    equipment = Equipment.objects.get(id=item_id)
-                    item_total = equipment.rental_price_per_day * item_data['quantity'] * item_data['days']
-                    items.append({
-                        'item': EquipmentSerializer(equipment).data,
-                        'quantity': item_data['quantity'],
-                        'days': item_data['days'],
-                        'total': item_total
-                    })
-                    total += item_total
-            except (Product.DoesNotExist, Equipment.DoesNotExist):
-                # Supprimer l'élément du panier s'il n'existe plus
-                del cart[item_id]
-                request.session[cart_key] = cart
-                request.session.modified = True
+                store.remove_items(owner, missing)
+            except CartBusy:
+                # Nettoyage facultatif : il sera refait à la prochaine lecture
+                pass
         
         return Response({'items': items, 'total': total})
     
     elif request.method == 'POST':
-        item_id = request.data.get('item_id')
-        item_type = request.data.get('item_type')
-        quantity = int(request.data.get('quantity', 1))
-        days = int(request.data.get('days', 1)) if item_type == 'equipment' else 0
+        if not isinstance(request.data, dict):
+            return Response({'error': 'Le corps doit être un objet JSON'}, status=status.HTTP_400_BAD_REQUEST)
+        # Même validation qu'une opération « set » de /cart/ops/ avant toute écriture
+        fields = ('item_id', 'item_type', 'quantity', 'days')
+        serializer = CartOperationSerializer(data={
+            'op': 'set', **{field: request.data[field] for field in fields if field in request.data},
+        })
+        if not serializer.is_valid():
+            return Response({'errors': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+        item_type = serializer.validated_data['item_type']
+        quantity = serializer.validated_data.get('quantity', 1)
+        days = serializer.validated_data.get('days', 1) if item_type == 'equipment' else 0
 
         if item_type == 'equipment' and not request.user.is_authenticated:
             return Response({'error': 'You must be logged in to rent equipment'}, status=status.HTTP_401_UNAUTHORIZED)
 
-        cart[item_id] = {
+        store.set_item(get_cart_owner(request, create=True), serializer.validated_data['item_id'], {
             'type': item_type,
             'quantity': quantity,
             'days': days
-        }
-        request.session[cart_key] = cart
-        request.session.modified = True
+        })
         return Response({'message': 'Item added to cart'}, status=status.HTTP_200_OK)
 
+# Nombre maximal d'opérations par appel à /cart/ops/
+MAX_CART_OPERATIONS = 100
+
+def run_cart_operations(request, operations):
+    """
+    Valider et appliquer des opérations au panier en une écriture par type (ajout / retrait).
+
+    Ne renvoie que les lignes modifiées et le nouveau total, calculé à partir des
+    seuls prix unitaires (sans sérialiser les articles).
+    """
+    serializer = CartOperationSerializer(data=operations, many=True)
+    if not serializer.is_valid():
+        return Response({'errors': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+    if not request.user.is_authenticated and any(
+        operation.get('item_type') == 'equipment' for operation in serializer.validated_data
+    ):
+        return Response({'error': 'You must be logged in to rent equipment'}, status=status.HTTP_401_UNAUTHORIZED)
+
+    store = get_cart_store()
+    owner = get_cart_owner(request, create=True)
+    cart, changed, removed, errors = apply_cart_operations(store.get(owner), serializer.validated_data)
+
+    prices = load_prices(cart)
+    lines = {item_id: cart_line(item_id, item_data, prices) for item_id, item_data in changed.items()}
+    for index, operation in enumerate(serializer.validated_data):
+        if operation['op'] != 'remove' and str(operation['item_id']) in lines and lines[str(operation['item_id'])] is None:
+            errors.setdefault(index, 'Article introuvable')
+    if errors:
+        return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+    if changed:
+        store.set_items(owner, changed)
+    if removed:
+        store.remove_items(owner, removed)
+    return Response({'lines': list(lines.values()), 'removed': removed, 'total': cart_total(cart, prices)})
+
+@api_view(['PATCH', 'DELETE'])
+def cart_item(request, item_id):
+    """Modifier la quantité / la durée d'une ligne du panier, ou la retirer"""
+    owner = get_cart_owner(request)
+    if owner is None or str(item_id) not in get_cart_store().get(owner):
+        return Response({'error': 'Article absent du panier'}, status=status.HTTP_404_NOT_FOUND)
+
+    if request.method == 'DELETE':
+        return run_cart_operations(request, [{'op': 'remove', 'item_id': item_id}])
+
+    if not isinstance(request.data, dict):
+        return Response({'error': 'Le corps doit être un objet JSON'}, status=status.HTTP_400_BAD_REQUEST)
+    operation = {'op': 'update', 'item_id': item_id}
+    for field in ('quantity', 'days'):
+        if field in request.data:
+            operation[field] = request.data[field]
+    response = run_cart_operations(request, [operation])
+    if response.status_code == 200:
+        response.data = {'line': response.data['lines'][0], 'total': response.data['total']}
+    return response
+
+@api_view(['POST'])
+def cart_operations(request):
+    """Appliquer plusieurs opérations au panier : {"ops": [{"op": "set" | "update" | "remove", ...}]}"""
+    operations = request.data.get('ops') if isinstance(request.data, dict) else None
+    if not isinstance(operations, list) or not operations:
+        return Response({'error': 'ops doit être une liste non vide'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(operations) > MAX_CART_OPERATIONS:
+        return Response({'error': f'{MAX_CART_OPERATIONS} opérations au maximum par appel'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    return run_cart_operations(request, operations)
+
 @api_view(['GET', 'POST'])
 @permission_classes([AllowAny])
 def contact(request):
@@ -393,112 +717,39 @@ def success(request):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@authentication_classes([JWTAuthentication])
+@idempotent('create_order')
 def create_order(request):
     """Créer une commande avec informations de livraison"""
-    # Utiliser l'authentification JWT
-    from .authentication import JWTAuthentication
-    auth = JWTAuthentication()
-    user, _ = auth.authenticate(request)
-    if not user:
-        return Response({'detail': 'Informations d\'authentification non fournies.'}, status=status.HTTP_401_UNAUTHORIZED)
+    items = request.data.get('items', [])
+    delivery_info = request.data.get('delivery_info', {})
     
-    request.user = user
-    
-    try:
-        items = request.data.get('items', [])
-        customer_info = request.data.get('customer_info', {})
-        delivery_info = request.data.get('delivery_info', {})
-        
-        if not items:
-            return Response({'error': 'Cart is empty'}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Calculer le total
-        total_amount = 0
-        order = Order.objects.create(
-            user=request.user,
-            total_amount=0,
-            session_key=None,
-            # Informations de livraison
-            requires_delivery=delivery_info.get('requires_delivery', False),
-            delivery_country=delivery_info.get('country', ''),
-            delivery_address=delivery_info.get('address', ''),
-            delivery_city=delivery_info.get('city', ''),
-            delivery_postal_code=delivery_info.get('postal_code', ''),
-            delivery_phone=delivery_info.get('phone', ''),
-            # Informations du destinataire
-            recipient_name=delivery_info.get('recipient_name', ''),
-            recipient_email=delivery_info.get('recipient_email', ''),
-            recipient_phone=delivery_info.get('recipient_phone', '')
-        )
-        
-        for item in items:
-            item_id = item['id']
-            item_type = item['type']
-            quantity = item['quantity']
-            days = item.get('days', 1)
-            
-            if item_type == 'product':
-                product = Product.objects.get(id=item_id)
-                item_total = product.price * quantity
-                
-                OrderItem.objects.create(
-                    order=order,
-                    product=product,
-                    quantity=quantity,
-                    price=product.price
-                )
-                
-                product.stock -= quantity
-                product.save()
-                total_amount += item_total
-                
-            elif item_type == 'equipment':
-                equipment = Equipment.objects.get(id=item_id)
-                item_total = equipment.rental_price_per_day * quantity * days
-                
-                OrderItem.objects.create(
-                    order=order,
-                    equipment=equipment,
-                    quantity=quantity,
-                    rental_days=days,
-                    price=equipment.rental_price_per_day
-                )
-                
-                equipment.available = False
-                equipment.save()
-                total_amount += item_total
+    if not items:
+        return Response({'error': 'Cart is empty'}, status=status.HTTP_400_BAD_REQUEST)
 
-        order.total_amount = total_amount
-        order.status = 'PENDING'
-        order.payment_status = 'PENDING'
-        order.save()
-        
-        return Response({
-            'order_id': order.id,
-            'total_amount': total_amount,
-            'message': 'Order created successfully'
-        }, status=status.HTTP_201_CREATED)
-        
-    except Product.DoesNotExist:
-        return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
-    except Equipment.DoesNotExist:
-        return Response({'error': 'Equipment not found'}, status=status.HTTP_404_NOT_FOUND)
+    serializer = OrderLineSerializer(data=items, many=True)
+    if not serializer.is_valid():
+        return Response({'error': 'Invalid items', 'details': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        order = place_order(request.user, serializer.validated_data, delivery_info)
+    except OrderError as e:
+        return Response({'error': e.message}, status=e.status_code)
     except Exception as e:
         return Response({'error': f'Error creating order: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
-
- 
+        
+    return Response({
+        'order_id': order.id,
+        'total_amount': order.total_amount,
+        'message': 'Order created successfully'
+    }, status=status.HTTP_201_CREATED)
 
 @api_view(['DELETE'])
 def clear_cart(request):
     """Vider le panier de l'utilisateur"""
-    if request.user.is_authenticated:
-        cart_key = f"cart_user_{request.user.id}"
-    else:
-        cart_key = f"cart_session_{request.session.session_key or 'anonymous'}"
-    
-    if cart_key in request.session:
-        del request.session[cart_key]
-        request.session.modified = True
+    owner = get_cart_owner(request)
+    if owner:
+        get_cart_store().clear(owner)
     
     return Response({'message': 'Cart cleared'}, status=status.HTTP_200_OK)
 
@@ -508,34 +759,10 @@ def merge_cart(request):
     if not request.user.is_authenticated:
         return Response({'error': 'User must be authenticated'}, status=status.HTTP_401_UNAUTHORIZED)
     
-    # Récupérer le panier anonyme
-    anonymous_cart_key = f"cart_session_{request.session.session_key or 'anonymous'}"
-    anonymous_cart = request.session.get(anonymous_cart_key, {})
-    
-    # Récupérer le panier utilisateur
-    user_cart_key = f"cart_user_{request.user.id}"
-    user_cart = request.session.get(user_cart_key, {})
-    
-    # Fusionner les paniers
-    merged_cart = user_cart.copy()
-    for item_id, item_data in anonymous_cart.items():
-        if item_id in merged_cart:
-            # Si l'item existe déjà, additionner les quantités
-            merged_cart[item_id]['quantity'] += item_data['quantity']
-            if 'days' in item_data:
-                merged_cart[item_id]['days'] = max(merged_cart[item_id].get('days', 1), item_data['days'])
-        else:
-            # Sinon, ajouter l'item
-            merged_cart[item_id] = item_data
-    
-    # Sauvegarder le panier fusionné
-    request.session[user_cart_key] = merged_cart
-    
-    # Supprimer le panier anonyme
-    if anonymous_cart_key in request.session:
-        del request.session[anonymous_cart_key]
-    
-    request.session.modified = True
+    # Le panier anonyme est rattaché à la session courante
+    anonymous_owner = get_session_owner(request)
+    if anonymous_owner:
+        get_cart_store().merge(anonymous_owner, get_cart_owner(request))
     
     return Response({'message': 'Cart merged successfully'}, status=status.HTTP_200_OK) 
 
@@ -545,6 +772,7 @@ stripe.api_key = settings.STRIPE_SECRET_KEY
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 @authentication_classes([JWTAuthentication])
+@idempotent('create_payment_session')
 def create_payment_session(request):
     """Créer une session de paiement Stripe pour une commande"""
     try:
@@ -561,6 +789,14 @@ def create_payment_session(request):
         
         if order.payment_status == 'PAID':
             return Response({'error': 'Order is already paid'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if order.status == 'CANCELLED':
+            return Response({'error': 'Order expired'}, status=status.HTTP_409_CONFLICT)
+        # Le stock n'est réservé que pour un temps : la session Stripe expire avec la réservation
+        try:
+            hold_expires_at = extend_hold(order)
+        except OrderError as e:
+            return Response({'error': e.message}, status=e.status_code)
         
         # Préparer les items pour Stripe
         line_items = []
@@ -606,6 +842,12 @@ def create_payment_session(request):
         }
         if getattr(request.user, 'email', None):
             session_kwargs['customer_email'] = request.user.email
+        if hold_expires_at:
+            session_kwargs['expires_at'] = int(hold_expires_at.timestamp())
+        # Transmettre la clé à Stripe : même un nouvel essai hors de notre fenêtre ne crée pas de seconde session
+        idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+        if idempotency_key:
+            session_kwargs['idempotency_key'] = f'checkout-{request.user.id}-{idempotency_key}'
 
         # Créer la session Stripe via le sous-module explicitement importé, avec reprise si _secret manque
         try:
@@ -624,9 +866,9 @@ def create_payment_session(request):
             else:
                 raise
         
-        # Sauvegarder l'ID de session
+        # Sauvegarder l'ID de session (seul champ écrit : le balayage a pu changer le statut entre-temps)
         order.stripe_session_id = session.id
-        order.save()
+        order.save(update_fields=['stripe_session_id', 'updated_at'])
         
         return Response({
             'session_id': session.id,
@@ -654,19 +896,30 @@ def stripe_webhook(request):
     except Exception as e:
         return Response({'error': 'Unexpected error'}, status=400)
 
-    if event['type'] == 'checkout.session.completed':
+    if event['type'] in ('checkout.session.completed', 'checkout.session.expired'):
         session = event['data']['object']
         order_id = session.get('metadata', {}).get('order_id')
         
-        if order_id:
+        if order_id or session.get('id'):
             try:
-                order = Order.objects.get(id=order_id)
-                # Mettre à jour le statut de paiement et de commande
-                order.payment_status = 'PAID'
-                order.status = 'CONFIRMED'
-                order.stripe_session_id = session['id']
-                order.save()
-                
+                # Sans métadonnées, retrouver la commande par sa session Stripe (index partiel)
+                if order_id:
+                    order = Order.objects.get(id=order_id)
+                else:
+                    order = Order.objects.get(stripe_session_id=session['id'])
+                if event['type'] == 'checkout.session.completed':
+                    # Mettre à jour le statut de paiement et de commande ; le stock réservé devient une vente
+                    confirm_payment(order, session['id'])
+                else:
+                    # Session abandonnée : rendre le stock sans attendre le balayage, sauf si
+                    # une session plus récente a été créée pour la commande et peut encore être payée
+                    with transaction.atomic():
+                        locked = Order.objects.select_for_update().filter(
+                            pk=order.pk, status='PENDING', hold_expires_at__isnull=False,
+                            stripe_session_id=session['id'],
+                        ).exclude(payment_status='PAID')
+                        if locked.exists():
+                            release_holds([order.pk])
                 
             except Order.DoesNotExist:
                 pass
@@ -681,9 +934,15 @@ def stripe_webhook(request):
 @permission_classes([IsAdminOrReadOnly])
 def confirm_order(request, order_id):
     try:
-        order = Order.objects.get(id=order_id)
-        order.status = 'CONFIRMED'
-        order.save()
+        with transaction.atomic():
+            # Verrou : le balayage des réservations expirées ne peut pas annuler la commande en même temps
+            order = Order.objects.select_for_update().get(id=order_id)
+            try:
+                # Le stock réservé n'expire plus ; repris s'il avait déjà été rendu
+                settle_order(order)
+            except OrderError as e:
+                return Response({'error': e.message}, status=e.status_code)
+            order.save()
         
         # Envoyer un email de confirmation au client
         recipient = order.recipient_email or (order.user.email if order.user and order.user.email else None)
@@ -704,9 +963,12 @@ def confirm_order(request, order_id):
 @permission_classes([IsAdminOrReadOnly])
 def reject_order(request, order_id):
     try:
-        order = Order.objects.get(id=order_id)
-        order.status = 'REJECTED'
-        order.save()
+        with transaction.atomic():
+            order = Order.objects.select_for_update().get(id=order_id)
+            order.status = 'REJECTED'
+            order.save()
+            # Rendre le stock encore réservé et libérer les périodes de location
+            release_holds([order.id], status=None)
         
         # Envoyer un email de rejet au client
         recipient = order.recipient_email or (order.user.email if order.user and order.user.email else None)
@@ -810,9 +1072,74 @@ def respond_to_message(request, message_id):
 @api_view(['GET'])
 def get_reviews(request):
     """Récupérer tous les avis approuvés"""
-    reviews = Review.objects.filter(is_approved=True)
-    serializer = ReviewSerializer(reviews, many=True)
-    return Response(serializer.data)
+    def build_response():
+        reviews = Review.objects.filter(is_approved=True).select_related('user')
+        serializer = ReviewSerializer(reviews, many=True)
+        return Response(serializer.data)
+    return cached_response(request, 'reviews', REVIEW_DEPENDENCIES, build_response)
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def review_summary(request):
+    """Nombre d'avis approuvés, note moyenne et répartition par étoiles"""
+    def build_response():
+        summary = ReviewSummary.get()
+        return Response({'count': summary.count, 'average': summary.average, 'histogram': summary.histogram})
+    return cached_response(request, 'review_summary', REVIEW_DEPENDENCIES, build_response)
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def search(request):
+    """Recherche plein texte dans les produits et équipements"""
+    query = request.query_params.get('q', '').strip()
+    try:
+        limit = min(max(int(request.query_params.get('limit', 20)), 1), 50)
+    except ValueError:
+        return Response({'error': 'limit doit être un entier'}, status=status.HTTP_400_BAD_REQUEST)
+
+    if not query:
+        return Response({'query': query, 'results': []})
+
+    hits = search_catalog(query, limit)
+    product_ids = [item_id for kind, item_id, rank in hits if kind == 'product']
+    equipment_ids = [item_id for kind, item_id, rank in hits if kind == 'equipment']
+    products = Product.objects.select_related('category').prefetch_related('images').in_bulk(product_ids)
+    equipment = Equipment.objects.select_related('category').prefetch_related('images').in_bulk(equipment_ids)
+
+    context = {'request': request}
+    results = []
+    for kind, item_id, rank in hits:
+        if kind == 'product' and item_id in products:
+            item = ProductSerializer(products[item_id], context=context).data
+        elif kind == 'equipment' and item_id in equipment:
+            item = EquipmentSerializer(equipment[item_id], context=context).data
+        else:
+            continue
+        results.append({'type': kind, 'rank': rank, 'item': item})
+
+    return Response({'query': query, 'results': results})
+
+# type -> (ViewSet dont on reprend le modèle et les filtres, dépendances du cache)
+FACET_TARGETS = {
+    'product': (ProductViewSet, PRODUCT_FACET_DEPENDENCIES),
+    'equipment': (EquipmentViewSet, EQUIPMENT_FACET_DEPENDENCIES),
+}
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def catalog_facets(request):
+    """Comptes par catégorie, disponibilité et tranches de prix pour les filtres courants"""
+    kind = request.query_params.get('type', 'product')
+    if kind not in FACET_TARGETS:
+        return Response({'type': f"Valeurs possibles : {', '.join(FACET_TARGETS)}"}, status=status.HTTP_400_BAD_REQUEST)
+    viewset, dependencies = FACET_TARGETS[kind]
+
+    def build_response():
+        facets = compute_facets(viewset.queryset.model.objects.all(), request.query_params,
+                                viewset.price_field, viewset.available_filter)
+        return Response({'type': kind, **facets})
+
+    return cached_response(request, 'facets', dependencies, build_response)
 
 @api_view(['GET'])
 def get_all_reviews(request):
@@ -827,7 +1154,10 @@ def create_review(request):
     """Créer un nouvel avis"""
     serializer = ReviewSerializer(data=request.data, context={'request': request})
     if serializer.is_valid():
-        serializer.save()
+        with transaction.atomic():
+            review = serializer.save()
+            if review.is_approved:
+                ReviewSummary.record(review.rating, 1)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -835,21 +1165,25 @@ def create_review(request):
 @permission_classes([IsAdminUser])
 def manage_review(request, review_id):
     """Gérer un avis (approuver/supprimer) - Admin seulement"""
-    try:
-        review = Review.objects.get(id=review_id)
-    except Review.DoesNotExist:
-        return Response({'error': 'Avis non trouvé'}, status=status.HTTP_404_NOT_FOUND)
-    
-    if request.method == 'PUT':
-        # Approuver l'avis
-        review.is_approved = True
-        review.save()
-        serializer = ReviewSerializer(review)
-        return Response(serializer.data)
-    
-    elif request.method == 'DELETE':
+    with transaction.atomic():
+        # Ligne verrouillée : deux requêtes simultanées ne comptent pas deux fois le même avis
+        review = Review.objects.select_for_update().filter(id=review_id).first()
+        if review is None:
+            return Response({'error': 'Avis non trouvé'}, status=status.HTTP_404_NOT_FOUND)
+
+        if request.method == 'PUT':
+            # Approuver l'avis
+            if not review.is_approved:
+                review.is_approved = True
+                review.save()
+                ReviewSummary.record(review.rating, 1)
+            serializer = ReviewSerializer(review)
+            return Response(serializer.data)
+
         review.delete()
-        return Response({'message': 'Avis supprimé'}, status=status.HTTP_204_NO_CONTENT)
+        if review.is_approved:
+            ReviewSummary.record(review.rating, -1)
+    return Response({'message': 'Avis supprimé'}, status=status.HTTP_204_NO_CONTENT)
 
 @api_view(['GET'])
 def get_user_info(request):
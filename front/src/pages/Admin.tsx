@@ -73,6 +73,15 @@ import toast from 'react-hot-toast';
 import ImageUploadSection from '../components/ImageUploadSection';
 import ImageManagementSection from '../components/ImageManagementSection';
 
+const ORDER_STATUS_LABELS: Record<Order['status'], string> = {
+  PENDING: 'En attente',
+  CONFIRMED: 'Confirmées',
+  SHIPPED: 'Expédiées',
+  DELIVERED: 'Livrées',
+  REJECTED: 'Rejetées',
+  CANCELLED: 'Annulées'
+};
+
 interface TabPanelProps {
   children?: React.ReactNode;
   index: number;
@@ -177,9 +186,11 @@ const Admin: React.FC = () => {
   });
 
   // Fetch orders and contact messages
-  const { data: ordersResponse } = useQuery({
-    queryKey: ['orders'],
-    queryFn: orderService.getAll
+  const [orderStatus, setOrderStatus] = useState<Order['status'] | undefined>(undefined);
+  const [orderPage, setOrderPage] = useState(1);
+  const { data: orderQueue } = useQuery({
+    queryKey: ['orders', 'queue', orderStatus, orderPage],
+    queryFn: () => orderService.getQueue({ status: orderStatus, page: orderPage })
   });
 
   const { data: contactMessagesResponse } = useQuery({
@@ -192,7 +203,8 @@ const Admin: React.FC = () => {
   const equipmentCategories = equipmentCategoriesResponse?.results || [];
   const products = Array.isArray(productsResponse) ? productsResponse : (productsResponse as any)?.results || [];
   const equipment = Array.isArray(equipmentResponse) ? equipmentResponse : (equipmentResponse as any)?.results || [];
-  const orders = Array.isArray(ordersResponse) ? ordersResponse : (ordersResponse as any)?.results || [];
+  const orders = orderQueue?.results || [];
+  const statusCounts = orderQueue?.status_counts;
   const contactMessages = Array.isArray(contactMessagesResponse) ? contactMessagesResponse : (contactMessagesResponse as any)?.results || [];
 
   // Mutation pour répondre à un message
@@ -1125,8 +1137,23 @@ const Admin: React.FC = () => {
             <Card>
               <CardContent>
                 <Typography variant="h6" sx={{ fontWeight: 600, mb: 2 }}>
-                  Commandes ({orders.length})
+                  Commandes ({orderQueue?.count ?? 0})
                 </Typography>
+                <Box sx={{ display: 'flex', flexWrap: 'wrap', gap: 1, mb: 2 }}>
+                  <Chip
+                    label={`Toutes (${statusCounts ? Object.values(statusCounts).reduce((a, b) => a + b, 0) : 0})`}
+                    color={orderStatus ? 'default' : 'primary'}
+                    onClick={() => { setOrderStatus(undefined); setOrderPage(1); }}
+                  />
+                  {(Object.keys(ORDER_STATUS_LABELS) as Order['status'][]).map((value) => (
+                    <Chip
+                      key={value}
+                      label={`${ORDER_STATUS_LABELS[value]} (${statusCounts?.[value] ?? 0})`}
+                      color={orderStatus === value ? 'primary' : 'default'}
+                      onClick={() => { setOrderStatus(value); setOrderPage(1); }}
+                    />
+                  ))}
+                </Box>
                 {orders.length === 0 ? (
                   <Typography variant="body2" color="text.secondary" sx={{ textAlign: 'center', py: 3 }}>
                     Aucune commande trouvée
@@ -1209,6 +1236,16 @@ const Admin: React.FC = () => {
                     ))}
                   </List>
                 )}
+                {(orderQueue?.previous || orderQueue?.next) && (
+                  <Box sx={{ display: 'flex', justifyContent: 'space-between', mt: 2 }}>
+                    <Button disabled={!orderQueue?.previous} onClick={() => setOrderPage(orderPage - 1)}>
+                      Précédent
+                    </Button>
+                    <Button disabled={!orderQueue?.next} onClick={() => setOrderPage(orderPage + 1)}>
+                      Suivant
+                    </Button>
+                  </Box>
+                )}
               </CardContent>
             </Card>
           </Grid>
@@ -1,7 +1,7 @@
 import axios, { AxiosError, AxiosResponse, InternalAxiosRequestConfig } from 'axios';
 import {
   Product, Equipment, ProductCategory, EquipmentCategory,
-  Order, ContactMessage, User, CartItem
+  Order, OrderQueue, OrderQueueFilters, ContactMessage, User, CartItem
 } from '../types';
 
 // Configuration de base
@@ -210,6 +210,12 @@ export const orderService = {
     return response.data;
   },
 
+  // File des commandes (admin) : filtres, pagination et compteurs par statut côté serveur
+  getQueue: async (filters: OrderQueueFilters = {}): Promise<OrderQueue> => {
+    const response = await api.get('/orders/queue/', { params: filters });
+    return response.data;
+  },
+
   getById: async (id: number): Promise<Order> => {
     const response = await api.get(`/orders/${id}/`);
     return response.data;
@@ -29,6 +29,7 @@ export interface Equipment {
   category: EquipmentCategory;
   images: Image[];
   available: boolean;
+  units?: number;
   created_at: string;
 }
 
@@ -45,6 +46,7 @@ export interface OrderItem {
   equipment?: Equipment;
   quantity: number;
   rental_days: number;
+  rental_start?: string | null;
   price: number;
 }
 
@@ -68,6 +70,8 @@ export interface Order {
   recipient_phone: string;
   stripe_session_id: string;
   stripe_payment_intent_id: string;
+  // Date limite de paiement avant annulation de la commande
+  hold_expires_at?: string | null;
 }
 
 export interface ContactMessage {
@@ -121,6 +125,23 @@ export interface CartContextType {
   clearCart: () => void;
 }
 
+export interface OrderQueueFilters {
+  status?: Order['status'];
+  payment_status?: Order['payment_status'];
+  created_after?: string;
+  created_before?: string;
+  requires_delivery?: boolean;
+  page?: number;
+}
+
+export interface OrderQueue {
+  count: number;
+  next: string | null;
+  previous: string | null;
+  results: Order[];
+  status_counts: Record<Order['status'], number>;
+}
+
 export interface ApiResponse<T> {
   data?: T;
   error?: string;